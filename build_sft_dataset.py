@@ -7,11 +7,21 @@ author:zhaoshe
 """
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Any, Dict, Literal, Optional
 from collections import defaultdict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import json
 from tqdm import tqdm
 import argparse
+from llm_toolkit import PromptTable, prompt_table_path, iter_jsonl, JsonlWriter
+from llm_toolkit.jsonl_io import compression_suffix
+from llm_toolkit.build_manifest import BuildManifest, walk_images, relative_id, in_dataset
+from llm_toolkit.dedup import BKTree, load_dedup_map, dedup_map_path
+from llm_toolkit.image_utils import inspect_images, build_mosaic
+from llm_toolkit.frame_sampling import natural_sort_key, sample_uniform, sample_by_change
+from llm_toolkit.payload_shards import pack_dataset
+from llm_toolkit.dataset_shards import write_dataset_shards
 
 def load_prompt(pe_json_path: str='./dataset/pe.json', idx: int=0) -> str:
     """根据输入的idx，加载相应的prompt
@@ -29,138 +39,352 @@ def load_prompt(pe_json_path: str='./dataset/pe.json', idx: int=0) -> str:
     prompt = f"prompt{idx}"
     return data[prompt]['prompt_text']
 
+def build_human_turn(prompt: str, sft_dataset_path: str, prompt_id: Optional[str] = None) -> Dict[str, Any]:
+    """构造human对话; 指定prompt_id时使用紧凑格式, 只保存提示词引用, 提示词写入输出文件旁的引用表
+
+    Args:
+        prompt (str): 对应的提示词
+        sft_dataset_path (str): 保存的json文件路径
+        prompt_id (Optional[str]): 提示词编号(如'prompt2'), 为None时使用标准格式
+
+    Returns:
+        Dict[str, Any]: human对话
+    """
+    if prompt_id is None:
+        return {'from': 'human', 'value': prompt}
+
+    table_path = prompt_table_path(sft_dataset_path)
+    prompt_table = PromptTable.load(table_path)
+    prompt_ref = prompt_table.add(prompt_id, prompt)
+    prompt_table.save(table_path)
+    return {'from': 'human', 'prompt_ref': prompt_ref}
+
+def replace_rows(sft_dataset_path: str, rows: Dict[str, Dict[str, Any]]) -> None:
+    """将数据集中指定 id 的数据替换为新的数据(流式重写后原子替换原文件)
+
+    Args:
+        sft_dataset_path (str): 数据集文件路径
+        rows (Dict[str, Dict[str, Any]]): id -> 新的数据
+    """
+    tmp_path = sft_dataset_path + '.tmp' + compression_suffix(sft_dataset_path)
+    with JsonlWriter(tmp_path) as writer:
+        for record in iter_jsonl(sft_dataset_path):
+            writer.write(rows.get(record.get('id'), record))
+        writer.flush(fsync=True)
+    os.replace(tmp_path, sft_dataset_path)
+    print(f"已更新 {len(rows)} 条图像内容发生变化的数据")
+
 def build_item_single_image(
     image_dir: str,
     prompt: str,
-    sft_dataset_path: str
+    sft_dataset_path: str,
+    prompt_id: Optional[str] = None,
+    recursive: bool = False,
+    validate: bool = True,
+    workers: Optional[int] = None,
+    batch_size: int = 1000,
+    dedup_threshold: Optional[int] = None
 ) -> None:
     """为图像和prompt生成相应的json数据,单图模式
 
+    借助数据集旁的构建清单(.manifest.jsonl)增量构建: 只处理新增或内容发生变化的图像, 中途退出后可以继续构建。
+    图像在写入前由进程池并行校验, 损坏或截断的图像会被跳过, 合法图像的宽高、字节数与格式记录在 image_meta 中。
+    指定 dedup_threshold 时, 与已写入的图像感知哈希距离不超过阈值的近重复帧不会写入数据集,
+    其对应关系记录在 .dedup.jsonl 中, 可用 propagate_answers.py 将代表帧的回答复制给它们。
+
     Args:
         image_dir (str): 图像文件夹
         prompt (str): 对应的提示词
         sft_dataset_path(str): 保存的json文件路径
+        prompt_id (Optional[str]): 提示词编号, 指定时输出紧凑格式(提示词按引用保存)
+        recursive (bool): 是否递归遍历子文件夹, 此时 id 为去掉扩展名的相对路径(如 'video1/frame0001')
+        validate (bool): 是否校验图像并记录 image_meta
+        workers (Optional[int]): 校验图像的进程数, 默认为CPU核数
+        batch_size (int): 每批校验并写入的图像数, 每批写入后保存一次进度
+        dedup_threshold (Optional[int]): 近重复的感知哈希汉明距离阈值(64 位哈希, 建议 4~10), 为None时不去重;
+            去重需要解码图像, 因此会同时校验图像
     """
-    image_suffix = ('.jpg', '.jpeg', '.png', '.bmp')
+    dedup = dedup_threshold is not None
+    validate = validate or dedup
+    manifest = BuildManifest.for_dataset(sft_dataset_path)
+    human_turn = build_human_turn(prompt, sft_dataset_path, prompt_id)
+    changed_rows = {}
+    seen_paths = []
+    stats = defaultdict(int)
+    executor = ProcessPoolExecutor(max_workers=workers) if validate and workers != 1 else None
 
-    # 读取已存在的id
-    existing_ids = set()
-    if os.path.exists(sft_dataset_path):
-        with open(sft_dataset_path, 'r', encoding='utf-8') as f_in:
-            for line in f_in:
-                try:
-                    data = json.loads(line.strip())
-                    existing_ids.add(data['id'])
-                except (json.JSONDecodeError, KeyError):
+    # 已写入数据集的图像的感知哈希, 用于查找近重复帧
+    if dedup:
+        bk_tree = BKTree()
+        for entry in manifest.entries.values():
+            if entry.get('phash') and in_dataset(entry):
+                bk_tree.add(int(entry['phash'], 16), entry['id'])
+        dedup_map = load_dedup_map(dedup_map_path(sft_dataset_path))
+        dedup_writer = JsonlWriter(dedup_map_path(sft_dataset_path), 'a')
+
+    def write_batch(batch, f_out):
+        """校验一批新增或变化的图像, 写入其中合法的(且不是近重复帧的)图像"""
+        batch.sort(key=lambda pair: natural_sort_key(pair[0]['rel_path']))    # 同一段视频的相邻帧依次处理, 以靠前的帧为代表
+        if validate:
+            metas = inspect_images([item['path'] for item, _ in batch], executor, compute_phash=dedup)
+        else:
+            metas = [None] * len(batch)
+        for (item, status), meta in zip(batch, metas):
+            if meta and 'error' in meta:
+                stats['invalid'] += 1
+                print(f"跳过无法使用的图像 {item['rel_path']}: {meta['error']}")
+                manifest.record(item, invalid=True)
+                continue
+
+            if dedup:
+                item['phash'] = meta.pop('phash')
+                hash_value = int(item['phash'], 16)
+                match = bk_tree.nearest(hash_value, dedup_threshold) if status == 'new' else None
+                if match:
+                    distance, representative = match
+                    stats['duplicate'] += 1
+                    dedup_writer.write({'id': item['id'], 'image': item['path'], 'representative': representative, 'distance': distance})
+                    manifest.record(item, duplicate_of=representative)
                     continue
-    
+                bk_tree.add(hash_value, item['id'])
+                if item['id'] in dedup_map:
+                    # 之前被去重的帧发生变化后不再是近重复帧, 从映射中移除
+                    dedup_writer.write({'id': item['id'], 'representative': None})
+
+            new_entry = {
+                'id': item['id'],
+                'image': [item['path']],
+                'conversation': [
+                    human_turn,
+                    {'from': 'assistant', 'value': ''}
+                ]
+            }
+            if meta:
+                new_entry['image_meta'] = [meta]
+
+            stats[status] += 1
+            if status == 'changed':
+                changed_rows[item['id']] = (new_entry, item)
+                continue
+            f_out.write(new_entry)
+            manifest.record(item)
+        if dedup:
+            dedup_writer.flush(fsync=True)
+        manifest.checkpoint(f_out)
+
     try:
-        with open(sft_dataset_path, 'a', encoding='utf-8') as f_out:
-            for image_name in tqdm(os.listdir(image_dir), desc="Processing images"):
+        with JsonlWriter(sft_dataset_path, 'a') as f_out:
+            batch = []
+            for item in tqdm(walk_images(image_dir, recursive=recursive), desc="Processing images"):
                 try:
-                    if not image_name.lower().endswith(image_suffix):
+                    seen_paths.append(item['rel_path'])
+                    item['id'] = relative_id(item['rel_path'])
+                    status = manifest.check(item)
+                    if status == 'unchanged':
+                        stats['unchanged'] += 1
                         continue
-                    
-                    # 检查id是否已存在
-                    if image_name in existing_ids:
-                        print(f"跳过已存在的图像: {image_name}")
-                        continue
-                    
-                    image_path = Path(image_dir) / image_name
-                    absolute_image_path = image_path.absolute().as_posix()      # 转化为绝对路径，再as_posix()强制转化为/连接
-                    new_entry = {
-                        'id': image_path.stem,
-                        'image': [absolute_image_path],
-                        'conversation': [
-                            {'from': 'human', 'value': prompt},
-                            {'from': 'assistant', 'value': ''}
-                        ]
-                    }
-
-                    f_out.write(json.dumps(new_entry, ensure_ascii=False) + '\n')
+                    batch.append((item, status))
+                    if len(batch) >= batch_size:
+                        write_batch(batch, f_out)
+                        batch = []
                 except Exception as e:
-                    print(f"处理图像{image_name}时发生错误 {e}, 已跳过")
+                    print(f"处理图像{item['rel_path']}时发生错误 {e}, 已跳过")
+            write_batch(batch, f_out)
+
+        # 图像内容发生变化的数据在原位置替换, 替换完成后才记入清单
+        if changed_rows:
+            replace_rows(sft_dataset_path, {sample_id: row for sample_id, (row, _) in changed_rows.items()})
+            for _, item in changed_rows.values():
+                manifest.record(item)
+        removed = manifest.forget_missing(seen_paths)
+        if removed:
+            print(f"警告: {len(removed)} 个图像已被删除, 其数据仍保留在数据集中")
+        manifest.close()
+        print(f"新增 {stats['new']} 张, 更新 {stats['changed']} 张, 跳过未变化的 {stats['unchanged']} 张, 无法使用 {stats['invalid']} 张")
+        if dedup:
+            print(f"去重: {stats['duplicate']} 张近重复帧未写入数据集, 对应关系见 {dedup_map_path(sft_dataset_path)}")
 
     except Exception as e:
         print(f"写入 JSONL 时出错: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if dedup:
+            dedup_writer.close()
 
 def build_item_multi_image(
     image_dir: str,
     prompt: str,
     sft_dataset_path: str,
-    multi_mode: Literal['prefix', 'suffix'] = 'prefix'
+    multi_mode: Literal['prefix', 'suffix'] = 'prefix',
+    prompt_id: Optional[str] = None,
+    recursive: bool = False,
+    validate: bool = True,
+    workers: Optional[int] = None,
+    max_frames: Optional[int] = None,
+    sampling: Literal['uniform', 'change'] = 'uniform',
+    mosaic_dir: Optional[str] = None,
+    mosaic_tile_size: int = 512
 ) -> None:
     """根据图像和prompt生成相应的jsonl数据,多图模式,需保证同一组输入的前缀或者后缀相同。
 
+    借助构建清单增量构建: 只有新增、变化或删除了图像的组会被重新生成。
+    需要生成的组中的图像由进程池并行校验, 损坏或截断的图像会从组中剔除。
+    组内的帧按帧号自然排序; 帧数超过 max_frames 时按时间均匀或按画面变化量采样;
+    指定 mosaic_dir 时, 一组的帧拼接为一张带序号的网格图, 只占用一张图像的输入。
+
     Args:
         image_dir (str): 图像文件夹
         prompt (str): 对应的提示词
         sft_dataset_path (str): 保存的json文件路径
         multi_mode (Literal['prefix', 'suffix'], optional): 若同一组图像前缀相同则设置为prefix, 后缀相同设置为suffix.
+        prompt_id (Optional[str]): 提示词编号, 指定时输出紧凑格式(提示词按引用保存)
+        recursive (bool): 是否递归遍历子文件夹, 只有同一文件夹中的图像会被分为一组, 组 id 带有相对文件夹路径
+        validate (bool): 是否校验图像并记录 image_meta
+        workers (Optional[int]): 校验图像的进程数, 默认为CPU核数
+        max_frames (Optional[int]): 每组最多保留的帧数, 为None时保留全部帧
+        sampling (Literal['uniform', 'change']): 采样方式, uniform 按时间均匀采样, change 按画面变化量(感知哈希距离)采样
+        mosaic_dir (Optional[str]): 拼图的保存文件夹, 为None时不拼图
+        mosaic_tile_size (int): 拼图中每一格的边长(像素)
     """
+    if multi_mode not in ('prefix', 'suffix'):
+        raise ValueError(f"不支持的前后缀格式！")
+    if sampling not in ('uniform', 'change'):
+        raise ValueError(f"不支持的采样方式: {sampling}")
+
+    # 按画面变化量采样需要每一帧的感知哈希, 因此会同时校验图像
+    change_sampling = max_frames is not None and sampling == 'change'
+    validate = validate or change_sampling
 
     groups = defaultdict(list)
-    image_suffix = ('.jpg', '.jpeg', '.png', '.bmp')
-    
-    # 读取已存在的id
-    existing_ids = set()
-    if os.path.exists(sft_dataset_path):
-        with open(sft_dataset_path, 'r', encoding='utf-8') as f_in:
-            for line in f_in:
-                try:
-                    data = json.loads(line.strip())
-                    existing_ids.add(data['id'])
-                except (json.JSONDecodeError, KeyError):
-                    continue
+    manifest = BuildManifest.for_dataset(sft_dataset_path)
+    existing_ids = manifest.ids
+
+    human_turn = build_human_turn(prompt, sft_dataset_path, prompt_id)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
         
     try:
-        with open(sft_dataset_path, 'a', encoding='utf-8') as f_out:
-            # 对图像根据前缀/后缀进行分组，后续为每组图像生成唯一的json对象
-            for image_name in tqdm(os.listdir(image_dir), desc = "Processing images:"):
+        # 对图像根据前缀/后缀进行分组，后续为每组图像生成唯一的json对象
+        dirty_groups = {}               # 需要(重新)生成的组, 保持遍历顺序
+        for item in tqdm(walk_images(image_dir, recursive=recursive), desc = "Processing images:"):
+            try:
+                rel_dir, image_name = os.path.split(item['rel_path'])
+                part = Path(image_name).stem.split('_')
+                pre_suffix = part[0] if multi_mode == 'prefix' else part[-1]
+                item['id'] = f"{rel_dir}/{pre_suffix}" if rel_dir else pre_suffix
+                groups[item['id']].append(item)
+                if manifest.check(item) != 'unchanged':
+                    dirty_groups[item['id']] = True
+            except Exception as e:
+                print(f"处理图像{item['rel_path']}时发生错误 {e}, 已跳过")
+
+        # 删除了图像的组同样需要重新生成
+        removed = manifest.forget_missing(item['rel_path'] for items in groups.values() for item in items)
+        dirty_groups.update((entry['id'], True) for entry in removed if entry['id'] in groups)
+
+        # 组内按帧号自然排序(frame2 在 frame10 之前)
+        for pre_suffix in dirty_groups:
+            groups[pre_suffix].sort(key=lambda item: natural_sort_key(item['rel_path']))
+
+        # 并行校验需要生成的组中的图像
+        metas = {}
+        if validate:
+            paths = [item['path'] for pre_suffix in dirty_groups for item in groups[pre_suffix]]
+            metas = dict(zip(paths, inspect_images(paths, executor, compute_phash=change_sampling)))
+
+        # 剔除无法使用的图像, 并对帧数过多的组采样
+        frames = {}
+        for pre_suffix in dirty_groups:
+            valid_items = []
+            for item in groups[pre_suffix]:
+                error = metas.get(item['path'], {}).get('error')
+                if error:
+                    print(f"跳过无法使用的图像 {item['rel_path']}: {error}")
+                    manifest.record(item, invalid=True)
+                else:
+                    valid_items.append(item)
+            groups[pre_suffix] = valid_items
+            if not valid_items:
+                continue
+
+            if max_frames is not None and len(valid_items) > max_frames:
+                if change_sampling:
+                    hashes = [metas[item['path']].get('phash') for item in valid_items]
+                    indices = sample_by_change(hashes, max_frames)
+                else:
+                    indices = sample_uniform(len(valid_items), max_frames)
+                frames[pre_suffix] = [valid_items[idx] for idx in indices]
+            else:
+                frames[pre_suffix] = valid_items
+
+        # 并行生成拼图
+        mosaics = {}
+        if mosaic_dir:
+            group_ids = list(frames)
+            frame_paths = [[item['path'] for item in frames[pre_suffix]] for pre_suffix in group_ids]
+            mosaic_paths = [Path(mosaic_dir, f"{pre_suffix}.jpg").absolute().as_posix() for pre_suffix in group_ids]
+            build = partial(build_mosaic, tile_size=mosaic_tile_size)
+            futures = [executor.submit(build, paths, path) for paths, path in zip(frame_paths, mosaic_paths)] if executor else None
+            for idx, (pre_suffix, mosaic_path) in enumerate(zip(group_ids, mosaic_paths)):
+                # 单个组的拼图失败(例如跳过校验时遇到无法读取的帧)只跳过该组, 该组不记入清单, 下次构建时重试
                 try:
-                    if not image_name.lower().endswith(image_suffix):
-                        continue
-                
-                    image_path = Path(image_dir) / image_name
-                    part = image_path.stem.split('_')
-                    absolute_image_path = image_path.absolute().as_posix()
-                    
-                    if multi_mode == 'prefix':
-                        prefix = part[0]
-                        groups[prefix].append(absolute_image_path)
-                        
-                    elif multi_mode == 'suffix':
-                        suffix = part[-1]
-                        groups[suffix].append(absolute_image_path)
-                    else:
-                        raise ValueError(f"不支持的前后缀格式！")
-                    
+                    mosaic_meta = futures[idx].result() if futures else build(frame_paths[idx], mosaic_path)
                 except Exception as e:
-                    print(f"处理图像{image_name}时发生错误 {e}, 已跳过")
-            
-            for pre_suffix, absolute_image_path in groups.items():
+                    print(f"生成前/后缀为 {pre_suffix} 的拼图时发生错误 {e}, 已跳过该组图像")
+                    del frames[pre_suffix]
+                    continue
+                mosaics[pre_suffix] = (mosaic_path, mosaic_meta)
+
+        changed_rows = {}
+        written = 0
+        with JsonlWriter(sft_dataset_path, 'a') as f_out:
+            for pre_suffix, items in frames.items():
                 try:
-                    # 检查id是否已经存在
-                    if pre_suffix in existing_ids:
-                        print(f"跳过已存在的图像组: {pre_suffix}")
-                        continue    
-                                    
                     new_entry = {
                         'id': pre_suffix,
-                        'image': absolute_image_path,
+                        'image': [item['path'] for item in items],
                         'conversation': [
-                            {'from': 'human', 'value': prompt},
+                            human_turn,
                             {'from': 'assistant', 'value': ''}
                         ]
                     }
-                    
-                    f_out.write(json.dumps(new_entry, ensure_ascii=False) + '\n')
+                    if validate:
+                        new_entry['image_meta'] = [
+                            {key: value for key, value in metas[item['path']].items() if key != 'phash'} for item in items
+                        ]
+                    if pre_suffix in mosaics:
+                        # 拼图模式: 只发送拼图, 原始帧按拼图中的序号顺序保存在 frames 中
+                        mosaic_path, mosaic_meta = mosaics[pre_suffix]
+                        new_entry['frames'] = new_entry['image']
+                        new_entry['image'] = [mosaic_path]
+                        new_entry['image_meta'] = [mosaic_meta]
+
+                    if pre_suffix in existing_ids:
+                        changed_rows[pre_suffix] = new_entry
+                        continue
+                    f_out.write(new_entry)
+                    written += 1
+                    for item in groups[pre_suffix]:
+                        manifest.record(item)
                     
                 except Exception as e:
                     print(f"保存前/后缀为 {pre_suffix} 的图像组时发生错误 {e}, 已跳过该组图像")  
+            manifest.checkpoint(f_out)
+
+        # 发生变化的组在原位置替换, 替换完成后才记入清单
+        if changed_rows:
+            replace_rows(sft_dataset_path, changed_rows)
+            for pre_suffix in changed_rows:
+                for item in groups[pre_suffix]:
+                    manifest.record(item)
+        manifest.close()
+        print(f"共 {len(groups)} 组图像, 新增 {written} 组, 更新 {len(changed_rows)} 组")
                 
     except Exception as e:
         print(f"写入 JSONL 时出错: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
 
 def main():
@@ -171,20 +395,45 @@ def main():
     parser.add_argument('--prompt_idx', type=int, default=0, help='使用的prompt索引')
     parser.add_argument('--mode', type=str, choices=['single', 'multi'], default='single', help='模式选择: single(单图) 或 multi(多图)')
     parser.add_argument('--multi_mode', type=str, choices=['prefix', 'suffix'], default='prefix', help='多图模式下的分组方式: prefix(前缀) 或 suffix(后缀)')
+    parser.add_argument('--compact', action='store_true', help='输出紧凑格式: 每行只保存提示词引用, 提示词保存在输出文件旁的 .prompts.json 中')
+    parser.add_argument('--recursive', action='store_true', help='递归遍历子文件夹, id 为去掉扩展名的相对路径')
+    parser.add_argument('--skip_validation', action='store_true', help='跳过图像校验(不记录 image_meta)')
+    parser.add_argument('--workers', type=int, default=None, help='校验图像的进程数, 默认为CPU核数')
+    parser.add_argument('--max_frames', type=int, default=None, help='多图模式下每组最多保留的帧数, 默认保留全部帧')
+    parser.add_argument('--sampling', type=str, choices=['uniform', 'change'], default='uniform', help='帧数过多时的采样方式: uniform(按时间均匀) 或 change(按画面变化量)')
+    parser.add_argument('--mosaic_dir', type=str, default=None, help='多图模式下将每组的帧拼接为一张带序号的网格图, 拼图保存在该文件夹')
+    parser.add_argument('--mosaic_tile_size', type=int, default=512, help='拼图中每一格的边长(像素), 默认为512')
+    parser.add_argument('--dedup_threshold', type=int, default=None, help='单图模式下按感知哈希去除近重复帧的汉明距离阈值(建议 4~10), 默认不去重')
+    parser.add_argument('--num_shards', type=int, default=None, help='构建完成后按 id 哈希将数据集拆分为 N 个分片(附带 .shards.json 分片清单), 只重写发生变化的分片')
+    parser.add_argument('--shard_dir', type=str, default=None, help='构建完成后将数据与图像字节打包为负载分片, 保存在该文件夹(可直接作为 call_llm_api.py 的输入)')
+    parser.add_argument('--shard_size_mb', type=int, default=256, help='单个负载分片的目标大小(MB), 默认为256')
     
     args = parser.parse_args()
     
     # 加载提示词
     prompt = load_prompt(pe_json_path=args.pe_json_path, idx=args.prompt_idx)
+    prompt_id = f"prompt{args.prompt_idx}" if args.compact else None
     
     # 根据模式调用相应的函数
     if args.mode == 'single':
-        build_item_single_image(args.image_dir, prompt, args.output_file)
+        build_item_single_image(args.image_dir, prompt, args.output_file, prompt_id=prompt_id, recursive=args.recursive,
+                                validate=not args.skip_validation, workers=args.workers, dedup_threshold=args.dedup_threshold)
     elif args.mode == 'multi':
-        build_item_multi_image(args.image_dir, prompt, args.output_file, mode=args.multi_mode)
+        build_item_multi_image(args.image_dir, prompt, args.output_file, multi_mode=args.multi_mode, prompt_id=prompt_id,
+                               recursive=args.recursive, validate=not args.skip_validation, workers=args.workers,
+                               max_frames=args.max_frames, sampling=args.sampling,
+                               mosaic_dir=args.mosaic_dir, mosaic_tile_size=args.mosaic_tile_size)
     else:
         raise ValueError(f"不支持的模式: {args.mode}")
 
+    if args.num_shards:
+        manifest = write_dataset_shards(args.output_file, args.num_shards)
+        print(f"✅ 已拆分为 {manifest['num_shards']} 个分片, 本次重写 {len(manifest['rewritten'])} 个分片")
+
+    if args.shard_dir:
+        count = pack_dataset(args.output_file, args.shard_dir, args.shard_size_mb)
+        print(f"✅ 已将 {count} 条新增或变化的数据打包至 {args.shard_dir}")
+
 if __name__ == "__main__":
     # 通过命令行调用(不建议)
     # main()
@@ -193,7 +442,7 @@ if __name__ == "__main__":
     prompt = load_prompt(pe_json_path='./example/pe.json', idx=2)       # 从pe.json中加载相应的prompt
     output_file = './example/sft_dataset_single1.jsonl'          # 输出文件的路径 
     
-    # 输入单张图像，生成sft格式数据
+    # 输入单张图像，生成sft格式数据(传入prompt_id='prompt2'可生成紧凑格式)
     build_item_single_image(image_dir, prompt, output_file)
    
     # 输入多张图像，生成sft格式数据 
@@ -7,15 +7,21 @@
 author:zhaoshe
 """
 
+import io
 import os
-import json
+import re
+import time
 import base64
 import asyncio
 from tqdm import tqdm
 import argparse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
 from openai import AsyncOpenAI, APIError
-from llm_toolkit import APIConfigManager  
+from llm_toolkit import APIConfigManager, TokenBudget, PromptTable, prompt_table_path, compact_record
+from llm_toolkit import iter_jsonl, read_result_ids, open_result_writer
+from llm_toolkit.image_utils import needs_tiling, crop_tiles_to_base64, sniff_format, MIME_TYPES
+from llm_toolkit.payload_shards import ShardReader, is_shard_dir
 
 # 如果采用openai等外网官方网站作为base_url，需要设置下代理的映射端口
 # os.environ['HTTP_PROXY'] = 'http://127.0.0.1:xxxx'
@@ -25,6 +31,16 @@ from llm_toolkit import APIConfigManager
 # 设置在通过该网址访问时不使用任何代理，否则在开启vpn通过该网站调用api会出错
 os.environ['NO_PROXY'] = 'api.agicto.cn'
 
+# 合并请求(coalesce)时，要求模型按照【回答k】的格式逐一作答，便于拆分回各个任务
+COALESCE_ANSWER_PATTERN = re.compile(r'^\s*【回答(\d+)】[ \t]*', re.MULTILINE)
+
+# 分块推理的默认参数，可在 config/api_config.yaml 的 model_settings 中按模型覆盖
+DEFAULT_TILING = {
+    'tile_size': 1536,      # 分块边长(像素)
+    'overlap': 128,         # 相邻分块的重叠像素数
+    'aggregate': True,      # 是否额外调用一次模型汇总各分块的回答
+}
+
 def initialize_client(api_key: str, base_url: str) -> AsyncOpenAI:
     if not api_key:
         raise ValueError("API KEY为空!")
@@ -34,34 +50,47 @@ def initialize_client(api_key: str, base_url: str) -> AsyncOpenAI:
         base_url = base_url,
     )
 
-def encode_image_to_base64(image_path: str) -> str:
+def read_image_bytes(image_path: str, shards: Optional[ShardReader] = None):
+    """读取图像字节: 图像在负载分片 shards 中时直接返回分片中的 memoryview(零拷贝), 否则读取图像文件"""
+    if shards is not None:
+        data = shards.image(image_path)
+        if data is not None:
+            return data
+    with open(image_path, 'rb') as image_file:
+        return image_file.read()
+
+def open_image_source(image_path: str, shards: Optional[ShardReader] = None):
+    """返回可以交给 Pillow 打开的图像来源: 负载分片 shards 中的图像包装为 BytesIO, 否则为文件路径"""
+    if shards is not None:
+        data = shards.image(image_path)
+        if data is not None:
+            return io.BytesIO(data)
+    return image_path
+
+def encode_image_to_base64(image_path: str, shards: Optional[ShardReader] = None) -> str:
     """读取图像文件并编码为base64格式
 
     Args:
         image_path (str): 图像文件的路径
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
 
     Returns:
         str: "data:jpeg;base64,{base64_string}格式的字符串
     """
-    with open(image_path, 'rb') as image_file:
-        binary_data = image_file.read()
-        base64_string = base64.b64encode(binary_data).decode('utf-8')
-        
-        mime_type = 'image/jpeg'
-        if image_path.lower().endswith('.png'):
-            mime_type = 'image/png'
-        elif image_path.lower().endswith('.bmp'):
-            mime_type = 'image/bmp'
-        elif image_path.lower().endswith('.webp'):
-            mime_type = 'image/webp'            
+    binary_data = read_image_bytes(image_path, shards)
+    base64_string = base64.b64encode(binary_data).decode('utf-8')
+    
+    # MIME 类型按文件头的魔数判断, 扩展名与实际格式不符时也能正确声明
+    mime_type = MIME_TYPES.get(sniff_format(bytes(binary_data[:12])), 'image/jpeg')
             
     return f'data:{mime_type};base64,{base64_string}'
 
-def build_send_message(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
+def build_send_message(sample: Dict[str, Any], shards: Optional[ShardReader] = None) -> List[Dict[str, Any]]:
     """根据sft.jsonl中的每条json数据，构造输入给api的数据
 
     Args:
         sample (Dict[str, Any]): 单个json数据
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
 
     Returns:
         List[Dict[str, Any]]: 输入给模型的数据
@@ -81,7 +110,7 @@ def build_send_message(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
         if idx < len(image_paths):
             try:
                 image_path = image_paths[idx]
-                base64_image = encode_image_to_base64(image_path)
+                base64_image = encode_image_to_base64(image_path, shards)
                 content.append({
                     'type': 'image_url',
                     'image_url': {'url': base64_image}
@@ -99,11 +128,57 @@ def build_send_message(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
     return message
 
 
+def build_result_meta(model: str, latency: float, response: Any = None, **extra) -> Dict[str, Any]:
+    """记录单次调用的元数据(模型、耗时、结束原因、token用量), 写入结果的'meta'字段便于统计分析
+
+    Args:
+        model (str): 模型名称
+        latency (float): 调用耗时(秒)
+        response (Any): API的响应, 为None时不记录结束原因与token用量
+        **extra: 其他需要记录的字段
+
+    Returns:
+        Dict[str, Any]: 元数据
+    """
+    meta = {'model': model, 'latency': round(latency, 3)}
+    if response is not None:
+        if response.choices:
+            meta['finish_reason'] = response.choices[0].finish_reason
+        usage = getattr(response, 'usage', None)
+        if usage:
+            meta['usage'] = {
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens,
+                'total_tokens': usage.total_tokens
+            }
+    meta.update(extra)
+    return meta
+
+
+def is_error_result(sample: Dict[str, Any]) -> bool:
+    """判断一条结果数据是否为调用失败的数据(回复为空或以'ERROR'开头)
+
+    Args:
+        sample (Dict[str, Any]): 单个结果数据
+
+    Returns:
+        bool: 调用失败或回复缺失时返回True
+    """
+    try:
+        answer = sample['conversation'][1]['value']
+    except (KeyError, IndexError, TypeError):
+        return True
+    return not isinstance(answer, str) or not answer or answer.startswith('ERROR')
+
+
 async def process_single_task(
     client: AsyncOpenAI,
     sample: Dict[str, Any],
     model: str,
-    semaphore: asyncio.Semaphore
+    semaphore: asyncio.Semaphore,
+    token_budget: Optional[TokenBudget] = None,
+    max_tokens_param: str = 'max_tokens',
+    shards: Optional[ShardReader] = None
 ) -> Dict[str, Any]:
     """提交单个API调用的协程函数, 当调用失败的时候会自动保存'ERROR',
     后续处理的时候可以通过判断sample['conversation'][1]['value'] == 'ERROR'来剔除调用失败的数据
@@ -113,21 +188,46 @@ async def process_single_task(
         sample (Dict[str, Any]): 待处理的单个样本（任务）
         model (str): 调用API的名称（调用模型的名称）
         semaphore(asyncio.Semaphore): 接收信号量
+        token_budget (Optional[TokenBudget]): 输出长度预算, 为None时不限制max_tokens
+        max_tokens_param (str): 限制输出长度的参数名, 部分推理模型需要使用'max_completion_tokens'
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
 
     Returns:
-        Dict[str, Any]:包含模型回复的数据
+        Dict[str, Any]:包含模型回复的数据, 调用的耗时与token用量记录在'meta'字段中
     """
     async with semaphore:       # 确保在任何时候，最多都只有semaphore个任务同时执行with内的代码
+        response = None
+        start_time = time.perf_counter()
         try:
-            messages = build_send_message(sample)
-            response = await client.chat.completions.create(
-                model = model,
-                messages = messages
-                # max_tokens=10
-            )
+            messages = build_send_message(sample, shards)
+            prompt = sample['conversation'][0]['value']
+            budget = token_budget.suggest(prompt, model) if token_budget else None
+            while True:
+                extra_params = {max_tokens_param: budget} if budget else {}
+                response = await client.chat.completions.create(
+                    model = model,
+                    messages = messages,
+                    **extra_params
+                )
+                # 仅当回复确实因为达到max_tokens而被截断时，才以更大的预算重新请求
+                truncated = bool(response and response.choices and response.choices[0].finish_reason == 'length')
+                if not (budget and truncated):
+                    break
+                next_budget = token_budget.expand(budget)
+                if next_budget is None:
+                    break
+                budget = next_budget
+                print(f"⚠️ 回复被截断 (ID: {sample['id']}), 以 {max_tokens_param}={budget} 重新请求")
+
+            if token_budget and not truncated and response and response.usage:
+                token_budget.record(prompt, model, response.usage.completion_tokens)
             
             # 检查 response 和 choices 是否有效
-            if response and response.choices and len(response.choices) > 0:
+            if budget and truncated:
+                # 预算已达上限仍被截断: 标记为失败, 避免把不完整的回复当作成功结果(可由 retry_errors.py 重跑)
+                print(f"❌ 回复在 {max_tokens_param}={budget} 时仍被截断 (ID: {sample['id']}), 已标记为失败。")
+                sample['conversation'][1]['value'] = f'ERROR: Truncated at {max_tokens_param}={budget}'
+            elif response and response.choices and len(response.choices) > 0:
                 # 检查 message 和 content 是否有效
                 if response.choices[0].message and response.choices[0].message.content:
                     ai_response = response.choices[0].message.content
@@ -147,9 +247,361 @@ async def process_single_task(
         except Exception as e:
             print(f"❌ 未知错误 (ID: {sample['id']}): {e} ")
             sample['conversation'][1]['value'] = f'ERROR: Exception {e}'
+
+        sample['meta'] = build_result_meta(model, time.perf_counter() - start_time, response)
         
     return sample
-    
+
+
+def group_tasks_by_image(tasks: List[Dict[str, Any]], max_group_size: int) -> List[List[Dict[str, Any]]]:
+    """将输入图像完全相同的任务分为一组, 用于合并请求
+
+    结果文件与断点续跑都以 id 为键, 同一张图像上的多个任务(例如 pe.json 中的多个提示词)必须使用不同的 id,
+    否则写出的多条结果无法区分; 存在重复 id 时抛出 ValueError。
+
+    Args:
+        tasks (List[Dict[str, Any]]): 待处理的任务
+        max_group_size (int): 每组最多包含的任务数(即一次请求中最多的子问题数)
+
+    Returns:
+        List[List[Dict[str, Any]]]: 分组后的任务, 保持任务首次出现的顺序
+    """
+    duplicate_ids = [sample_id for sample_id, count in Counter(task['id'] for task in tasks).items() if count > 1]
+    if duplicate_ids:
+        raise ValueError(
+            f"合并请求要求每个任务的 id 唯一, 但有 {len(duplicate_ids)} 个 id 重复(例如 {duplicate_ids[:3]}); "
+            f"同一图像上的多个提示词请使用不同的 id(例如在 id 后加上提示词编号)"
+        )
+
+    groups = {}
+    for task in tasks:
+        images = task['image']
+        key = (images,) if isinstance(images, str) else tuple(images)
+        groups.setdefault(key, []).append(task)
+
+    batches = []
+    for group in groups.values():
+        for start in range(0, len(group), max_group_size):
+            batches.append(group[start:start + max_group_size])
+    return batches
+
+
+def build_coalesced_message(samples: List[Dict[str, Any]], shards: Optional[ShardReader] = None) -> List[Dict[str, Any]]:
+    """将共享同一组图像的多个任务合并为一条请求: 图像只发送一次, 各任务的提示词作为编号子问题
+
+    Args:
+        samples (List[Dict[str, Any]]): 图像完全相同的多个任务
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
+
+    Returns:
+        List[Dict[str, Any]]: 输入给模型的数据
+    """
+    image_paths = samples[0]['image']
+    if isinstance(image_paths, str):
+        image_paths = [image_paths]
+
+    content = []
+    for image_path in image_paths:
+        try:
+            content.append({
+                'type': 'image_url',
+                'image_url': {'url': encode_image_to_base64(image_path, shards)}
+            })
+        except Exception as e:
+            print(f"遇到错误 {e}, 无法编码图像 {image_path}, 已跳过.")
+
+    instruction = (
+        f"以下是关于上述图像的 {len(samples)} 个相互独立的问题，请逐一完整作答。\n"
+        f"回答格式要求：每个回答必须以单独一行的【回答k】开头(k为问题编号, 从1到{len(samples)})，"
+        f"随后紧跟该问题的完整回答，不要输出其他额外内容。"
+    )
+    questions = [instruction]
+    for idx, sample in enumerate(samples, start=1):
+        question = sample['conversation'][0]['value'].replace('<image>', '').strip()
+        questions.append(f"【问题{idx}】\n{question}")
+
+    content.append({
+        'type': 'text',
+        'text': '\n\n'.join(questions)
+    })
+
+    return [{
+        'role': 'user',
+        'content': content
+    }]
+
+
+def split_coalesced_answer(answer: str, num_questions: int) -> Optional[List[str]]:
+    """将合并请求的回复按照【回答k】拆分为各个子问题的回答
+
+    Args:
+        answer (str): 模型的完整回复
+        num_questions (int): 子问题数量
+
+    Returns:
+        Optional[List[str]]: 按编号排列的回答; 编号不完整、重复或存在空回答时返回None
+    """
+    matches = list(COALESCE_ANSWER_PATTERN.finditer(answer))
+    parts = {}
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(answer)
+        text = answer[match.end():end].strip()
+        if number in parts or not text:
+            return None
+        parts[number] = text
+
+    if sorted(parts.keys()) != list(range(1, num_questions + 1)):
+        return None
+    return [parts[number] for number in range(1, num_questions + 1)]
+
+
+async def process_coalesced_task(
+    client: AsyncOpenAI,
+    samples: List[Dict[str, Any]],
+    model: str,
+    semaphore: asyncio.Semaphore,
+    token_budget: Optional[TokenBudget] = None,
+    max_tokens_param: str = 'max_tokens',
+    shards: Optional[ShardReader] = None
+) -> List[Dict[str, Any]]:
+    """提交一条合并请求并将回复拆分回各个任务, 调用或解析失败时回退为逐个单独请求
+
+    Args:
+        client (AsyncOpenAI): OpenAI客户端（支持异步）
+        samples (List[Dict[str, Any]]): 图像完全相同的多个任务
+        model (str): 调用API的名称（调用模型的名称）
+        semaphore(asyncio.Semaphore): 接收信号量
+        token_budget (Optional[TokenBudget]): 单独请求(包括回退)时的输出长度预算
+        max_tokens_param (str): 限制输出长度的参数名
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
+
+    Returns:
+        List[Dict[str, Any]]: 包含模型回复的数据
+    """
+    if len(samples) == 1:
+        return [await process_single_task(client, samples[0], model, semaphore, token_budget, max_tokens_param, shards)]
+
+    answers = None
+    response = None
+    async with semaphore:
+        start_time = time.perf_counter()
+        try:
+            messages = build_coalesced_message(samples, shards)
+            response = await client.chat.completions.create(
+                model = model,
+                messages = messages
+            )
+            if response and response.choices and response.choices[0].finish_reason == 'length':
+                # 被截断的回复即使每个【回答k】都存在, 最后一个回答也不完整, 按解析失败处理
+                print(f"⚠️ 合并请求的回复被截断 (ID: {samples[0]['id']} 等 {len(samples)} 个任务)")
+            elif response and response.choices and response.choices[0].message and response.choices[0].message.content:
+                answers = split_coalesced_answer(response.choices[0].message.content, len(samples))
+        except Exception as e:
+            print(f"❌ 合并请求错误 (ID: {samples[0]['id']} 等 {len(samples)} 个任务): {e} ")
+
+    if answers is None:
+        # 回退: 释放信号量后再逐个提交, 避免在持有信号量的情况下再次申请造成死锁
+        print(f"⚠️ 合并请求无法拆分 (ID: {samples[0]['id']} 等 {len(samples)} 个任务), 回退为单独请求")
+        return list(await asyncio.gather(*[
+            process_single_task(client, sample, model, semaphore, token_budget, max_tokens_param, shards) for sample in samples
+        ]))
+
+    meta = build_result_meta(model, time.perf_counter() - start_time, response, coalesced=len(samples))
+    usage = meta.pop('usage', None)
+    for idx, (sample, answer) in enumerate(zip(samples, answers)):
+        sample['conversation'][1]['value'] = answer
+        sample['meta'] = dict(meta)
+        if idx == 0 and usage:
+            sample['meta']['usage'] = usage     # 整条合并请求的用量只记在第一条数据上, 汇总时不会重复计算
+    return samples
+
+
+def build_tile_messages(
+    sample: Dict[str, Any],
+    tiling: Dict[str, Any],
+    shards: Optional[ShardReader] = None
+) -> Optional[List[Tuple[Tuple[int, int, int, int], List[Dict[str, Any]]]]]:
+    """将单图任务的大图切分为重叠的分块，为每个分块构造输入给api的数据
+
+    Args:
+        sample (Dict[str, Any]): 单个json数据
+        tiling (Dict[str, Any]): 分块参数, 包含 tile_size, overlap
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
+
+    Returns:
+        Optional[List]: [(分块坐标, 输入给模型的数据), ...]; 多图任务或图像无需分块时返回None
+    """
+    image_paths = sample['image']
+    if isinstance(image_paths, str):
+        image_paths = [image_paths]
+    if len(image_paths) != 1 or not needs_tiling(open_image_source(image_paths[0], shards), tiling['tile_size']):
+        return None
+
+    (width, height), tiles = crop_tiles_to_base64(open_image_source(image_paths[0], shards), tiling['tile_size'], tiling['overlap'])
+    human_prompt = sample['conversation'][0]['value'].replace('<image>', '').strip()
+
+    tile_messages = []
+    for idx, (box, base64_tile) in enumerate(tiles, start=1):
+        tile_note = (
+            f"注意：这是一张 {width}x{height} 大图中的第 {idx}/{len(tiles)} 块局部区域，"
+            f"像素范围为 ({box[0]}, {box[1]}) - ({box[2]}, {box[3]})，相邻区域之间存在重叠。"
+            f"请只描述该区域内实际可见的内容。"
+        )
+        content = [
+            {'type': 'image_url', 'image_url': {'url': base64_tile}},
+            {'type': 'text', 'text': f"{tile_note}\n\n{human_prompt}"}
+        ]
+        tile_messages.append((box, [{'role': 'user', 'content': content}]))
+
+    return tile_messages
+
+
+def format_tile_answers(tile_answers: List[Tuple[Tuple[int, int, int, int], str]]) -> str:
+    """将各分块的回答按区域编号与坐标拼接为一段文本"""
+    return '\n\n'.join(
+        f"【区域{idx} ({box[0]}, {box[1]}) - ({box[2]}, {box[3]})】\n{answer}"
+        for idx, (box, answer) in enumerate(tile_answers, start=1)
+    )
+
+
+def build_aggregate_message(sample: Dict[str, Any], tile_answers: List[Tuple[Tuple[int, int, int, int], str]]) -> List[Dict[str, Any]]:
+    """构造汇总请求: 根据各分块的回答，按原始提示词的要求生成对整张图像的单一回答
+
+    Args:
+        sample (Dict[str, Any]): 单个json数据
+        tile_answers (List[Tuple]): [(分块坐标, 分块回答), ...]
+
+    Returns:
+        List[Dict[str, Any]]: 输入给模型的数据(纯文本)
+    """
+    human_prompt = sample['conversation'][0]['value'].replace('<image>', '').strip()
+    text = (
+        "一张大图被切分为若干相互重叠的局部区域分别进行了分析，各区域的分析结果如下：\n\n"
+        + format_tile_answers(tile_answers)
+        + "\n\n请综合以上各区域的结果(重叠区域中的同一目标只计一次)，"
+        "按照下面的原始任务要求，给出对整张图像的完整回答：\n\n"
+        + human_prompt
+    )
+    return [{'role': 'user', 'content': [{'type': 'text', 'text': text}]}]
+
+
+class TruncatedResponseError(Exception):
+    """输出长度预算已达上限, 回复仍被截断"""
+
+
+async def request_completion(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, Any]],
+    model: str,
+    semaphore: asyncio.Semaphore,
+    token_budget: Optional[TokenBudget] = None,
+    max_tokens_param: str = 'max_tokens',
+    budget_prompt: str = ''
+) -> str:
+    """在信号量的控制下提交一次请求并返回回复文本, 回复为空时抛出异常
+
+    Args:
+        token_budget (Optional[TokenBudget]): 输出长度预算, 为None时不限制max_tokens; 截断时以更大的预算重新请求
+        max_tokens_param (str): 限制输出长度的参数名
+        budget_prompt (str): 输出长度统计使用的提示词(同类请求使用相同的提示词)
+
+    Raises:
+        TruncatedResponseError: 预算已达上限, 回复仍被截断
+    """
+    async with semaphore:
+        budget = token_budget.suggest(budget_prompt, model) if token_budget else None
+        while True:
+            extra_params = {max_tokens_param: budget} if budget else {}
+            response = await client.chat.completions.create(
+                model = model,
+                messages = messages,
+                **extra_params
+            )
+            truncated = bool(response and response.choices and response.choices[0].finish_reason == 'length')
+            if not (budget and truncated):
+                break
+            next_budget = token_budget.expand(budget)
+            if next_budget is None:
+                break
+            budget = next_budget
+        if token_budget and not truncated and response and response.usage:
+            token_budget.record(budget_prompt, model, response.usage.completion_tokens)
+    if budget and truncated:
+        raise TruncatedResponseError(f"Truncated at {max_tokens_param}={budget}")
+    if not (response and response.choices and response.choices[0].message and response.choices[0].message.content):
+        raise ValueError("响应中缺少 message.content")
+    return response.choices[0].message.content
+
+
+async def process_tiled_task(
+    client: AsyncOpenAI,
+    sample: Dict[str, Any],
+    model: str,
+    semaphore: asyncio.Semaphore,
+    tiling: Dict[str, Any],
+    shards: Optional[ShardReader] = None,
+    token_budget: Optional[TokenBudget] = None,
+    max_tokens_param: str = 'max_tokens'
+) -> Dict[str, Any]:
+    """分块推理: 将大图切分为重叠分块并发请求，再将各分块的回答合并为一个conversation[1]回答。
+    图像无需分块时等同于process_single_task; 任一分块失败时整条数据记为'ERROR'。
+
+    Args:
+        client (AsyncOpenAI): OpenAI客户端（支持异步）
+        sample (Dict[str, Any]): 待处理的单个样本（任务）
+        model (str): 调用API的名称（调用模型的名称）
+        semaphore(asyncio.Semaphore): 接收信号量, 每个分块请求单独申请
+        tiling (Dict[str, Any]): 分块参数, 包含 tile_size, overlap, aggregate
+        shards (Optional[ShardReader]): 输入为负载分片时从分片中读取图像字节, 为None时读取图像文件
+        token_budget (Optional[TokenBudget]): 输出长度预算, 分块请求与汇总请求分别统计
+        max_tokens_param (str): 限制输出长度的参数名
+
+    Returns:
+        Dict[str, Any]:包含模型回复的数据
+    """
+    start_time = time.perf_counter()
+    try:
+        # 解码与切分图像属于CPU密集操作, 放到线程中执行以免阻塞事件循环
+        tile_messages = await asyncio.to_thread(build_tile_messages, sample, tiling, shards)
+    except Exception as e:
+        print(f"❌ 分块失败 (ID: {sample['id']}): {e} ")
+        sample['conversation'][1]['value'] = f'ERROR: Exception {e}'
+        sample['meta'] = build_result_meta(model, time.perf_counter() - start_time, tiles=0)
+        return sample
+
+    if tile_messages is None:
+        return await process_single_task(client, sample, model, semaphore, token_budget, max_tokens_param, shards)
+
+    prompt = sample['conversation'][0]['value']
+    try:
+        answers = await asyncio.gather(*[
+            request_completion(client, messages, model, semaphore, token_budget, max_tokens_param, f"[tile]{prompt}")
+            for _, messages in tile_messages
+        ])
+        tile_answers = [(box, answer) for (box, _), answer in zip(tile_messages, answers)]
+
+        if tiling.get('aggregate', True):
+            aggregate_messages = build_aggregate_message(sample, tile_answers)
+            sample['conversation'][1]['value'] = await request_completion(
+                client, aggregate_messages, model, semaphore, token_budget, max_tokens_param, f"[aggregate]{prompt}"
+            )
+        else:
+            sample['conversation'][1]['value'] = format_tile_answers(tile_answers)
+    except TruncatedResponseError as e:
+        # 与单独请求一致: 不完整的回复标记为失败(可由 retry_errors.py 重跑)
+        print(f"❌ 分块推理的回复仍被截断 (ID: {sample['id']}): {e} ")
+        sample['conversation'][1]['value'] = f'ERROR: {e}'
+    except APIError as e:
+        print(f"❌ API 错误 (ID: {sample['id']}): {e} ")
+        sample['conversation'][1]['value'] = f'ERROR: APIError {e}'
+    except Exception as e:
+        print(f"❌ 未知错误 (ID: {sample['id']}): {e} ")
+        sample['conversation'][1]['value'] = f'ERROR: Exception {e}'
+
+    sample['meta'] = build_result_meta(model, time.perf_counter() - start_time, tiles=len(tile_messages))
+    return sample
+
     
 async def process_batch_task(args):
     """
@@ -168,9 +620,14 @@ async def process_batch_task(args):
             从命令行解析的参数, 必须包含:
             - provider (str): API 提供商
             - model (str): 模型名称
-            - input_file (str): 输入的 .jsonl 任务文件
-            - output_file (str): 输出的 .jsonl 结果文件
+            - input_file (str): 输入的 .jsonl 任务文件, 或 build_sft_dataset.py 打包的负载分片文件夹
+            - output_file (str): 输出的 .jsonl 结果文件, 以 .db/.sqlite 结尾时写入 SQLite 结果库
             - concurrency (int): 最大并发数
+            - coalesce (bool): 是否将图像相同的任务合并为一条请求
+            - coalesce_max (int): 合并请求时每条请求最多包含的子问题数
+            - tiling (bool): 是否对大图进行分块推理(参数见 api_config.yaml 的 model_settings)
+            - token_budget (bool): 是否根据历史输出长度分布自动设置 max_tokens
+            - token_stats_file (str): 输出长度统计的json文件
     """
     print(f"🚀 开始调用API（异步）...")
     print(f"    并发数量: {args.concurrency}")
@@ -181,26 +638,38 @@ async def process_batch_task(args):
     client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
     print(f"    模型: {args.provider} - {args.model}")
 
-    # 读取已完成的任务
-    completed_ids = set()
-    
-    if os.path.exists(args.output_file):
-        with open(args.output_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    line_data = json.loads(line)
-                    completed_ids.add(line_data['id'])
-                except Exception as e:
-                    pass
+    if args.coalesce and args.tiling:
+        raise ValueError("合并请求(coalesce)与分块推理(tiling)不能同时开启!")
+    tiling = {**DEFAULT_TILING, **model_config['settings'].get('tiling', {})}
+    if args.tiling:
+        print(f"    分块推理: tile_size={tiling['tile_size']}, overlap={tiling['overlap']}, aggregate={tiling['aggregate']}")
+
+    # 读取已完成的任务(SQLite 结果库只跳过成功的任务, 失败的任务会重新调用并覆盖原结果)
+    completed_ids = read_result_ids(args.output_file)
     print(f"已加载 {len(completed_ids)} 个已完成的任务")
     
-    # 读取所有待调用api的数据
+    # 输入为负载分片时, 数据与图像字节都从内存映射的分片中顺序读取
+    shards = None
+    if is_shard_dir(args.input_file):
+        shards = ShardReader(args.input_file)
+        tasks = shards.iter_records()
+        print(f"    输入: 负载分片 {args.input_file} ({len(shards)} 条数据)")
+    else:
+        tasks = iter_jsonl(args.input_file, desc="输入文件")
+
+    # 读取所有待调用api的数据, 紧凑格式的数据从引用表中还原提示词(保留引用, 写出时再压缩)
+    prompt_table = PromptTable.for_jsonl(args.input_file)
     task_to_process = []
-    with open(args.input_file, 'r', encoding = 'utf-8') as f_in:
-        for line in f_in:
-            task = json.loads(line)
-            if task['id'] not in completed_ids:
-                task_to_process.append(task)
+    for task in tasks:
+        if str(task['id']) not in completed_ids:      # 已完成的 id 统一为字符串(结果库以字符串保存 id)
+            task_to_process.append(prompt_table.expand_record(task, keep_ref=True))
+
+    # 紧凑格式的结果文件同样需要引用表, 与输入文件的引用表合并后保存在结果文件旁
+    if prompt_table.prompts:
+        output_table_path = prompt_table_path(args.output_file)
+        output_table = PromptTable.load(output_table_path)
+        output_table.merge(prompt_table)
+        output_table.save(output_table_path)
 
     total_tasks = len(task_to_process)
     if total_tasks == 0:
@@ -208,30 +677,60 @@ async def process_batch_task(args):
     else:
         print(f"⚡共找到 {total_tasks} 个待处理任务")
     
+    # 输出长度预算: 按 (prompt, model) 的历史分布设置 max_tokens
+    token_budget = None
+    max_tokens_param = model_config['settings'].get('max_tokens_param', 'max_tokens')
+    if args.token_budget:
+        token_budget = TokenBudget(stats_path=args.token_stats_file)
+        print(f"    输出长度预算: 已加载 {len(token_budget.samples)} 组统计, 参数名 {max_tokens_param}")
+
     # 创建信号量
     semaphore = asyncio.Semaphore(args.concurrency)
     
     # 创建所有任务的协程，存储在list中
-    coroutines = [process_single_task(client, sample, model_config['model'], semaphore) for sample in task_to_process]
+    if args.coalesce:
+        task_groups = group_tasks_by_image(task_to_process, args.coalesce_max)
+        print(f"🔗 合并模式: {total_tasks} 个任务合并为 {len(task_groups)} 条请求")
+        coroutines = [
+            process_coalesced_task(client, group, model_config['model'], semaphore, token_budget, max_tokens_param, shards)
+            for group in task_groups
+        ]
+    elif args.tiling:
+        coroutines = [
+            process_tiled_task(client, sample, model_config['model'], semaphore, tiling, shards, token_budget, max_tokens_param)
+            for sample in task_to_process
+        ]
+    else:
+        coroutines = [
+            process_single_task(client, sample, model_config['model'], semaphore, token_budget, max_tokens_param, shards)
+            for sample in task_to_process
+        ]
     
     # 并发执行所有任务并保存结果
     print(f"✨✨开始并发执行 {len(coroutines)} 个任务，最大并发数: {args.concurrency}")
     results_count = 0
     try:
-        with open(args.output_file, 'a', encoding='utf-8') as f_out:
-            for future in tqdm(asyncio.as_completed(coroutines), total=total_tasks, desc="Processing tasks"):
+        with open_result_writer(args.output_file) as writer:
+            for future in tqdm(asyncio.as_completed(coroutines), total=len(coroutines), desc="Processing tasks"):
                 result = await future           # await获取事件循环中的一个处理结果
+                results = result if isinstance(result, list) else [result]     # 合并请求会返回多个结果
             
-                if result:
-                    f_out.write(json.dumps(result, ensure_ascii=False) + '\n')
-                    f_out.flush()           # 立刻将文件写入
-                    results_count += 1
+                for result in results:
+                    if result:
+                        writer.write(compact_record(result))
+                        results_count += 1
+                writer.flush()          # 立刻将文件写入(结果库则提交事务)
     except Exception as e:
         print(f"❌  循环处理过程中遇到错误: {e}")
         print(f"    已处理  {results_count} / {total_tasks} 个任务")
         return
+    finally:
+        if token_budget:
+            token_budget.save()
+        if shards is not None:
+            shards.close()
     
-    print(f"\n✅ 任务处理完成，{results_count} 个新结果已追加至 {args.output_file}")
+    print(f"\n✅ 任务处理完成，{results_count} 个新结果已写入 {args.output_file}")
     await client.close()
 
 def main():
@@ -241,9 +740,14 @@ def main():
     parser = argparse.ArgumentParser(description="批量调用LLM API, 异步控制, 支持断点续跑")
     parser.add_argument('--provider', type=str, required=True, help='API提供商')
     parser.add_argument('--model', type=str, required=True, help='模型名称')
-    parser.add_argument('--input_file', type=str, required=True, help='输入的 .jsonl 待处理文件')
+    parser.add_argument('--input_file', type=str, required=True, help='输入的 .jsonl 待处理文件, 或负载分片文件夹')
     parser.add_argument('--output_file', type=str, required=True, help='输出的处理结果文件')
     parser.add_argument('--concurrency', type=int, default=10, help='并发调用数量, 默认为10')
+    parser.add_argument('--coalesce', action='store_true', help='将图像相同的多个任务合并为一条请求(编号子问题), 要求各任务的 id 唯一')
+    parser.add_argument('--coalesce_max', type=int, default=5, help='合并请求时每条请求最多包含的子问题数, 默认为5')
+    parser.add_argument('--tiling', action='store_true', help='将大图切分为重叠分块分别请求后合并回答(参数按模型配置)')
+    parser.add_argument('--token_budget', action='store_true', help='根据历史输出长度分布自动设置max_tokens, 截断时自动加大预算重试')
+    parser.add_argument('--token_stats_file', type=str, default='./config/token_stats.json', help='输出长度统计的json文件')
 
     args = parser.parse_args()
     asyncio.run(process_batch_task(args))
@@ -261,6 +765,11 @@ if __name__ == "__main__":
     test_args.input_file = './example/sft_dataset_single.jsonl'            # 输入文件
     test_args.output_file = './example/sft_dataset_single_result1.jsonl'    # 调用api后得到的输出文件
     test_args.concurrency = 10                                          # 并发数
+    test_args.coalesce = False                                          # 是否合并图像相同的任务
+    test_args.coalesce_max = 5                                          # 合并请求的最大子问题数
+    test_args.tiling = False                                            # 是否对大图进行分块推理
+    test_args.token_budget = False                                      # 是否自动设置max_tokens
+    test_args.token_stats_file = './config/token_stats.json'            # 输出长度统计文件
     
     print(f"--- 正在从脚本中启动 call_llm_api_robust (调试模式) ---")
     print(f"   Provider: {test_args.provider}")
@@ -1,11 +1,16 @@
 """
 API调用示例
 提供一个利用API进行多轮对话的简单示例    
+多轮对话流式输出回复, 显示并记录每轮的首字延迟(TTFT)与生成速度, 可用于测试接口延迟
 """
 import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List
 from openai import OpenAI
 from openai import AsyncOpenAI
-from llm_toolkit import APIConfigManager
+from llm_toolkit import APIConfigManager, JsonlWriter
 import argparse
 
 # 如果采用openai等外网官方网站作为base_url，需要设置下代理的映射端口
@@ -16,6 +21,9 @@ import argparse
 # 设置在通过该网址访问时不使用任何代理，否则在开启vpn通过该网站调用api会出错
 os.environ['NO_PROXY'] = 'api.agicto.cn'
 
+# 每轮对话的首字延迟(TTFT)、生成速度等计时记录, 每行一个json, 用于测试接口延迟
+DEFAULT_LATENCY_LOG = './config/chat_latency.jsonl'
+
 def initialize_client(api_key, base_url):
     if not api_key:
         raise ValueError("api_key为空, 请检查环境变量是否设置!")
@@ -25,6 +33,16 @@ def initialize_client(api_key, base_url):
         base_url=base_url
     )
 
+def initialize_async_client(api_key, base_url):
+    if not api_key:
+        raise ValueError("api_key为空, 请检查环境变量是否设置!")
+
+    # 异步客户端内部的连接池在多轮对话之间复用(keep-alive), 后续轮次无需重新建立 TCP/TLS 连接
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url
+    )
+
 def chat_single(config_manager: APIConfigManager, provider: str, model: str):
     model_config = config_manager.get_model_config(provider, model)
     client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
@@ -49,9 +67,111 @@ def chat_single(config_manager: APIConfigManager, provider: str, model: str):
     # 对于思考模型，可以通过reasoning_content访问思维链
     # print(f"LLM🤖: {response.choices[0].message.reasoning_content}")
 
-def chat_multi(config_manager: APIConfigManager, provider: str, model: str):
+async def stream_reply(client: AsyncOpenAI, model: str, conversation: List[Dict[str, Any]],
+                       timing: Dict[str, Any], stream_usage: bool = True) -> str:
+    """流式请求一次回复, 边生成边打印; 计时信息实时写入 timing, 生成被取消时也保留已有的计时
+
+    Args:
+        client (AsyncOpenAI): 异步客户端
+        model (str): 模型名称
+        conversation (List[Dict[str, Any]]): 对话历史
+        timing (Dict[str, Any]): 计时记录, 写入 ttft(首字延迟)、completion_tokens 等字段
+        stream_usage (bool): 是否请求在最后一个数据块中返回 token 用量(部分接口不支持)
+
+    Returns:
+        str: 完整的回复
+    """
+    extra_params = {'stream_options': {'include_usage': True}} if stream_usage else {}
+    reply = []
+    section = None          # 当前正在打印的部分: 'reasoning'(思维链) / 'content'(回答)
+    timing['chunks'] = 0
+    start = time.perf_counter()
+    try:
+        # SDK 的流式迭代器读到 [DONE] 就关闭响应, 响应体的结束标记没有读完, 连接会被断开而不是放回连接池;
+        # 这里自行解析 SSE 并读完整个响应体, 连接才能在下一轮复用。生成被取消时退出 async with 并关闭连接。
+        async with client.chat.completions.with_streaming_response.create(
+            model = model,
+            messages = conversation,
+            stream = True,
+            **extra_params
+        ) as response:
+            async for line in response.iter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    continue
+                chunk = json.loads(data)
+                if chunk.get('error'):
+                    error = chunk['error']
+                    raise ValueError(error.get('message', error) if isinstance(error, dict) else error)
+                if chunk.get('usage'):
+                    timing['prompt_tokens'] = chunk['usage'].get('prompt_tokens')
+                    timing['completion_tokens'] = chunk['usage'].get('completion_tokens')
+                if not chunk.get('choices'):
+                    continue
+                delta = chunk['choices'][0].get('delta') or {}
+                # 对于思考模型, 部分接口通过reasoning_content返回思维链
+                for kind, text in (('reasoning', delta.get('reasoning_content')), ('content', delta.get('content'))):
+                    if not text:
+                        continue
+                    if 'ttft' not in timing:
+                        timing['ttft'] = time.perf_counter() - start
+                    if section != kind:
+                        prefix = '思考💭: ' if kind == 'reasoning' else 'LLM🤖: '
+                        print(f"\n{prefix}" if section else prefix, end='', flush=True)
+                        section = kind
+                    print(text, end='', flush=True)
+                    timing['chunks'] += 1
+                    if kind == 'content':
+                        reply.append(text)
+    finally:
+        timing['total'] = time.perf_counter() - start
+    print()
+    return ''.join(reply)
+
+
+def format_timing(timing: Dict[str, Any]) -> str:
+    """一轮对话的计时摘要: 首字延迟、生成速度(首字之后)与总耗时"""
+    parts = []
+    if 'ttft' in timing:
+        parts.append(f"首字延迟 {timing['ttft']:.2f}s")
+    if timing.get('tokens_per_second') is not None:
+        approx = '' if timing.get('usage_reported') else '≈'
+        parts.append(f"{approx}{timing['tokens_per_second']:.1f} tok/s")
+    if 'total' in timing:
+        tokens = f", {timing['completion_tokens']} tokens" if timing.get('completion_tokens') is not None else ''
+        parts.append(f"共 {timing['total']:.2f}s{tokens}")
+    return ' | '.join(parts)
+
+
+def finish_timing(timing: Dict[str, Any]):
+    """根据 token 用量(接口未返回时以数据块数近似)计算首字之后的生成速度"""
+    timing['usage_reported'] = timing.get('completion_tokens') is not None
+    tokens = timing['completion_tokens'] if timing['usage_reported'] else timing.get('chunks', 0)
+    decode_time = timing.get('total', 0) - timing.get('ttft', 0)
+    timing['tokens_per_second'] = round(tokens / decode_time, 2) if 'ttft' in timing and decode_time > 0 and tokens else None
+    for key in ('ttft', 'total'):
+        if key in timing:
+            timing[key] = round(timing[key], 3)
+
+
+def chat_multi(config_manager: APIConfigManager, provider: str, model: str,
+               latency_log: str = DEFAULT_LATENCY_LOG, stream_usage: bool = True):
+    """多轮对话: 流式输出回复, 并显示首字延迟与生成速度
+
+    生成过程中按 Ctrl-C 只取消本次生成(本轮提问不计入对话历史), 在输入时按 Ctrl-C 结束对话。
+    所有轮次使用同一个事件循环与异步客户端, 连接在轮次之间复用。
+
+    Args:
+        config_manager (APIConfigManager): 配置管理器
+        provider (str): 模型提供商
+        model (str): 模型名称
+        latency_log (str): 计时记录文件, 为None时不记录
+        stream_usage (bool): 是否请求接口在流式输出中返回 token 用量
+    """
     model_config = config_manager.get_model_config(provider, model)
-    client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
+    client = initialize_async_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
     system_prompt = "You are a helpful assistant, please add '>_<' after answering each question."
     conversation = [
         {"role": "system", "content": system_prompt}
@@ -59,39 +179,76 @@ def chat_multi(config_manager: APIConfigManager, provider: str, model: str):
     
     print(f"使用模型: {model_config['provider']} - {model_config['model']}")
     print(f"模型描述: {model_config['description']}")
-    print("开始多轮对话，输入 'q' 退出\n")
-    
-    while True:
-        user_input = input('human👤:').strip()
-        if user_input == 'q':
-            print('对话结束！')
-            break
-        
-        if not user_input:
-            print('用户输入不能为空!')
-            continue
-        
-        conversation.append({"role": "user", "content": user_input})
-        response = client.chat.completions.create(
-            model = model_config['model'],
-            messages = conversation,
-            stream = False
-        )
-        
-        ai_response = response.choices[0].message.content
-        conversation.append({"role": "assistant", "content": ai_response})
-        print(f"LLM🤖: {ai_response}")
+    print("开始多轮对话，输入 'q' 退出; 生成过程中按 Ctrl-C 取消本次生成\n")
+
+    log_writer = None
+    if latency_log:
+        os.makedirs(os.path.dirname(os.path.abspath(latency_log)), exist_ok=True)
+        log_writer = JsonlWriter(latency_log, 'a')
+
+    # 不使用 asyncio.run: 每次调用都会新建并关闭事件循环, 客户端的连接池无法在轮次之间复用
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                user_input = input('human👤:').strip()
+            except (KeyboardInterrupt, EOFError):
+                print('\n对话结束！')
+                break
+            if user_input == 'q':
+                print('对话结束！')
+                break
+            
+            if not user_input:
+                print('用户输入不能为空!')
+                continue
+            
+            conversation.append({"role": "user", "content": user_input})
+            timing = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'provider': provider, 'model': model_config['model'],
+                      'turn': len(conversation) // 2, 'status': 'ok'}
+            task = loop.create_task(stream_reply(client, model_config['model'], conversation, timing, stream_usage))
+            try:
+                ai_response = loop.run_until_complete(task)
+                conversation.append({"role": "assistant", "content": ai_response})
+            except KeyboardInterrupt:
+                task.cancel()
+                loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+                conversation.pop()
+                timing['status'] = 'cancelled'
+                print('\n⛔ 已取消本次生成')
+            except Exception as e:
+                conversation.pop()
+                timing['status'] = 'error'
+                timing['error'] = str(e)
+                print(f"\n❌ 调用出错: {e}")
+
+            finish_timing(timing)
+            summary = format_timing(timing)
+            if summary:
+                print(f"⏱️ {summary}")
+            if log_writer:
+                timing.pop('chunks', None)
+                log_writer.write(timing)
+                log_writer.flush()
+    finally:
+        if log_writer:
+            log_writer.close()
+        loop.run_until_complete(client.close())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
 
 def main():
     parser = argparse.ArgumentParser(description = '对话机器人，用于测试API是否能正常调用')
     parser.add_argument('--provider', required=True, type=str, help='模型提供商')
     parser.add_argument('--model', required=True, type=str, help='模型名称') 
+    parser.add_argument('--latency_log', type=str, default=DEFAULT_LATENCY_LOG, help=f'计时记录文件, 默认为{DEFAULT_LATENCY_LOG}')
+    parser.add_argument('--no_stream_usage', action='store_true', help='不请求流式输出中的token用量(接口不支持stream_options时使用)')
 
     args = parser.parse_args()
     
     config_manager = APIConfigManager()
     # chat_single(config_manager, provider, model)              # 单轮对话测试
-    chat_multi(config_manager, args.provider, args.model)         # 多轮对话测试
+    chat_multi(config_manager, args.provider, args.model, args.latency_log, not args.no_stream_usage)         # 多轮对话测试
       
 if __name__ == "__main__":
     # 通过命令行调用
@@ -0,0 +1,87 @@
+"""
+数据格式转换: 紧凑格式(提示词引用) <-> 标准格式(完整提示词)
+
+- full: 将紧凑格式的数据集/结果文件展开为标准格式，供训练等需要完整提示词的下游使用。
+- compact: 将标准格式的文件压缩为紧凑格式，提示词只在 .prompts.json 引用表中保存一次。
+  若提供 pe.json，提示词编号与 pe.json 保持一致，否则以内容哈希生成编号。
+
+author:zhaoshe
+"""
+import json
+import argparse
+from typing import Optional
+from tqdm import tqdm
+from llm_toolkit import PromptTable, prompt_table_path, is_compact_record, compact_record, iter_jsonl, JsonlWriter
+from llm_toolkit.prompt_table import prompt_hash
+
+
+def expand_dataset(input_file: str, output_file: str) -> None:
+    """将紧凑格式的JSONL文件展开为标准格式
+
+    Args:
+        input_file (str): 紧凑格式的JSONL文件(其引用表位于同目录的 .prompts.json)
+        output_file (str): 输出的标准格式JSONL文件
+    """
+    prompt_table = PromptTable.for_jsonl(input_file)
+    with JsonlWriter(output_file) as writer:
+        for record in tqdm(iter_jsonl(input_file), desc="Expanding"):
+            writer.write(prompt_table.expand_record(record))
+    print(f"✅ 已展开为标准格式: {output_file}")
+
+
+def compress_dataset(input_file: str, output_file: str, pe_json_path: Optional[str] = None) -> None:
+    """将标准格式的JSONL文件压缩为紧凑格式, 并在输出文件旁生成引用表
+
+    Args:
+        input_file (str): 标准格式的JSONL文件
+        output_file (str): 输出的紧凑格式JSONL文件
+        pe_json_path (Optional[str]): 存储prompt的json文件, 用于确定提示词编号
+    """
+    # 提示词内容哈希 -> pe.json 中的编号
+    known_ids = {}
+    if pe_json_path:
+        with open(pe_json_path, 'r', encoding='utf-8') as f:
+            for prompt_id, entry in json.load(f).items():
+                known_ids[prompt_hash(entry['prompt_text'])] = prompt_id
+
+    input_table = PromptTable.for_jsonl(input_file)
+    output_table = PromptTable()
+    refs = {}               # 提示词内容 -> 引用, 相同内容只计算一次哈希
+    with JsonlWriter(output_file) as writer:
+        for record in tqdm(iter_jsonl(input_file), desc="Compacting"):
+            if is_compact_record(record):
+                record = input_table.expand_record(record)
+
+            human_turn = record['conversation'][0]
+            prompt_text = human_turn.pop('value')
+            if prompt_text not in refs:
+                text_hash = prompt_hash(prompt_text)
+                prompt_id = known_ids.get(text_hash, f"prompt_{text_hash[:8]}")
+                refs[prompt_text] = output_table.add(prompt_id, prompt_text)
+            human_turn['prompt_ref'] = refs[prompt_text]
+
+            writer.write(compact_record(record))
+
+    output_table.save(prompt_table_path(output_file))
+    print(f"✅ 已压缩为紧凑格式: {output_file} (共 {len(output_table.prompts)} 个提示词)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='紧凑格式(提示词引用)与标准格式(完整提示词)之间的转换')
+    parser.add_argument('--input_file', type=str, required=True, help='输入的JSONL文件')
+    parser.add_argument('--output_file', type=str, required=True, help='输出的JSONL文件')
+    parser.add_argument('--to', type=str, choices=['full', 'compact'], default='full', help='目标格式: full(标准格式) 或 compact(紧凑格式)')
+    parser.add_argument('--pe_json_path', type=str, default=None, help='prompt JSON文件路径, 压缩时用于确定提示词编号')
+
+    args = parser.parse_args()
+    if args.input_file == args.output_file:
+        raise ValueError("输入文件与输出文件不能相同!")
+
+    if args.to == 'full':
+        expand_dataset(args.input_file, args.output_file)
+    else:
+        compress_dataset(args.input_file, args.output_file, args.pe_json_path)
+
+
+if __name__ == "__main__":
+    main()
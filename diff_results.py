@@ -0,0 +1,72 @@
+"""
+多个模型结果的批量差异报告
+
+将多个结果文件(每个模型一个)按 id 连接，逐个 id、逐对文件计算长度差、字符相似度、词相似度与关键词重叠，
+由多进程并行计算，输出按差异度从大到小排序的 CSV 报告与各文件组合的汇总统计。
+报告可以交给 viewer/compare_double_results.py --report 按"差异最大的优先"的顺序浏览。
+
+    python diff_results.py model_a.jsonl model_b.jsonl model_c.jsonl --output diff_report.csv
+
+author:zhaoshe
+"""
+import json
+import time
+import argparse
+from typing import Any, Dict
+from tqdm import tqdm
+from llm_toolkit.result_join import ResultJoin
+from llm_toolkit.answer_diff import DiffSummary, iter_diff_rows, write_report, CHUNK_SIZE
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """打印各文件组合的汇总统计"""
+    for pair, stats in summary.items():
+        print(f"\n📊 {pair}")
+        print(f"    可比较: {stats['ok']}, 有一方缺失: {stats['missing']}, 有一方失败: {stats['error']}, 完全相同: {stats['identical']}")
+        for key, label in (('char_similarity', '字符相似度'), ('token_similarity', '词相似度'), ('keyword_overlap', '关键词重叠')):
+            q = stats[key]
+            if q['mean'] is not None:
+                print(f"    {label}: mean={q['mean']}, p10={q['p10']}, p50={q['p50']}, p90={q['p90']}")
+        if stats['mean_len_delta'] is not None:
+            print(f"    长度差(后者-前者): 平均 {stats['mean_len_delta']} 字, 平均绝对值 {stats['mean_abs_len_delta']} 字")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按 id 对比多个结果文件的回答, 输出按差异度排序的报告')
+    parser.add_argument('input_files', nargs='+', help='结果文件(.jsonl / .jsonl.gz / .db), 至少两个, 每个模型一个')
+    parser.add_argument('--output', type=str, default='diff_report.csv', help='CSV 报告路径, 默认为 diff_report.csv')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数, 默认为CPU核数')
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE, help=f'每个进程任务处理的 id 数, 默认为{CHUNK_SIZE}')
+    parser.add_argument('--json_report', type=str, default=None, help='将汇总统计另存为json文件')
+
+    args = parser.parse_args()
+    if len(args.input_files) < 2:
+        parser.error('至少需要两个结果文件')
+
+    start = time.perf_counter()
+    with ResultJoin(args.input_files) as join:
+        names = [source.name for source in join.sources]
+        print(f"🔗 共 {len(join)} 个 ID, 其中 {join.complete_count()} 个在所有文件中都有结果")
+
+        summary = DiffSummary()
+        rows = []
+        with tqdm(total=len(join), desc='计算差异', unit='id') as bar:
+            def progress(done: int, total: int):
+                bar.update(done - bar.n)
+            for row in iter_diff_rows(join, workers=args.workers, chunk_size=args.chunk_size, progress=progress):
+                summary.add(row)
+                rows.append(row)
+
+    count = write_report(rows, args.output, names)
+    report = summary.to_dict(names)
+    print_summary(report)
+    print(f"\n✅ 差异报告已保存至 {args.output} ({count} 行, 用时 {time.perf_counter() - start:.1f}s)")
+
+    if args.json_report:
+        with open(args.json_report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 汇总统计已保存至 {args.json_report}")
+
+
+if __name__ == "__main__":
+    main()
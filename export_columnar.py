@@ -0,0 +1,36 @@
+"""
+将数据集/结果文件导出为 Parquet / Arrow 列式文件, 供 pandas 等工具分析
+
+示例:
+    python export_columnar.py --input_file results.jsonl --output_file results.parquet
+    python export_columnar.py --input_file results.db --output_file results.arrow
+
+读取时只加载需要的列:
+    from llm_toolkit.columnar_export import read_columns
+    df = read_columns('results.parquet', ['id', 'answer']).to_pandas()
+
+author:zhaoshe
+"""
+import os
+import time
+import argparse
+from llm_toolkit.columnar_export import export_columnar
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将JSONL数据集/结果文件(或SQLite结果库)流式导出为Parquet/Arrow列式文件')
+    parser.add_argument('--input_file', type=str, required=True, help='输入文件: .jsonl(.gz/.zst) 数据集/结果文件或 .db 结果库')
+    parser.add_argument('--output_file', type=str, required=True, help='输出文件: .parquet 或 .arrow/.feather')
+    parser.add_argument('--batch_size', type=int, default=50000, help='每批写出的行数, 决定内存上限, 默认为50000')
+    parser.add_argument('--compression', type=str, default='zstd', help='Parquet 压缩算法: zstd / snappy / gzip / none, 默认为zstd')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = export_columnar(args.input_file, args.output_file, args.batch_size, args.compression)
+    size_mb = os.path.getsize(args.output_file) / 1024 / 1024
+    print(f"✅ 已导出 {count} 行至 {args.output_file} ({size_mb:.1f} MB, 用时 {time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+多个模型结果的成对评判(LLM-as-judge)
+
+将多个结果文件(每个模型一个)按 id 连接，对每个 id 的每一对回答构造评判请求(图像 + 原始问题 + 两个回答)，
+由评判模型判断哪个回答更好。两个回答的先后顺序按 (seed, id, 文件对) 随机打乱以抵消位置偏好。
+请求与 call_llm_api.py 一样异步并发、由信号量限制并发数，结果逐条追加写入 JSONL，支持断点续跑
+(评判失败的任务在续跑时重新评判)。同一 id 的各个文件对共享同一组图像，编码后的图像在内存中缓存复用。
+最后汇总各文件组合的胜/负/平、各文件的总体胜率以及评判模型的位置偏好。
+
+author:zhaoshe
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Dict
+from tqdm import tqdm
+from openai import AsyncOpenAI, APIError
+from llm_toolkit import APIConfigManager, JsonlWriter
+from llm_toolkit.result_join import ResultJoin
+from llm_toolkit.pairwise_judge import (
+    JudgeSummary, build_judge_text, completed_keys, iter_judge_tasks, parse_verdict, read_judgements, verdict_winner
+)
+from call_llm_api import initialize_client, encode_image_to_base64, build_result_meta
+
+
+def build_judge_message(task: Dict[str, Any], encode_image: Callable[[str], str]):
+    """构造评判请求: 图像在前, 随后是原始问题与按展示顺序排列的两个回答"""
+    content = []
+    for image_path in task['image']:
+        try:
+            content.append({
+                'type': 'image_url',
+                'image_url': {'url': encode_image(image_path)}
+            })
+        except Exception as e:
+            print(f"遇到错误 {e}, 无法编码图像 {image_path}, 已跳过.")
+    content.append({
+        'type': 'text',
+        'text': build_judge_text(task['question'], *task['answers'])
+    })
+    return [{'role': 'user', 'content': content}]
+
+
+async def judge_single_task(
+    client: AsyncOpenAI,
+    task: Dict[str, Any],
+    model: str,
+    semaphore: asyncio.Semaphore,
+    encode_image: Callable[[str], str]
+) -> Dict[str, Any]:
+    """提交一个评判请求, 调用失败或无法解析结论时 winner 为None(续跑时重新评判)
+
+    Args:
+        client (AsyncOpenAI): OpenAI客户端（支持异步）
+        task (Dict[str, Any]): iter_judge_tasks 生成的评判任务
+        model (str): 评判模型的名称
+        semaphore(asyncio.Semaphore): 接收信号量
+        encode_image (Callable[[str], str]): 图像编码函数(带缓存)
+
+    Returns:
+        Dict[str, Any]: 评判结果, 调用的耗时与token用量记录在'meta'字段中
+    """
+    async with semaphore:       # 图像在信号量内编码, 内存中同时存在的请求数不超过并发数
+        response = None
+        verdict = None
+        start_time = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(
+                model = model,
+                messages = build_judge_message(task, encode_image)
+            )
+            if not (response and response.choices and response.choices[0].message and response.choices[0].message.content):
+                raise ValueError("响应中缺少 message.content")
+            judgement = response.choices[0].message.content
+            verdict = parse_verdict(judgement)
+            if verdict is None:
+                print(f"⚠️ 无法解析评判结论 (ID: {task['id']}, {task['models'][0]} vs {task['models'][1]})")
+        except APIError as e:
+            print(f"❌ API 错误 (ID: {task['id']}): {e} ")
+            judgement = f'ERROR: APIError {e}'
+        except Exception as e:
+            print(f"❌ 未知错误 (ID: {task['id']}): {e} ")
+            judgement = f'ERROR: Exception {e}'
+
+        meta = build_result_meta(model, time.perf_counter() - start_time, response)
+
+    return {
+        'id': task['id'],
+        'models': task['models'],
+        'swapped': task['swapped'],
+        'verdict': verdict,
+        'winner': verdict_winner(verdict, task['swapped'], task['models']),
+        'judgement': judgement,
+        'meta': meta,
+    }
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    """打印各文件组合的胜负与各文件的总体胜率"""
+    for pair, stats in report['pairs'].items():
+        print(f"\n📊 {pair}")
+        print(f"    已评判: {stats['judged']}, 前者胜: {stats['wins_a']}, 后者胜: {stats['wins_b']}, "
+              f"平局: {stats['tie']}, 评判失败: {stats['failed']}")
+        if stats['win_rate_a'] is not None:
+            print(f"    前者胜率(平局计半场): {stats['win_rate_a']:.2%}")
+
+    print(f"\n🏆 总体胜率(平局计半场):")
+    ranked = sorted(report['models'].items(), key=lambda item: -(item[1]['win_rate'] or 0))
+    for name, stats in ranked:
+        win_rate = f"{stats['win_rate']:.2%}" if stats['win_rate'] is not None else '-'
+        print(f"    {name}: {win_rate} (胜 {stats['wins']}, 负 {stats['losses']}, 平 {stats['tie']})")
+
+    position = report['position']
+    if position['first_rate'] is not None:
+        print(f"\n    位置偏好: 选择先展示的回答 {position['first']} 次, 后展示的回答 {position['second']} 次 "
+              f"(先展示占比 {position['first_rate']:.2%})")
+
+
+async def judge_results(args):
+    """
+    成对评判的主协调函数。
+
+    该函数负责：
+    1. 按 id 连接各个结果文件, 读取已完成的评判(断点续跑)。
+    2. 分批生成评判任务, 在信号量控制下并发调用评判模型。
+    3. 在任务完成时立即将评判结果追加写入输出文件。
+    4. 汇总输出文件中的全部评判结果。
+
+    Args:
+        args (argparse.Namespace):
+            从命令行解析的参数, 必须包含:
+            - provider (str): 评判模型的 API 提供商
+            - model (str): 评判模型名称
+            - input_files (List[str]): 结果文件, 至少两个
+            - output_file (str): 评判结果的 .jsonl 文件
+            - concurrency (int): 最大并发数
+            - batch_size (int): 每批生成的评判任务数
+            - seed (int): 位置随机化的种子
+            - image_cache (int): 内存中缓存的编码后图像数量
+            - json_report (Optional[str]): 汇总统计的json文件
+    """
+    if len(args.input_files) < 2:
+        raise ValueError("至少需要两个结果文件!")
+
+    with ResultJoin(args.input_files) as join:
+        names = [source.name for source in join.sources]
+        if len(set(names)) != len(names):
+            raise ValueError(f"结果文件的文件名不能重复(评判结果以文件名区分模型): {names}")
+        print(f"🔗 共 {len(join)} 个 ID, 其中 {join.complete_count()} 个在所有文件中都有结果")
+
+        done = completed_keys(read_judgements(args.output_file))
+        print(f"已加载 {len(done)} 个已完成的评判")
+
+        config_manager = APIConfigManager()
+        model_config = config_manager.get_model_config(args.provider, args.model)
+        client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
+        print(f"🚀 评判模型: {args.provider} - {args.model}, 并发数: {args.concurrency}, 位置随机种子: {args.seed}")
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        encode_image = lru_cache(maxsize=args.image_cache)(encode_image_to_base64)
+        skipped = Counter()
+        tasks = iter_judge_tasks(join, done, seed=args.seed, skipped=skipped)
+        results_count = 0
+        progress = tqdm(desc="Judging", unit='pair')
+        try:
+            with JsonlWriter(args.output_file, 'a') as writer:
+                while True:
+                    batch = list(islice(tasks, args.batch_size))
+                    if not batch:
+                        break
+                    coroutines = [judge_single_task(client, task, model_config['model'], semaphore, encode_image) for task in batch]
+                    for future in asyncio.as_completed(coroutines):
+                        writer.write(await future)
+                        writer.flush()
+                        results_count += 1
+                        progress.update(1)
+        except Exception as e:
+            print(f"❌  循环处理过程中遇到错误: {e}")
+            print(f"    已评判 {results_count} 对回答")
+            return
+        finally:
+            progress.close()
+            await client.close()
+
+    cache = encode_image.cache_info()
+    print(f"\n✅ {results_count} 个新的评判结果已写入 {args.output_file}")
+    print(f"    跳过: 已完成 {skipped['done']}, 有一方缺失 {skipped['missing']}, 有一方失败 {skipped['error']}, "
+          f"缺少原始问题 {skipped['no_question']}")
+    print(f"    图像编码 {cache.misses} 次, 复用 {cache.hits} 次")
+
+    summary = JudgeSummary(names)
+    for record in read_judgements(args.output_file).values():
+        summary.add(record)
+    report = summary.to_dict()
+    print_summary(report)
+
+    if args.json_report:
+        with open(args.json_report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 汇总统计已保存至 {args.json_report}")
+
+
+def main():
+    """
+    主入口函数：解析命令行参数。
+    """
+    parser = argparse.ArgumentParser(description="由评判模型成对比较多个结果文件的回答, 汇总胜率, 支持断点续跑")
+    parser.add_argument('input_files', nargs='+', help='结果文件(.jsonl / .jsonl.gz / .db), 至少两个, 每个模型一个')
+    parser.add_argument('--provider', type=str, required=True, help='评判模型的API提供商')
+    parser.add_argument('--model', type=str, required=True, help='评判模型名称')
+    parser.add_argument('--output_file', type=str, default='judge_results.jsonl', help='评判结果文件, 默认为 judge_results.jsonl')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发调用数量, 默认为10')
+    parser.add_argument('--batch_size', type=int, default=1000, help='每批生成的评判任务数, 默认为1000')
+    parser.add_argument('--seed', type=int, default=0, help='回答位置随机化的种子, 默认为0(续跑时需保持一致)')
+    parser.add_argument('--image_cache', type=int, default=64, help='内存中缓存的编码后图像数量, 默认为64')
+    parser.add_argument('--json_report', type=str, default=None, help='将汇总统计另存为json文件')
+
+    args = parser.parse_args()
+    if len(args.input_files) < 2:
+        parser.error('至少需要两个结果文件')
+    asyncio.run(judge_results(args))
+
+if __name__ == "__main__":
+    # 通过命令行运行(不建议)
+    # main()
+
+    # 通过代码运行
+    test_args = argparse.Namespace()
+
+    # 修改下面这部分参数即可
+    test_args.provider = 'qwen'                                                 # 评判模型的提供商
+    test_args.model = 'qwen3-vl-plus'                                           # 评判模型名称
+    test_args.input_files = [                                                   # 需要对比的结果文件
+        './example/sft_dataset_single_result.jsonl',
+        './example/sft_dataset_single_result1.jsonl',
+    ]
+    test_args.output_file = './example/judge_results.jsonl'                     # 评判结果文件
+    test_args.concurrency = 10                                                  # 并发数
+    test_args.batch_size = 1000                                                 # 每批生成的评判任务数
+    test_args.seed = 0                                                          # 位置随机化的种子
+    test_args.image_cache = 64                                                  # 缓存的编码后图像数量
+    test_args.json_report = None                                                # 汇总统计文件
+
+    try:
+        asyncio.run(judge_results(test_args))
+        print(f"--- 脚本调用执行完毕 ---")
+    except Exception as e:
+        print(f"--- 脚本调用时发生错误: {e} ---")
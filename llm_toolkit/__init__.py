@@ -1,3 +1,12 @@
 from .config_manager import APIConfigManager
+from .token_budget import TokenBudget
+from .prompt_table import PromptTable, prompt_table_path, is_compact_record, compact_record
+from .jsonl_io import iter_jsonl, read_ids, JsonlWriter
+from .result_store import ResultStore, is_result_store, read_result_ids, open_result_writer, iter_results
 
-__all__ = ['APIConfigManager']
\ No newline at end of file
+__all__ = [
+    'APIConfigManager', 'TokenBudget',
+    'PromptTable', 'prompt_table_path', 'is_compact_record', 'compact_record',
+    'iter_jsonl', 'read_ids', 'JsonlWriter',
+    'ResultStore', 'is_result_store', 'read_result_ids', 'open_result_writer', 'iter_results'
+]
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+多个模型回答的批量差异/相似度计算
+
+对按 id 连接(result_join.ResultJoin)的多个结果文件，逐个 id、逐对文件计算:
+- 长度差: 回答字符数之差(后者减前者);
+- 字符相似度: difflib.SequenceMatcher 的 ratio(考虑顺序);
+- 词相似度: 词袋(多重集合)的 Jaccard 相似度，英文按单词、中文按相邻两字切分(无需分词);
+- 关键词重叠: 按标点与换行切分出的短语集合的 Jaccard 相似度(例如"建筑，挖掘机，车辆"这类列举式回答);
+- 差异度: 1 - 三个相似度的平均值，用于"差异最大的优先"排序。
+只有两个回答都成功时才计算相似度，缺失或调用失败的组合在报告中单独标记。
+
+字符相似度的计算量随回答长度平方增长，由进程池并行计算; 主进程按块读取回答并限制在途的任务数，
+读取的回答不会堆积在内存中。报告行本身(每对回答一行, 不含回答文本)由调用方保存,
+write_report 按差异度排序时需要全部报告行都在内存中。
+"""
+import os
+import re
+import csv
+import statistics
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from multiprocessing.context import BaseContext
+from itertools import combinations
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from .jsonl_scanner import classify_error
+
+# 计算字符相似度与差异高亮时每个回答最多取的字符数(SequenceMatcher 的耗时随长度平方增长)
+MAX_DIFF_CHARS = 5000
+# 关键词的最大长度(字符), 更长的片段视为句子而不是关键词
+MAX_KEYWORD_CHARS = 20
+# 报告中每对回答最多列出的独有关键词数
+MAX_KEYWORD_EXAMPLES = 5
+# 每个进程任务处理的 id 数
+CHUNK_SIZE = 500
+
+_TOKEN = re.compile(r'[A-Za-z0-9_]+|[一-鿿]+')
+_KEYWORD_SPLIT = re.compile(r'[，,、；;。！!？?：:\n\t（）()\[\]【】"“”\'‘’]+')
+
+# 报告的列; 每行对应一个 id 的一对回答
+REPORT_COLUMNS = (
+    'id', 'file_a', 'file_b', 'status', 'len_a', 'len_b', 'len_delta',
+    'char_similarity', 'token_similarity', 'keyword_overlap', 'divergence',
+    'keywords_only_a', 'keywords_only_b',
+)
+# (id, 文件a序号, 文件b序号, 状态, 长度a, 长度b, 长度差, 字符相似度, 词相似度, 关键词重叠, 差异度, a独有关键词, b独有关键词)
+DiffRow = Tuple[Any, int, int, str, int, int, int, Optional[float], Optional[float], Optional[float], Optional[float], str, str]
+
+
+def tokenize(text: str) -> List[str]:
+    """切分为词: 英文/数字按单词(小写), 连续的中文按相邻两字(单字的中文保留单字)"""
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        word = match.group()
+        if word[0] < '一':
+            tokens.append(word.lower())
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def extract_keywords(text: str) -> Set[str]:
+    """按标点与换行切分出的短语(小写), 过长的片段不算关键词"""
+    keywords = set()
+    for part in _KEYWORD_SPLIT.split(text):
+        part = part.strip().lower()
+        if part and len(part) <= MAX_KEYWORD_CHARS:
+            keywords.add(part)
+    return keywords
+
+
+def _jaccard(a: Any, b: Any) -> float:
+    """集合或多重集合(Counter)的 Jaccard 相似度, 两者都为空时为 1"""
+    union = a | b
+    if not union:
+        return 1.0
+    intersection = a & b
+    if isinstance(union, Counter):
+        return sum(intersection.values()) / sum(union.values())
+    return len(intersection) / len(union)
+
+
+def char_similarity(a: str, b: str) -> float:
+    """字符相似度(SequenceMatcher.ratio), 只取前 MAX_DIFF_CHARS 个字符"""
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a[:MAX_DIFF_CHARS], b[:MAX_DIFF_CHARS], autojunk=False).ratio()
+
+
+def compare_answers(a: str, b: str) -> Tuple[float, float, float, List[str], List[str]]:
+    """比较两个回答
+
+    Returns:
+        Tuple: (字符相似度, 词相似度, 关键词重叠, a独有的关键词, b独有的关键词)
+    """
+    keywords_a = extract_keywords(a)
+    keywords_b = extract_keywords(b)
+    return (
+        char_similarity(a, b),
+        _jaccard(Counter(tokenize(a)), Counter(tokenize(b))),
+        _jaccard(keywords_a, keywords_b),
+        sorted(keywords_a - keywords_b),
+        sorted(keywords_b - keywords_a),
+    )
+
+
+def diff_segments(a: str, b: str) -> Tuple[List[Tuple[str, bool]], List[Tuple[str, bool]]]:
+    """字符级的差异片段, 用于高亮显示
+
+    Returns:
+        Tuple: (a 的片段, b 的片段), 每个片段为 (文本, 是否与另一方不同);
+               超出 MAX_DIFF_CHARS 的部分不参与比较, 作为一个不高亮的片段附在末尾
+    """
+    head_a, tail_a = a[:MAX_DIFF_CHARS], a[MAX_DIFF_CHARS:]
+    head_b, tail_b = b[:MAX_DIFF_CHARS], b[MAX_DIFF_CHARS:]
+    segments_a: List[Tuple[str, bool]] = []
+    segments_b: List[Tuple[str, bool]] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, head_a, head_b, autojunk=False).get_opcodes():
+        changed = tag != 'equal'
+        if i2 > i1:
+            segments_a.append((head_a[i1:i2], changed))
+        if j2 > j1:
+            segments_b.append((head_b[j1:j2], changed))
+    if tail_a:
+        segments_a.append((tail_a, False))
+    if tail_b:
+        segments_b.append((tail_b, False))
+    return segments_a, segments_b
+
+
+def pair_status(a: Optional[str], b: Optional[str]) -> str:
+    """一对回答的状态: missing(有一方缺失) / error(有一方调用失败) / ok"""
+    if a is None or b is None:
+        return 'missing'
+    if classify_error(a) or classify_error(b):
+        return 'error'
+    return 'ok'
+
+
+def diff_pair(sample_id: Any, i: int, j: int, a: Optional[str], b: Optional[str]) -> DiffRow:
+    """计算一个 id 的一对回答(文件 i 与文件 j)的报告行"""
+    status = pair_status(a, b)
+    len_a = len(a) if a is not None else 0
+    len_b = len(b) if b is not None else 0
+    if status != 'ok':
+        return (sample_id, i, j, status, len_a, len_b, len_b - len_a, None, None, None, None, '', '')
+    char_sim, token_sim, keyword_sim, only_a, only_b = compare_answers(a, b)
+    divergence = 1.0 - (char_sim + token_sim + keyword_sim) / 3
+    return (sample_id, i, j, status, len_a, len_b, len_b - len_a,
+            round(char_sim, 4), round(token_sim, 4), round(keyword_sim, 4), round(divergence, 4),
+            '; '.join(only_a[:MAX_KEYWORD_EXAMPLES]), '; '.join(only_b[:MAX_KEYWORD_EXAMPLES]))
+
+
+def _diff_chunk(args: Tuple[List[Tuple[int, int]], List[Tuple[Any, List[Optional[str]]]]]) -> List[DiffRow]:
+    """(进程池任务) 计算一块 id 的所有回答组合"""
+    pairs, items = args
+    return [diff_pair(sample_id, i, j, answers[i], answers[j]) for sample_id, answers in items for i, j in pairs]
+
+
+def iter_diff_rows(
+    join: Any,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    mp_context: Optional[BaseContext] = None
+) -> Iterator[DiffRow]:
+    """逐块计算连接结果中每个 id 的所有回答组合(文件两两组合), 按 id 顺序返回报告行
+
+    Args:
+        join (ResultJoin): 按 id 连接的结果
+        workers (Optional[int]): 进程数, 默认为CPU核数; 为 1 时在当前进程中计算
+        chunk_size (int): 每个进程任务处理的 id 数
+        progress (Optional[Callable[[int, int], None]]): 每块完成后以 (已完成的 id 数, 总 id 数) 调用
+        should_stop (Optional[Callable[[], bool]]): 返回 True 时不再提交新的任务
+        mp_context (Optional[BaseContext]): 进程池的启动方式, 默认为平台默认值;
+            在有其他线程运行的进程(例如 GUI)中调用时应使用 'spawn'
+    """
+    pairs = list(combinations(range(len(join.sources)), 2))
+    total = len(join)
+
+    def chunks() -> Iterator[Tuple[int, List[Tuple[Any, List[Optional[str]]]]]]:
+        for start in range(0, total, chunk_size):
+            if should_stop and should_stop():
+                return
+            end = min(start + chunk_size, total)
+            yield end, [(record['id'], record['answers']) for record in (join[row] for row in range(start, end))]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for end, items in chunks():
+            yield from _diff_chunk((pairs, items))
+            if progress:
+                progress(end, total)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        pending: deque = deque()
+        for end, items in chunks():
+            pending.append((end, executor.submit(_diff_chunk, (pairs, items))))
+            # 在途的任务数有上限, 主进程读取回答的速度不会把待计算的数据堆积在内存中
+            while len(pending) > workers * 2:
+                done_end, future = pending.popleft()
+                yield from future.result()
+                if progress:
+                    progress(done_end, total)
+        while pending:
+            done_end, future = pending.popleft()
+            yield from future.result()
+            if progress:
+                progress(done_end, total)
+
+
+def divergence_by_id(rows: Any) -> Dict[str, float]:
+    """每个 id 在所有回答组合中最大的差异度(只统计两个回答都成功的组合), id 统一转为字符串"""
+    divergence: Dict[str, float] = {}
+    for row in rows:
+        value = row[10]
+        if value is None:
+            continue
+        key = str(row[0])
+        if value > divergence.get(key, -1.0):
+            divergence[key] = value
+    return divergence
+
+
+def _sort_key(row: DiffRow) -> Tuple[int, float]:
+    """差异最大的优先, 没有差异度(缺失/失败)的排在最后"""
+    return (0, -row[10]) if row[10] is not None else (1, 0.0)
+
+
+def write_report(rows: List[DiffRow], path: str, names: List[str]) -> int:
+    """将报告行按差异度从大到小写入 CSV(utf-8-sig, Excel 可直接打开)
+
+    Args:
+        rows (List[DiffRow]): 报告行
+        path (str): 输出路径
+        names (List[str]): 各个文件的名称, 替换报告行中的文件序号
+
+    Returns:
+        int: 写入的行数
+    """
+    rows = sorted(rows, key=_sort_key)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_COLUMNS)
+        for row in rows:
+            writer.writerow((row[0], names[row[1]], names[row[2]]) + tuple('' if value is None else value for value in row[3:]))
+    return len(rows)
+
+
+def read_report_divergence(path: str) -> Dict[str, float]:
+    """从 CSV 报告中读取每个 id 最大的差异度"""
+    divergence: Dict[str, float] = {}
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            if not row.get('divergence'):
+                continue
+            value = float(row['divergence'])
+            if value > divergence.get(row['id'], -1.0):
+                divergence[row['id']] = value
+    return divergence
+
+
+def _quantiles(values: array) -> Dict[str, float]:
+    if not values:
+        return {'mean': None, 'p10': None, 'p50': None, 'p90': None}
+    if len(values) == 1:
+        return {'mean': round(values[0], 4), 'p10': round(values[0], 4), 'p50': round(values[0], 4), 'p90': round(values[0], 4)}
+    deciles = statistics.quantiles(values, n=10, method='inclusive')
+    return {'mean': round(statistics.fmean(values), 4), 'p10': round(deciles[0], 4),
+            'p50': round(deciles[4], 4), 'p90': round(deciles[8], 4)}
+
+
+class DiffSummary:
+    """
+    按文件组合汇总的差异统计(相似度保存在紧凑的 array 中, 最后一次性求均值与分位数)
+    """
+    def __init__(self):
+        self.status: Dict[Tuple[int, int], Counter] = {}
+        self.identical: Counter = Counter()
+        self.char_similarity: Dict[Tuple[int, int], array] = {}
+        self.token_similarity: Dict[Tuple[int, int], array] = {}
+        self.keyword_overlap: Dict[Tuple[int, int], array] = {}
+        self.len_delta: Dict[Tuple[int, int], array] = {}
+
+    def add(self, row: DiffRow):
+        """统计一行报告"""
+        pair = (row[1], row[2])
+        self.status.setdefault(pair, Counter())[row[3]] += 1
+        if row[3] != 'ok':
+            return
+        self.char_similarity.setdefault(pair, array('d')).append(row[7])
+        self.token_similarity.setdefault(pair, array('d')).append(row[8])
+        self.keyword_overlap.setdefault(pair, array('d')).append(row[9])
+        self.len_delta.setdefault(pair, array('q')).append(row[6])
+        if row[7] == 1.0:
+            self.identical[pair] += 1
+
+    def to_dict(self, names: List[str]) -> Dict[str, Any]:
+        report = {}
+        for pair, status in sorted(self.status.items()):
+            len_delta = self.len_delta.get(pair, array('q'))
+            report[f"{names[pair[0]]} vs {names[pair[1]]}"] = {
+                'ok': status['ok'],
+                'missing': status['missing'],
+                'error': status['error'],
+                'identical': self.identical[pair],
+                'char_similarity': _quantiles(self.char_similarity.get(pair, array('d'))),
+                'token_similarity': _quantiles(self.token_similarity.get(pair, array('d'))),
+                'keyword_overlap': _quantiles(self.keyword_overlap.get(pair, array('d'))),
+                'mean_len_delta': round(statistics.fmean(len_delta), 1) if len_delta else None,
+                'mean_abs_len_delta': round(statistics.fmean(map(abs, len_delta)), 1) if len_delta else None,
+            }
+        return report
@@ -0,0 +1,268 @@
+"""
+数据集增量构建: 图像目录遍历与构建清单
+
+- walk_images: 基于 os.scandir 的递归遍历, 边遍历边返回图像文件, 不需要先列出整个目录。
+- BuildManifest: 保存在数据集旁的构建清单(a/b.jsonl -> a/b.manifest.jsonl), 记录每个已写入数据集的图像的
+  相对路径、大小、修改时间与内容哈希。再次构建时只处理新增或内容发生变化的图像, 无需重新读取整个数据集。
+
+清单为追加写入的 JSONL, 同一路径以最后一行为准。每次将数据集落盘后追加一行检查点 {"dataset_size": N},
+若构建中途崩溃, 下次构建只需读取数据集中检查点之后的部分即可恢复进度。
+"""
+import os
+import hashlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .jsonl_io import loads, iter_jsonl, read_ids, compression_suffix, JsonlWriter, _DECODE_ERRORS
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp')
+# 内容哈希只读取文件首尾各 64KB, 用于判断 mtime 变化后内容是否真的改变
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def manifest_path(dataset_path: str) -> str:
+    """根据数据集路径得到其构建清单的路径, 例如 a/b.jsonl -> a/b.manifest.jsonl"""
+    base = dataset_path
+    for suffix in ('.gz', '.zst'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return f"{os.path.splitext(base)[0]}.manifest.jsonl"
+
+
+def walk_images(
+    image_dir: str,
+    recursive: bool = True,
+    suffixes: Tuple[str, ...] = IMAGE_SUFFIXES
+) -> Iterator[Dict[str, Any]]:
+    """流式遍历图像目录
+
+    Args:
+        image_dir (str): 图像文件夹
+        recursive (bool): 是否递归遍历子文件夹
+        suffixes (Tuple[str, ...]): 图像扩展名
+
+    Yields:
+        Dict[str, Any]: {'path': 绝对路径, 'rel_path': 相对 image_dir 的路径, 'size': 字节数, 'mtime_ns': 修改时间}
+            路径均使用 / 分隔
+    """
+    root = os.path.abspath(image_dir)
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                            continue
+                        if not entry.name.lower().endswith(suffixes):
+                            continue
+                        stat = entry.stat()
+                    except OSError as e:
+                        print(f"警告: 无法读取 {entry.path}: {e}")
+                        continue
+                    yield {
+                        'path': entry.path.replace(os.sep, '/'),
+                        'rel_path': os.path.relpath(entry.path, root).replace(os.sep, '/'),
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns,
+                    }
+        except OSError as e:
+            print(f"警告: 无法遍历文件夹 {current}: {e}")
+
+
+def relative_id(rel_path: str) -> str:
+    """由相对路径得到数据 id: 去掉扩展名的相对路径, 平铺目录下即为文件名(不含扩展名)"""
+    return os.path.splitext(rel_path)[0]
+
+
+def quick_hash(path: str, size: int) -> str:
+    """计算文件的快速内容哈希(文件大小 + 首尾各 64KB)"""
+    digest = hashlib.blake2b(str(size).encode('utf-8'), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_BLOCK_SIZE))
+        if size > 2 * HASH_BLOCK_SIZE:
+            f.seek(-HASH_BLOCK_SIZE, os.SEEK_END)
+            digest.update(f.read(HASH_BLOCK_SIZE))
+        elif size > HASH_BLOCK_SIZE:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _recover_tail(dataset_path: str, offset: int) -> set:
+    """读取数据集中 offset 之后(上次检查点之后)写入的数据的 id, 并截掉末尾不完整的行"""
+    ids = set()
+    with open(dataset_path, 'rb+') as f:
+        f.seek(offset)
+        tail = f.read()
+        end = tail.rfind(b'\n') + 1
+        if end < len(tail):
+            print(f"警告: 数据集末尾存在不完整的行(上次构建可能中途退出), 已截断 {len(tail) - end} 字节")
+            f.truncate(offset + end)
+    for line in tail[:end].split(b'\n'):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except _DECODE_ERRORS:
+            continue
+        if isinstance(record, dict) and 'id' in record:
+            ids.add(record['id'])
+    return ids
+
+
+def in_dataset(entry: Dict[str, Any]) -> bool:
+    """清单条目对应的图像是否写入了数据集(无法使用或被去重的图像没有写入)"""
+    return not entry.get('invalid') and entry.get('duplicate_of') is None
+
+
+class BuildManifest:
+    """
+    数据集的构建清单
+    """
+    def __init__(self, path: str, dataset_path: str):
+        """
+        Args:
+            path (str): 清单文件路径
+            dataset_path (str): 对应的数据集文件路径
+        """
+        self.path = path
+        self.dataset_path = dataset_path
+        self.entries: Dict[str, Dict[str, Any]] = {}    # 相对路径 -> 清单条目
+        self.known_ids = set()          # 清单之外已存在于数据集中的 id(旧数据集或崩溃前写入的数据)
+        self._pending: List[Dict[str, Any]] = []
+        self._lines = 0
+        self._writer: Optional[JsonlWriter] = None
+
+    @classmethod
+    def for_dataset(cls, dataset_path: str) -> 'BuildManifest':
+        """加载数据集的构建清单, 并根据数据集的实际状态恢复进度"""
+        manifest = cls(manifest_path(dataset_path), dataset_path)
+        manifest.load()
+        return manifest
+
+    def load(self):
+        """读取清单文件, 并与数据集核对"""
+        checkpoint = None
+        if os.path.exists(self.path):
+            for line in iter_jsonl(self.path, desc="构建清单"):
+                self._lines += 1
+                if 'dataset_size' in line:
+                    checkpoint = line['dataset_size']
+                elif line.get('deleted'):
+                    self.entries.pop(line['rel_path'], None)
+                else:
+                    self.entries[line['rel_path']] = line
+
+        if not os.path.exists(self.dataset_path):
+            if self.entries:
+                print(f"数据集 {self.dataset_path} 不存在, 忽略已有的构建清单")
+            self.entries = {}
+            self._lines = 0
+            self._rewrite()
+            return
+
+        dataset_size = os.path.getsize(self.dataset_path)
+        if checkpoint is None:
+            # 清单之前构建的数据集: 读取一次全部 id
+            self.known_ids = read_ids(self.dataset_path)
+        elif dataset_size == checkpoint:
+            return
+        elif dataset_size > checkpoint and not compression_suffix(self.dataset_path):
+            self.known_ids = _recover_tail(self.dataset_path, checkpoint)
+            print(f"从上次中断处恢复: 检查点之后已写入 {len(self.known_ids)} 条数据")
+        else:
+            # 数据集在构建之外被修改过: 以数据集中实际存在的 id 为准
+            self.known_ids = read_ids(self.dataset_path)
+            self.entries = {rel: entry for rel, entry in self.entries.items() if entry.get('id') in self.known_ids}
+        self.checkpoint()
+
+    def check(self, item: Dict[str, Any]) -> str:
+        """判断图像相对于清单的状态('new', 'changed' 或 'unchanged'), item 中需包含 'id'
+
+        未变化但清单需要更新的图像(例如只是修改时间变化)会被直接记录。
+        """
+        old = self.entries.get(item['rel_path'])
+        if old is None:
+            if item['id'] in self.known_ids:
+                self.record(item)
+                return 'unchanged'
+            return 'new'
+        if old['size'] == item['size'] and old['mtime_ns'] == item['mtime_ns'] and old.get('id') == item['id']:
+            item['hash'] = old.get('hash')
+            return 'unchanged'
+
+        item['hash'] = quick_hash(item['path'], item['size'])
+        if item['hash'] == old.get('hash') and old.get('id') == item['id']:
+            self.record(item)
+            return 'unchanged'
+        # 之前无法使用或被去重的图像没有写入数据集, 变化后按新增处理
+        return 'changed' if in_dataset(old) else 'new'
+
+    def record(self, item: Dict[str, Any], invalid: bool = False, duplicate_of: Optional[str] = None):
+        """记录一个已处理的图像(在下一次 checkpoint 时写入清单)
+
+        invalid 为 True 表示图像无法使用; duplicate_of 表示图像是该 id 的近重复帧。
+        这两类图像都没有写入数据集, 文件发生变化之前不会被再次处理。
+        """
+        if not item.get('hash'):
+            item['hash'] = quick_hash(item['path'], item['size'])
+        entry = {key: item[key] for key in ('rel_path', 'size', 'mtime_ns', 'hash', 'id')}
+        if item.get('phash'):
+            entry['phash'] = item['phash']
+        if invalid:
+            entry['invalid'] = True
+        if duplicate_of is not None:
+            entry['duplicate_of'] = duplicate_of
+        self.entries[item['rel_path']] = entry
+        self._pending.append(entry)
+
+    def forget_missing(self, seen_paths: Iterable[str]) -> List[Dict[str, Any]]:
+        """从清单中移除本次遍历没有见到的(已被删除的)图像, 返回被移除的条目"""
+        seen = set(seen_paths)
+        removed = [entry for rel, entry in self.entries.items() if rel not in seen]
+        for entry in removed:
+            del self.entries[entry['rel_path']]
+            self._pending.append({'rel_path': entry['rel_path'], 'deleted': True})
+        return removed
+
+    @property
+    def ids(self) -> set:
+        """数据集中已存在的所有 id"""
+        return {entry['id'] for entry in self.entries.values() if in_dataset(entry)} | self.known_ids
+
+    def checkpoint(self, dataset_writer: Optional[JsonlWriter] = None):
+        """先将数据集落盘, 再将待写入的清单条目与数据集大小写入清单"""
+        if dataset_writer is not None:
+            dataset_writer.flush(fsync=True)
+        if self._writer is None:
+            self._writer = JsonlWriter(self.path, 'a')
+        self._writer.write_many(self._pending)
+        size = os.path.getsize(self.dataset_path) if os.path.exists(self.dataset_path) else 0
+        self._writer.write({'dataset_size': size})
+        self._writer.flush(fsync=True)
+        self._lines += len(self._pending) + 1
+        self._pending = []
+
+    def _rewrite(self):
+        """只保留有效条目, 重写清单文件"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        tmp_path = self.path + '.tmp'
+        with JsonlWriter(tmp_path) as writer:
+            writer.write_many(self.entries.values())
+            if os.path.exists(self.dataset_path):
+                writer.write({'dataset_size': os.path.getsize(self.dataset_path)})
+            writer.flush(fsync=True)
+        os.replace(tmp_path, self.path)
+        self._lines = len(self.entries) + 1
+
+    def close(self):
+        """写入最后的检查点; 清单中过时的行过多时重写清单"""
+        self.checkpoint()
+        if self._lines > 2 * len(self.entries) + 100:
+            self._rewrite()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,181 @@
+"""
+数据集/结果文件的列式(Parquet / Arrow)导出
+
+将 JSONL 数据集、call_llm_api.py 的结果文件或 SQLite 结果库按批流式转换为固定 schema 的列式文件，
+内存占用只与 batch_size 有关。分析时可以只读取需要的列(例如只读 answer 或只读 id)，
+无需像逐行解析 JSONL 那样把整条数据读入内存。
+
+目标格式由扩展名决定: .parquet 写出压缩的 Parquet, .arrow / .feather 写出不压缩的 Arrow IPC 文件(可零拷贝内存映射读取)。
+依赖 pyarrow(可选依赖): pip install pyarrow
+"""
+from typing import Any, Dict, List, Optional
+from .prompt_table import PromptTable
+from .result_store import iter_results
+from .jsonl_scanner import classify_error
+
+# 各列的名称与类型, 顺序即文件中的列顺序。新增列只能追加在末尾, 以保持 schema 稳定
+RESULT_COLUMNS = (
+    ('id', 'string'),
+    ('image', 'list<string>'),
+    ('prompt_id', 'string'),
+    ('prompt', 'string'),
+    ('answer', 'string'),
+    ('status', 'string'),           # ok / error / pending(尚未调用)
+    ('error', 'string'),
+    ('model', 'string'),
+    ('finish_reason', 'string'),
+    ('latency', 'float64'),
+    ('prompt_tokens', 'int64'),
+    ('completion_tokens', 'int64'),
+    ('total_tokens', 'int64'),
+)
+
+ARROW_SUFFIXES = ('.arrow', '.feather')
+
+
+def _require_pyarrow():
+    """导入 pyarrow, 未安装时给出安装提示"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("列式导出需要安装 pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def result_schema():
+    """返回导出文件的 pyarrow schema"""
+    pa = _require_pyarrow()
+    types = {
+        'string': pa.string(),
+        'list<string>': pa.list_(pa.string()),
+        'float64': pa.float64(),
+        'int64': pa.int64(),
+    }
+    return pa.schema([(name, types[type_name]) for name, type_name in RESULT_COLUMNS])
+
+
+def record_to_row(record: Dict[str, Any], prompt_table: PromptTable) -> Dict[str, Any]:
+    """将一条数据(标准格式或紧凑格式)展平为导出文件中的一行"""
+    conversation = record.get('conversation') or []
+    human_turn = conversation[0] if len(conversation) > 0 else {}
+    answer = conversation[1].get('value') if len(conversation) > 1 else None
+
+    prompt_ref = human_turn.get('prompt_ref')
+    if prompt_ref:
+        prompt_id = prompt_ref.get('id')
+        prompt = human_turn.get('value') or prompt_table.resolve(prompt_ref)
+    else:
+        prompt_id = None
+        prompt = human_turn.get('value')
+
+    # 回答为空的是尚未调用API的数据(例如 build_sft_dataset.py 生成的数据集), 记为 pending 而不是 error
+    pending = answer is None or answer == ''
+    error = None if pending else classify_error(answer)
+    meta = record.get('meta') or {}
+    usage = meta.get('usage') or {}
+    image = record.get('image')
+    return {
+        'id': str(record.get('id')),
+        'image': [image] if isinstance(image, str) else image,
+        'prompt_id': prompt_id,
+        'prompt': prompt,
+        'answer': answer,
+        'status': 'pending' if pending else ('error' if error else 'ok'),
+        'error': error,
+        'model': meta.get('model'),
+        'finish_reason': meta.get('finish_reason'),
+        'latency': meta.get('latency'),
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens'),
+        'total_tokens': usage.get('total_tokens'),
+    }
+
+
+class _ColumnarWriter:
+    """
+    按批写出 Parquet 或 Arrow IPC 文件
+    """
+    def __init__(self, path: str, compression: str):
+        pa = _require_pyarrow()
+        self.schema = result_schema()
+        if path.lower().endswith(ARROW_SUFFIXES):
+            # Arrow 文件不压缩, 读取时可以零拷贝地内存映射
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+        else:
+            self._sink = None
+            # 提示词、模型、状态等列重复度高, 字典编码后几乎不占空间
+            self._writer = pa.parquet.ParquetWriter(
+                path, self.schema, compression=compression,
+                use_dictionary=['prompt_id', 'prompt', 'status', 'error', 'model', 'finish_reason']
+            )
+
+    def write(self, columns: Dict[str, List[Any]]):
+        pa = _require_pyarrow()
+        self._writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def export_columnar(
+    input_file: str,
+    output_file: str,
+    batch_size: int = 50000,
+    compression: str = 'zstd'
+) -> int:
+    """将 JSONL 数据集/结果文件或 SQLite 结果库流式导出为 Parquet / Arrow 文件
+
+    Args:
+        input_file (str): 输入文件(.jsonl / .jsonl.gz / .db 等), 紧凑格式的提示词从同目录的引用表中还原
+        output_file (str): 输出文件, .parquet 或 .arrow / .feather
+        batch_size (int): 每批写出的行数(即 Parquet 的 row group 大小), 决定写出时的内存上限
+        compression (str): Parquet 的压缩算法, 如 'zstd', 'snappy', 'none'(Arrow 文件不压缩)
+
+    Returns:
+        int: 导出的行数
+    """
+    prompt_table = PromptTable.for_jsonl(input_file)
+    names = [name for name, _ in RESULT_COLUMNS]
+    writer = _ColumnarWriter(output_file, compression)
+    count = 0
+    try:
+        columns = {name: [] for name in names}
+        for record in iter_results(input_file):
+            if not isinstance(record, dict):
+                continue
+            row = record_to_row(record, prompt_table)
+            for name in names:
+                columns[name].append(row[name])
+            count += 1
+            if len(columns['id']) >= batch_size:
+                writer.write(columns)
+                columns = {name: [] for name in names}
+        if columns['id'] or count == 0:
+            writer.write(columns)
+    finally:
+        writer.close()
+    return count
+
+
+def read_columns(path: str, columns: Optional[List[str]] = None):
+    """只读取导出文件中的指定列
+
+    Parquet 按列存储, 未请求的列不会被读取和解压; Arrow 文件以内存映射方式打开, 只有被访问的列才会读入内存。
+
+    Args:
+        path (str): .parquet 或 .arrow / .feather 文件
+        columns (Optional[List[str]]): 需要读取的列, 例如 ['id', 'answer'], 默认读取全部列
+
+    Returns:
+        pyarrow.Table: 可以通过 .to_pandas() 转换为 DataFrame
+    """
+    pa = _require_pyarrow()
+    if path.lower().endswith(ARROW_SUFFIXES):
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return table.select(columns) if columns else table
+    return pa.parquet.read_table(path, columns=columns, memory_map=True)
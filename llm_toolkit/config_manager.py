@@ -33,11 +33,17 @@ class APIConfigManager:
             "api_key": os.environ.get(provider_config['api_key_env']),
             "base_url": provider_config["base_url"],
             "model": model,
-            "description": provider_config['models'][model]
+            "description": provider_config['models'][model],
+            "settings": self.get_model_settings(model)
         }
         
         return model_config
 
+    def get_model_settings(self, model):
+        """获取指定模型的运行参数(如分块推理参数), 未配置时返回空字典"""
+        model_settings = self.config.get('model_settings') or {}
+        return model_settings.get(model) or {}
+
     def list_providers(self):
         """列出所有的提供商"""
         return list(self.config['providers'].keys())
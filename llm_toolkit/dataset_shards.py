@@ -0,0 +1,227 @@
+"""
+按 id 哈希分片的数据集输出
+
+将数据集拆分为 N 个分片文件(a/b.jsonl -> a/b-00000-of-00004.jsonl, ...)，每条数据按其 id 的稳定哈希分配到固定的分片，
+并在数据集旁生成分片清单(a/b.shards.json)，记录每个分片的路径、行数与校验和。
+并行调用 API、扫描结果或训练加载数据时，每个进程各取一个分片即可，无需互相协调。
+
+同一个 id 总是落在同一个分片，数据集增量构建后重新分片时，只有内容发生变化的分片会被重写，
+其余分片文件保持不变(修改时间、校验和都不变)，下游可以据此只处理变化的分片。
+
+    python -m llm_toolkit.dataset_shards split sft_dataset.jsonl --num_shards 8
+    python -m llm_toolkit.dataset_shards verify sft_dataset.jsonl
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+from .jsonl_io import loads, open_binary, compression_suffix, _DECODE_ERRORS
+from .prompt_table import PromptTable, prompt_table_path
+
+# 重写分片时同时打开的分片文件数上限; 需要重写的分片更多时分多遍读取数据集, 避免超出文件描述符上限
+MAX_OPEN_SHARDS = 64
+
+
+def shard_of(sample_id: str, num_shards: int) -> int:
+    """根据 id 的稳定哈希(与进程、Python 版本无关)得到分片编号"""
+    digest = hashlib.blake2b(str(sample_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % num_shards
+
+
+def _split_suffix(dataset_path: str):
+    """a/b.jsonl.gz -> ('a/b', '.jsonl.gz')"""
+    suffix = compression_suffix(dataset_path)
+    base = dataset_path[:-len(suffix)] if suffix else dataset_path
+    stem, ext = os.path.splitext(base)
+    return stem, ext + suffix
+
+
+def shard_path(dataset_path: str, shard: int, num_shards: int) -> str:
+    """分片文件路径, 例如 a/b.jsonl -> a/b-00000-of-00004.jsonl(保留压缩扩展名)"""
+    stem, suffix = _split_suffix(dataset_path)
+    return f"{stem}-{shard:05d}-of-{num_shards:05d}{suffix}"
+
+
+def shard_manifest_path(dataset_path: str) -> str:
+    """分片清单路径, 例如 a/b.jsonl -> a/b.shards.json"""
+    return f"{_split_suffix(dataset_path)[0]}.shards.json"
+
+
+def load_shard_manifest(dataset_path: str) -> Optional[Dict[str, Any]]:
+    """读取数据集的分片清单, 不存在时返回None"""
+    path = shard_manifest_path(dataset_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _iter_sharded_lines(dataset_path: str, num_shards: int, report: bool = True):
+    """逐行返回 (分片编号, 原始行), 行末统一带换行符; 无法解析或没有 id 的行会被跳过(report 为 True 时报告跳过的行数)"""
+    skipped = 0
+    with open_binary(dataset_path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                sample_id = loads(line)['id']
+            except (*_DECODE_ERRORS, KeyError, TypeError):
+                skipped += 1
+                continue
+            yield shard_of(sample_id, num_shards), line if line.endswith(b'\n') else line + b'\n'
+    if skipped and report:
+        print(f"警告: {dataset_path} 中有 {skipped} 行无法解析或缺少 id, 未写入分片")
+
+
+def _rewrite_shards(dataset_path: str, num_shards: int, targets: Dict[int, str]):
+    """读取一遍数据集, 写出 targets(分片编号 -> 分片路径)中的分片
+
+    先写临时文件, 全部写完后再替换; 出错时删除已创建的临时文件。
+    """
+    tmp_paths = {shard: os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}") for shard, path in targets.items()}
+    files = {}
+    try:
+        for shard, tmp_path in tmp_paths.items():
+            files[shard] = open_binary(tmp_path, 'wb')
+        for shard, line in _iter_sharded_lines(dataset_path, num_shards, report=False):
+            f = files.get(shard)
+            if f is not None:
+                f.write(line)
+    except BaseException:
+        for f in files.values():
+            f.close()
+        for tmp_path in tmp_paths.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    for f in files.values():
+        f.close()
+    for shard, tmp_path in tmp_paths.items():
+        os.replace(tmp_path, targets[shard])
+
+
+def write_dataset_shards(dataset_path: str, num_shards: int) -> Dict[str, Any]:
+    """将数据集按 id 哈希拆分为 num_shards 个分片, 只重写内容发生变化的分片
+
+    第一遍读取数据集, 计算每个分片的行数与校验和并与已有清单比较; 随后只写出发生变化的分片,
+    每遍最多同时写 MAX_OPEN_SHARDS 个分片。
+    校验和为分片内容(解压后)的 SHA-256。
+
+    Args:
+        dataset_path (str): 数据集文件
+        num_shards (int): 分片数量
+
+    Returns:
+        Dict[str, Any]: 分片清单, 其中 'rewritten' 为本次重写的分片编号
+    """
+    if num_shards < 1:
+        raise ValueError(f"分片数量必须为正整数: {num_shards}")
+
+    # 第一遍: 统计每个分片的行数、字节数与校验和
+    digests = [hashlib.sha256() for _ in range(num_shards)]
+    rows = [0] * num_shards
+    sizes = [0] * num_shards
+    for shard, line in _iter_sharded_lines(dataset_path, num_shards):
+        digests[shard].update(line)
+        rows[shard] += 1
+        sizes[shard] += len(line)
+
+    dataset_dir = os.path.dirname(dataset_path)
+    shards = [{
+        'shard': i,
+        'path': os.path.basename(shard_path(dataset_path, i, num_shards)),
+        'rows': rows[i],
+        'bytes': sizes[i],
+        'sha256': digests[i].hexdigest(),
+    } for i in range(num_shards)]
+
+    # 与已有清单比较: 分片数量相同、校验和一致且文件仍然存在的分片不需要重写
+    old = load_shard_manifest(dataset_path)
+    old_shards = {entry['path']: entry for entry in old['shards']} if old else {}
+    rewritten = [
+        entry['shard'] for entry in shards
+        if old_shards.get(entry['path'], {}).get('sha256') != entry['sha256']
+        or not os.path.exists(os.path.join(dataset_dir, entry['path']))
+    ]
+
+    # 只写出发生变化的分片(先写临时文件再替换), 每遍最多同时打开 MAX_OPEN_SHARDS 个文件
+    for start in range(0, len(rewritten), MAX_OPEN_SHARDS):
+        targets = {shard: os.path.join(dataset_dir, shards[shard]['path']) for shard in rewritten[start:start + MAX_OPEN_SHARDS]}
+        _rewrite_shards(dataset_path, num_shards, targets)
+
+    # 紧凑格式的数据集: 每个分片旁都需要一份提示词引用表
+    prompt_table = PromptTable.for_jsonl(dataset_path)
+    if prompt_table.prompts:
+        for entry in shards:
+            table_path = prompt_table_path(os.path.join(dataset_dir, entry['path']))
+            if entry['shard'] in rewritten or not os.path.exists(table_path):
+                prompt_table.save(table_path)
+
+    # 分片数量变化后, 删除旧清单中不再使用的分片
+    current_paths = {entry['path'] for entry in shards}
+    for stale in set(old_shards) - current_paths:
+        stale_path = os.path.join(dataset_dir, stale)
+        for path in (stale_path, prompt_table_path(stale_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    manifest = {
+        'dataset': os.path.basename(dataset_path),
+        'num_shards': num_shards,
+        'partition': 'blake2b(id, digest_size=8) % num_shards',
+        'rows': sum(rows),
+        'shards': shards,
+    }
+    manifest_path = shard_manifest_path(dataset_path)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return {**manifest, 'rewritten': rewritten}
+
+
+def verify_shards(dataset_path: str) -> List[str]:
+    """按分片清单校验每个分片的行数与校验和
+
+    Returns:
+        List[str]: 校验失败的分片路径及原因, 全部通过时为空列表
+    """
+    manifest = load_shard_manifest(dataset_path)
+    if manifest is None:
+        raise FileNotFoundError(f"分片清单不存在: {shard_manifest_path(dataset_path)}")
+
+    problems = []
+    dataset_dir = os.path.dirname(dataset_path)
+    for entry in manifest['shards']:
+        path = os.path.join(dataset_dir, entry['path'])
+        if not os.path.exists(path):
+            problems.append(f"{path}: 文件不存在")
+            continue
+        digest = hashlib.sha256()
+        count = 0
+        with open_binary(path, 'rb') as f:
+            for line in f:
+                digest.update(line)
+                count += 1
+        if count != entry['rows'] or digest.hexdigest() != entry['sha256']:
+            problems.append(f"{path}: 行数或校验和与清单不一致")
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='按 id 哈希拆分数据集 / 校验分片')
+    parser.add_argument('action', choices=['split', 'verify'], help='split: 拆分数据集, verify: 按分片清单校验分片')
+    parser.add_argument('dataset', help='数据集文件')
+    parser.add_argument('--num_shards', type=int, default=8, help='分片数量(split)')
+    args = parser.parse_args()
+
+    if args.action == 'split':
+        manifest = write_dataset_shards(args.dataset, args.num_shards)
+        print(f"✅ 共 {manifest['rows']} 条数据, {manifest['num_shards']} 个分片, 本次重写 {len(manifest['rewritten'])} 个分片")
+    else:
+        problems = verify_shards(args.dataset)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print("✅ 所有分片校验通过")
@@ -0,0 +1,121 @@
+"""
+近重复图像去重
+
+视频抽帧得到的相邻帧往往几乎相同。构建数据集时按感知哈希(pHash)的汉明距离聚类，
+每一簇只保留一张代表帧调用 API，被去掉的帧与代表帧的对应关系记录在数据集旁的映射文件中
+(a/b.jsonl -> a/b.dedup.jsonl)，拿到结果后可以用 propagate_answers.py 将代表帧的回答复制给被去掉的帧。
+
+汉明距离上的近邻查询使用 BK 树: 利用三角不等式剪枝，查询阈值较小时只需访问树中的一小部分节点。
+"""
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .jsonl_io import iter_jsonl
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个哈希之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+def dedup_map_path(dataset_path: str) -> str:
+    """根据数据集路径得到其去重映射文件的路径, 例如 a/b.jsonl -> a/b.dedup.jsonl"""
+    base = dataset_path
+    for suffix in ('.gz', '.zst'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return f"{os.path.splitext(base)[0]}.dedup.jsonl"
+
+
+class BKTree:
+    """
+    以汉明距离为度量的 BK 树
+    """
+    def __init__(self):
+        # 节点: [哈希, 数据 id, {到父节点的距离: 子节点}]
+        self.root: Optional[list] = None
+        self.size = 0
+
+    def add(self, hash_value: int, sample_id: str):
+        """插入一个哈希"""
+        self.size += 1
+        node = [hash_value, sample_id, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value: int, radius: int) -> List[Tuple[int, str]]:
+        """查找距离不超过 radius 的所有哈希
+
+        Returns:
+            List[Tuple[int, str]]: [(距离, 数据 id), ...], 按距离升序排列
+        """
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= radius:
+                matches.append((distance, node[1]))
+            # 三角不等式: 只有到父节点距离在 [d - r, d + r] 内的子树可能包含结果
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        matches.sort()
+        return matches
+
+    def nearest(self, hash_value: int, radius: int) -> Optional[Tuple[int, str]]:
+        """返回距离不超过 radius 的最近的哈希, 不存在时返回None"""
+        matches = self.search(hash_value, radius)
+        return matches[0] if matches else None
+
+
+def load_dedup_map(path: str) -> Dict[str, Dict[str, Any]]:
+    """读取去重映射文件, 同一 id 以最后一行为准
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 被去掉的帧 id -> {'id', 'image', 'representative', 'distance'}
+    """
+    mapping = {}
+    if not os.path.exists(path):
+        return mapping
+    for line in iter_jsonl(path, desc="去重映射"):
+        if line.get('representative') is None:
+            mapping.pop(line['id'], None)
+        else:
+            mapping[line['id']] = line
+    return mapping
+
+
+def expand_duplicates(records: Iterator[Dict[str, Any]], mapping: Dict[str, Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """将代表帧的结果复制给被去掉的帧
+
+    Args:
+        records (Iterator[Dict[str, Any]]): 代表帧的结果
+        mapping (Dict[str, Dict[str, Any]]): load_dedup_map 的返回值
+
+    Yields:
+        Dict[str, Any]: 原结果, 以及复制出的被去掉的帧的结果(带有 'dedup_of' 字段)
+    """
+    duplicates = {}
+    for entry in mapping.values():
+        duplicates.setdefault(entry['representative'], []).append(entry)
+
+    for record in records:
+        yield record
+        for entry in duplicates.get(record.get('id'), []):
+            copied = dict(record)
+            copied['id'] = entry['id']
+            copied['image'] = [entry['image']]
+            copied['dedup_of'] = record['id']
+            copied.pop('image_meta', None)
+            yield copied
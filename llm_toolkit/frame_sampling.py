@@ -0,0 +1,65 @@
+"""
+帧序列的排序与采样
+
+多图模式下同一组图像通常是同一段视频的连续帧，组内需要按帧号排序，帧数过多时只保留其中一部分:
+- uniform: 在时间上均匀采样。
+- change:  按画面变化量采样。相邻帧的变化量取感知哈希的汉明距离(加 1 保证静止片段也有覆盖)，
+           在累计变化量上均匀取点，画面变化剧烈的片段保留更多帧，静止的片段只保留少量帧。
+首尾两帧总会被保留。
+"""
+import re
+from typing import Any, List, Optional, Sequence
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def natural_sort_key(text: str) -> List[Any]:
+    """自然排序的键: 数字部分按数值比较, 例如 frame2 排在 frame10 之前"""
+    return [int(part) if part.isdigit() else part.lower() for part in _DIGITS.split(text)]
+
+
+def sample_uniform(count: int, max_frames: int) -> List[int]:
+    """在 count 帧中均匀选出不超过 max_frames 帧, 返回升序的帧下标"""
+    if count <= max_frames:
+        return list(range(count))
+    if max_frames <= 1:
+        return [0]
+    return sorted({round(i * (count - 1) / (max_frames - 1)) for i in range(max_frames)})
+
+
+def sample_by_change(hashes: Sequence[Optional[str]], max_frames: int) -> List[int]:
+    """按画面变化量选出不超过 max_frames 帧, 返回升序的帧下标
+
+    Args:
+        hashes (Sequence[Optional[str]]): 每一帧的感知哈希(十六进制), 缺失时该帧与前一帧的变化量按 0 计
+        max_frames (int): 最多保留的帧数
+
+    Returns:
+        List[int]: 保留的帧下标
+    """
+    count = len(hashes)
+    if count <= max_frames:
+        return list(range(count))
+    if max_frames <= 1:
+        return [0]
+
+    cumulative = [0]
+    for prev, curr in zip(hashes[:-1], hashes[1:]):
+        change = bin(int(prev, 16) ^ int(curr, 16)).count('1') if prev and curr else 0
+        cumulative.append(cumulative[-1] + change + 1)
+
+    total = cumulative[-1]
+    selected = set()
+    index = 0
+    for i in range(max_frames):
+        target = i * total / (max_frames - 1)
+        while index < count - 1 and cumulative[index] < target:
+            index += 1
+        selected.add(index)
+
+    # 多个取点落在同一帧时, 用均匀采样的帧补足
+    for index in sample_uniform(count, max_frames):
+        if len(selected) >= max_frames:
+            break
+        selected.add(index)
+    return sorted(selected)
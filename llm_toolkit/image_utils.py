@@ -0,0 +1,261 @@
+"""
+图像处理工具
+
+提供大图分块(tiling)、图像校验、感知哈希、多帧拼图等与图像内容相关的处理函数，依赖 Pillow。
+"""
+import io
+import os
+import math
+import base64
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+# 文件头魔数 -> 图像格式(与 Pillow 的 Image.format 命名一致)
+_MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'BM', 'BMP'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'BMP': 'image/bmp',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """根据文件头(前 12 个字节即可)的魔数判断图像格式, 无法识别时返回None"""
+    for magic, image_format in _MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+# 感知哈希: 图像缩小到 32x32 灰度图后做 DCT, 取左上角 8x8 低频系数与其中位数比较得到 64 位哈希
+PHASH_IMAGE_SIZE = 32
+PHASH_HASH_SIZE = 8
+_PHASH_COS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * PHASH_IMAGE_SIZE)) for x in range(PHASH_IMAGE_SIZE)]
+    for u in range(PHASH_HASH_SIZE)
+]
+
+
+def phash_from_image(image: Image.Image) -> str:
+    """计算已打开图像的感知哈希(pHash), 返回 16 位十六进制字符串
+
+    只计算需要的 8x8 个低频 DCT 系数(先按行、再按列的可分离计算), 无需 numpy。
+    """
+    gray = image.convert('L').resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    rows = [pixels[y * PHASH_IMAGE_SIZE:(y + 1) * PHASH_IMAGE_SIZE] for y in range(PHASH_IMAGE_SIZE)]
+
+    # 每一行的前 8 个 DCT 系数
+    row_dct = [[sum(c * p for c, p in zip(cos_u, row)) for cos_u in _PHASH_COS] for row in rows]
+    # 再对列做 DCT, 得到 8x8 低频系数
+    coefficients = []
+    for cos_v in _PHASH_COS:
+        for u in range(PHASH_HASH_SIZE):
+            coefficients.append(sum(c * row_dct[y][u] for y, c in enumerate(cos_v)))
+
+    median = sorted(coefficients)[len(coefficients) // 2 - 1:len(coefficients) // 2 + 1]
+    median = (median[0] + median[1]) / 2
+    bits = 0
+    for value in coefficients:
+        bits = (bits << 1) | (value > median)
+    return f"{bits:016x}"
+
+
+def inspect_image(image_path: str, compute_phash: bool = False) -> Dict[str, Any]:
+    """校验图像并提取元信息: 格式按魔数判断, 并完整解码一遍以发现截断或损坏的文件
+
+    JPEG 使用 draft 模式按 1/8 尺寸解码, 熵编码数据仍会被完整读取, 但速度快得多。
+
+    Args:
+        image_path (str): 图像文件的路径
+        compute_phash (bool): 是否顺便计算感知哈希(复用已解码的图像)
+
+    Returns:
+        Dict[str, Any]: 合法图像返回 {'format', 'width', 'height', 'bytes'}(以及 'phash'),
+            否则返回 {'error': 错误信息}
+    """
+    try:
+        size = os.path.getsize(image_path)
+        if size == 0:
+            return {'error': '空文件'}
+        with open(image_path, 'rb') as f:
+            image_format = sniff_format(f.read(12))
+        if image_format is None:
+            return {'error': '无法识别的图像格式'}
+
+        with Image.open(image_path) as image:
+            width, height = image.size
+            if width <= 0 or height <= 0:
+                return {'error': f'图像尺寸不合法: {width}x{height}'}
+            if image_format == 'JPEG':
+                image.draft('RGB', (max(width // 8, PHASH_IMAGE_SIZE), max(height // 8, PHASH_IMAGE_SIZE)))
+            image.load()
+            image_hash = phash_from_image(image) if compute_phash else None
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+    meta = {'format': image_format, 'width': width, 'height': height, 'bytes': size}
+    if image_hash:
+        meta['phash'] = image_hash
+    return meta
+
+
+def inspect_images(
+    image_paths: Iterable[str],
+    executor=None,
+    chunksize: int = 16,
+    compute_phash: bool = False
+) -> List[Dict[str, Any]]:
+    """批量校验图像, 结果与输入顺序一致
+
+    Args:
+        image_paths (Iterable[str]): 图像路径
+        executor: concurrent.futures 的进程池, 为None时在当前进程中依次校验
+        chunksize (int): 每次分发给子进程的图像数
+        compute_phash (bool): 是否同时计算感知哈希
+
+    Returns:
+        List[Dict[str, Any]]: 每张图像的 inspect_image 结果
+    """
+    inspect = partial(inspect_image, compute_phash=compute_phash)
+    if executor is None:
+        return [inspect(path) for path in image_paths]
+    return list(executor.map(inspect, image_paths, chunksize=chunksize))
+
+
+def compute_tile_boxes(width: int, height: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """计算覆盖整张图像的、相互重叠的分块坐标
+
+    每个方向上以 tile_size - overlap 为步长滑动，最后一块与图像边缘对齐，
+    保证所有分块大小一致(图像本身小于 tile_size 的方向除外)。
+
+    Args:
+        width (int): 图像宽度
+        height (int): 图像高度
+        tile_size (int): 分块边长(像素)
+        overlap (int): 相邻分块的重叠像素数
+
+    Returns:
+        List[Tuple[int, int, int, int]]: 按行优先排列的 (left, upper, right, lower) 坐标
+    """
+    if tile_size <= 0 or not 0 <= overlap < tile_size:
+        raise ValueError(f"分块参数不合法: tile_size={tile_size}, overlap={overlap}")
+
+    def axis_starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    boxes = []
+    for upper in axis_starts(height):
+        for left in axis_starts(width):
+            boxes.append((left, upper, min(left + tile_size, width), min(upper + tile_size, height)))
+    return boxes
+
+
+def needs_tiling(image_path: str, tile_size: int) -> bool:
+    """判断图像是否大于分块尺寸(仅读取文件头，不解码像素)"""
+    with Image.open(image_path) as image:
+        width, height = image.size
+    return width > tile_size or height > tile_size
+
+
+def crop_tiles_to_base64(
+    image_path: str,
+    tile_size: int,
+    overlap: int,
+    jpeg_quality: int = 90
+) -> Tuple[Tuple[int, int], List[Tuple[Tuple[int, int, int, int], str]]]:
+    """将图像切分为重叠的分块，并将每个分块编码为 base64 的 JPEG
+
+    Args:
+        image_path (str): 图像文件的路径
+        tile_size (int): 分块边长(像素)
+        overlap (int): 相邻分块的重叠像素数
+        jpeg_quality (int, optional): 分块的 JPEG 编码质量
+
+    Returns:
+        Tuple: ((width, height), [(box, "data:image/jpeg;base64,..."), ...])
+    """
+    with Image.open(image_path) as image:
+        image = image.convert('RGB')
+        width, height = image.size
+
+        tiles = []
+        for box in compute_tile_boxes(width, height, tile_size, overlap):
+            buffer = io.BytesIO()
+            image.crop(box).save(buffer, format='JPEG', quality=jpeg_quality)
+            base64_string = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            tiles.append((box, f'data:image/jpeg;base64,{base64_string}'))
+
+    return (width, height), tiles
+
+
+def build_mosaic(
+    image_paths: List[str],
+    output_path: str,
+    tile_size: int = 512,
+    columns: Optional[int] = None,
+    jpeg_quality: int = 90
+) -> Dict[str, Any]:
+    """将多帧图像按行优先拼接为一张网格图, 每一格左上角标注帧序号(从 1 开始)
+
+    每帧等比缩放到 tile_size 以内并在格子中居中, 多帧只占用一张图像的输入 token。
+
+    Args:
+        image_paths (List[str]): 按时间顺序排列的帧
+        output_path (str): 输出的 JPEG 文件路径
+        tile_size (int): 每一格的边长(像素)
+        columns (Optional[int]): 列数, 默认为 ceil(sqrt(帧数))
+        jpeg_quality (int): JPEG 编码质量
+
+    Returns:
+        Dict[str, Any]: 拼图的 {'format', 'width', 'height', 'bytes', 'columns', 'rows'}
+    """
+    count = len(image_paths)
+    columns = columns or math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    canvas = Image.new('RGB', (columns * tile_size, rows * tile_size))
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default(size=max(tile_size // 12, 12))
+    padding = max(tile_size // 64, 2)
+
+    for idx, image_path in enumerate(image_paths):
+        with Image.open(image_path) as image:
+            image.draft('RGB', (tile_size, tile_size))
+            frame = image.convert('RGB')
+        frame.thumbnail((tile_size, tile_size))
+        left = (idx % columns) * tile_size
+        upper = (idx // columns) * tile_size
+        canvas.paste(frame, (left + (tile_size - frame.width) // 2, upper + (tile_size - frame.height) // 2))
+
+        label = str(idx + 1)
+        text_box = draw.textbbox((left + 2 * padding, upper + 2 * padding), label, font=font)
+        draw.rectangle((text_box[0] - padding, text_box[1] - padding, text_box[2] + padding, text_box[3] + padding), fill=(0, 0, 0))
+        draw.text((left + 2 * padding, upper + 2 * padding), label, fill=(255, 255, 0), font=font)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    canvas.save(output_path, format='JPEG', quality=jpeg_quality)
+    return {
+        'format': 'JPEG',
+        'width': canvas.width,
+        'height': canvas.height,
+        'bytes': os.path.getsize(output_path),
+        'columns': columns,
+        'rows': rows,
+    }
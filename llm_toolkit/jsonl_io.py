@@ -0,0 +1,261 @@
+"""
+JSONL 读写工具
+
+为数据集构建、API调用、结果浏览等各个环节提供统一的 JSONL 读写:
+- 流式逐行读取, 无法解析的行跳过并汇总报告(也可选择直接抛出异常)。
+- 若安装了 orjson / msgspec 则自动使用更快的 JSON 后端, 否则回退到标准库 json。
+- 批量写入, 减少系统调用次数。
+- 根据文件扩展名透明地读写 gzip(.gz) / zstd(.zst) 压缩文件。
+
+直接运行本文件可以对比当前后端与标准库逐行循环的读写吞吐量:
+    python -m llm_toolkit.jsonl_io --rows 200000
+"""
+import os
+import io
+import json
+import gzip
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 可选的高性能 JSON 后端
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_BACKEND = 'orjson'
+elif msgspec is not None:
+    JSON_BACKEND = 'msgspec'
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+else:
+    JSON_BACKEND = 'json'
+
+
+def loads(data: Any) -> Any:
+    """解析一段 JSON(bytes 或 str)"""
+    if JSON_BACKEND == 'orjson':
+        return orjson.loads(data)
+    if JSON_BACKEND == 'msgspec':
+        return _msgspec_decoder.decode(data.encode('utf-8') if isinstance(data, str) else data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """将对象编码为 UTF-8 的 JSON bytes(不转义中文, 不含换行)"""
+    if JSON_BACKEND == 'orjson':
+        return orjson.dumps(obj)
+    if JSON_BACKEND == 'msgspec':
+        return _msgspec_encoder.encode(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+# 各后端解析失败时抛出的异常类型
+_DECODE_ERRORS: Tuple[type, ...] = (ValueError, UnicodeDecodeError)
+if msgspec is not None:
+    _DECODE_ERRORS += (msgspec.DecodeError,)
+
+
+def compression_suffix(path: str) -> str:
+    """返回文件的压缩扩展名('.gz', '.zst' 或 '')"""
+    lower = path.lower()
+    for suffix in ('.gz', '.zst'):
+        if lower.endswith(suffix):
+            return suffix
+    return ''
+
+
+def open_binary(path: str, mode: str = 'rb'):
+    """以二进制方式打开文件, 根据扩展名自动处理 gzip / zstd 压缩
+
+    Args:
+        path (str): 文件路径
+        mode (str): 'rb', 'wb' 或 'ab'
+
+    Returns:
+        二进制文件对象
+    """
+    suffix = compression_suffix(path)
+    if suffix == '.gz':
+        return gzip.open(path, mode)
+    if suffix == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"读写 {path} 需要安装 zstandard: pip install zstandard")
+        if mode == 'rb':
+            # zstandard 的读取流不支持逐行迭代, 外面包一层缓冲读取器
+            return io.BufferedReader(zstandard.open(path, mode), buffer_size=1 << 20)
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+def iter_jsonl(
+    path: str,
+    on_error: str = 'skip',
+    error_log: Optional[List[Tuple[int, str]]] = None,
+    desc: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """流式读取 JSONL 文件, 逐行返回解析后的数据(空行会被忽略)
+
+    Args:
+        path (str): JSONL 文件路径(支持 .gz / .zst)
+        on_error (str): 遇到无法解析的行时的处理方式, 'skip' 跳过并报告, 'raise' 抛出异常
+        error_log (Optional[List]): 若提供, 跳过的行以 (行号, 错误信息) 追加到该列表中
+        desc (Optional[str]): 报告中显示的文件描述, 默认为文件路径
+
+    Yields:
+        Dict[str, Any]: 每一行解析后的数据
+    """
+    skipped = 0
+    with open_binary(path, 'rb') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except _DECODE_ERRORS as e:
+                if on_error == 'raise':
+                    raise ValueError(f"{path} 第 {line_no} 行无法解析: {e}") from e
+                skipped += 1
+                if error_log is not None:
+                    error_log.append((line_no, str(e)))
+                if skipped <= 5:
+                    print(f"警告: 跳过 {desc or path} 第 {line_no} 行无法解析的 JSON: {line[:50]!r}...")
+
+    if skipped > 5:
+        print(f"警告: {desc or path} 中共跳过 {skipped} 行无法解析的 JSON")
+
+
+def read_ids(path: str, key: str = 'id') -> set:
+    """读取 JSONL 文件中所有数据的 id, 文件不存在时返回空集合"""
+    ids = set()
+    if not os.path.exists(path):
+        return ids
+    for record in iter_jsonl(path):
+        if isinstance(record, dict) and key in record:
+            ids.add(record[key])
+    return ids
+
+
+class JsonlWriter:
+    """
+    批量写入 JSONL 文件: 编码后的行先放入缓冲区, 达到 batch_size 行或调用 flush() 时一次性写入
+    """
+    def __init__(self, path: str, mode: str = 'w', batch_size: int = 1000):
+        """
+        Args:
+            path (str): JSONL 文件路径(支持 .gz / .zst)
+            mode (str): 'w' 覆盖写入, 'a' 追加写入
+            batch_size (int): 缓冲的最大行数
+        """
+        if mode not in ('w', 'a'):
+            raise ValueError(f"不支持的写入模式: {mode}")
+        self.path = path
+        self.batch_size = batch_size
+        self._file = open_binary(path, mode + 'b')
+        self._buffer: List[bytes] = []
+        self.count = 0
+
+    def write(self, record: Any):
+        """写入一条数据"""
+        self._buffer.append(dumps(record))
+        self.count += 1
+        if len(self._buffer) >= self.batch_size:
+            self._write_buffer()
+
+    def write_many(self, records):
+        """写入多条数据"""
+        for record in records:
+            self.write(record)
+
+    def _write_buffer(self):
+        if self._buffer:
+            self._buffer.append(b'')
+            self._file.write(b'\n'.join(self._buffer))
+            self._buffer = []
+
+    def flush(self, fsync: bool = False):
+        """将缓冲区写入文件; fsync 为 True 时同时确保数据落盘"""
+        self._write_buffer()
+        self._file.flush()
+        if fsync and hasattr(self._file, 'fileno'):
+            try:
+                os.fsync(self._file.fileno())
+            except (OSError, io.UnsupportedOperation):
+                pass
+
+    def close(self):
+        """写入剩余数据并关闭文件"""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _benchmark(rows: int):
+    """对比标准库逐行循环与本模块的读写吞吐量"""
+    import time
+    import tempfile
+
+    record = {
+        'id': 'DJI_20230825114347_0642_resized_cropped_3501_2470_JPG.rf.7ca9ff72cf035e2d862a4d9ca9adbccb',
+        'image': ['D:/Github/myllm/dataset/drone_in_day/JPEGImages/1_frame0195.jpg'],
+        'conversation': [
+            {'from': 'human', 'value': '<image>\n\n你是一个专注于识别非法采矿活动的AI安全分析师。' * 8},
+            {'from': 'assistant', 'value': '该影像呈现一处位于林地边缘的剧烈地貌扰动区，高度疑似非法采矿作业现场。' * 12}
+        ]
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for suffix in ('.jsonl', '.jsonl.gz'):
+            baseline_path = os.path.join(tmp_dir, 'baseline' + suffix)
+            toolkit_path = os.path.join(tmp_dir, 'toolkit' + suffix)
+
+            start = time.perf_counter()
+            opener = gzip.open if suffix.endswith('.gz') else open
+            with opener(baseline_path, 'wt', encoding='utf-8') as f_out:
+                for i in range(rows):
+                    record['id'] = str(i)
+                    f_out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    f_out.flush()
+            baseline_write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with JsonlWriter(toolkit_path) as writer:
+                for i in range(rows):
+                    record['id'] = str(i)
+                    writer.write(record)
+            toolkit_write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with opener(baseline_path, 'rt', encoding='utf-8') as f_in:
+                baseline_count = sum(1 for line in f_in if json.loads(line))
+            baseline_read = time.perf_counter() - start
+
+            start = time.perf_counter()
+            toolkit_count = sum(1 for _ in iter_jsonl(toolkit_path))
+            toolkit_read = time.perf_counter() - start
+            assert baseline_count == toolkit_count == rows
+
+            size_mb = os.path.getsize(toolkit_path) / 1024 / 1024
+            print(f"[{suffix}] {rows} 行, {size_mb:.1f} MB, 后端: {JSON_BACKEND}")
+            print(f"    写入: 标准库逐行 {rows / baseline_write:,.0f} 行/s -> 批量写入 {rows / toolkit_write:,.0f} 行/s")
+            print(f"    读取: 标准库逐行 {rows / baseline_read:,.0f} 行/s -> iter_jsonl {rows / toolkit_read:,.0f} 行/s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='JSONL 读写吞吐量测试')
+    parser.add_argument('--rows', type=int, default=100000, help='测试的行数')
+    _benchmark(parser.parse_args().rows)
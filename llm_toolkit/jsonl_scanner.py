@@ -0,0 +1,252 @@
+"""
+大规模 JSONL 结果文件的并行扫描统计
+
+将文件按字节切分为若干以换行符对齐的区间，由进程池并行解析各区间，
+每个进程只返回可合并的部分统计量(ResultStats)，最后在主进程中合并。
+压缩文件(.gz / .zst)无法按字节随机定位，退化为单进程顺序扫描。
+
+统计内容: 调用失败率及失败类别、回答长度分布、各模型的耗时分布、重复 id。
+"""
+import os
+import re
+import hashlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .jsonl_io import loads, open_binary, compression_suffix, _DECODE_ERRORS
+
+# 回答长度(字符数)直方图的分箱边界
+LENGTH_BINS = (0, 100, 200, 300, 500, 800, 1000, 1500, 2000)
+# 耗时统计的分桶精度(秒)
+LATENCY_RESOLUTION = 0.1
+# 最多保留的重复 id 示例数
+MAX_DUPLICATE_EXAMPLES = 20
+
+_API_ERROR_CODE = re.compile(r'Error code: (\d+)')
+
+
+def classify_error(answer: Any) -> Optional[str]:
+    """将 call_llm_api.py 写入的 'ERROR: ...' 回复归类, 成功的回复返回None"""
+    if not isinstance(answer, str) or not answer:
+        return 'Empty answer'
+    if not answer.startswith('ERROR'):
+        return None
+    detail = answer[len('ERROR'):].lstrip(': ')
+    if detail.startswith('APIError'):
+        match = _API_ERROR_CODE.search(detail)
+        return f"APIError {match.group(1)}" if match else 'APIError'
+    if detail.startswith('Exception'):
+        return 'Exception'
+    if detail.startswith('Truncated'):
+        return 'Truncated'
+    return detail[:40] or 'ERROR'
+
+
+def _id_hash(sample_id: Any) -> int:
+    """将 id 映射为 64 位整数, 降低跨进程传递和合并 id 集合的开销"""
+    digest = hashlib.blake2b(str(sample_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _percentile(buckets: Counter, q: float) -> float:
+    """根据分桶计数求分位数"""
+    total = sum(buckets.values())
+    if total == 0:
+        return 0.0
+    target = q * total
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= target:
+            return bucket * LATENCY_RESOLUTION
+    return max(buckets) * LATENCY_RESOLUTION
+
+
+class ResultStats:
+    """
+    可合并的结果文件统计量
+    """
+    def __init__(self):
+        self.total = 0
+        self.corrupt = 0
+        self.missing_id = 0
+        self.errors = Counter()
+        self.length_hist = Counter()
+        self.answer_chars = 0
+        self.latency = {}               # 模型 -> Counter(耗时分桶)
+        self.id_hashes = set()
+        self.duplicates = 0
+        self.duplicate_examples: List[str] = []
+
+    def add(self, record: Any):
+        """统计一条数据"""
+        self.total += 1
+        if not isinstance(record, dict):
+            self.corrupt += 1
+            return
+
+        sample_id = record.get('id')
+        if sample_id is None:
+            self.missing_id += 1
+        else:
+            id_hash = _id_hash(sample_id)
+            if id_hash in self.id_hashes:
+                self.duplicates += 1
+                if len(self.duplicate_examples) < MAX_DUPLICATE_EXAMPLES:
+                    self.duplicate_examples.append(str(sample_id))
+            else:
+                self.id_hashes.add(id_hash)
+
+        try:
+            answer = record['conversation'][1]['value']
+        except (KeyError, IndexError, TypeError):
+            answer = None
+        error_class = classify_error(answer)
+        if error_class:
+            self.errors[error_class] += 1
+        else:
+            length = len(answer)
+            self.answer_chars += length
+            bin_idx = sum(1 for edge in LENGTH_BINS if length >= edge) - 1
+            self.length_hist[bin_idx] += 1
+
+        meta = record.get('meta')
+        if isinstance(meta, dict) and isinstance(meta.get('latency'), (int, float)):
+            model = meta.get('model', 'unknown')
+            self.latency.setdefault(model, Counter())[int(meta['latency'] / LATENCY_RESOLUTION)] += 1
+
+    def merge(self, other: 'ResultStats'):
+        """合并另一个区间的统计量(跨区间的重复 id 也会被计入)"""
+        self.total += other.total
+        self.corrupt += other.corrupt
+        self.missing_id += other.missing_id
+        self.errors.update(other.errors)
+        self.length_hist.update(other.length_hist)
+        self.answer_chars += other.answer_chars
+        for model, buckets in other.latency.items():
+            self.latency.setdefault(model, Counter()).update(buckets)
+
+        overlap = len(self.id_hashes & other.id_hashes)
+        self.duplicates += other.duplicates + overlap
+        self.id_hashes |= other.id_hashes
+        room = MAX_DUPLICATE_EXAMPLES - len(self.duplicate_examples)
+        self.duplicate_examples.extend(other.duplicate_examples[:max(room, 0)])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """生成可序列化的统计报告"""
+        answered = sum(self.length_hist.values())
+        failed = sum(self.errors.values())
+        length_hist = {}
+        for idx, edge in enumerate(LENGTH_BINS):
+            label = f"{edge}-{LENGTH_BINS[idx + 1]}" if idx + 1 < len(LENGTH_BINS) else f"{edge}+"
+            length_hist[label] = self.length_hist.get(idx, 0)
+
+        latency = {}
+        for model, buckets in sorted(self.latency.items()):
+            count = sum(buckets.values())
+            latency[model] = {
+                'count': count,
+                'mean': round(sum(bucket * LATENCY_RESOLUTION * n for bucket, n in buckets.items()) / count, 2),
+                'p50': round(_percentile(buckets, 0.5), 2),
+                'p95': round(_percentile(buckets, 0.95), 2),
+                'max': round(max(buckets) * LATENCY_RESOLUTION, 2),
+            }
+
+        return {
+            'total': self.total,
+            'corrupt': self.corrupt,
+            'missing_id': self.missing_id,
+            'unique_ids': len(self.id_hashes),
+            'duplicates': self.duplicates,
+            'duplicate_examples': self.duplicate_examples,
+            'answered': answered,
+            'failed': failed,
+            'error_rate': round(failed / (answered + failed), 4) if answered + failed else 0.0,
+            'errors': dict(self.errors.most_common()),
+            'mean_answer_chars': round(self.answer_chars / answered, 1) if answered else 0.0,
+            'answer_length_hist': length_hist,
+            'latency': latency,
+        }
+
+
+def split_byte_ranges(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """将文件切分为以换行符对齐的字节区间, 每个区间都从一行的开头开始、在一行的结尾结束
+
+    Args:
+        path (str): 未压缩的 JSONL 文件
+        chunk_size (int): 每个区间的目标大小(字节)
+
+    Returns:
+        List[Tuple[int, int]]: [(start, end), ...], 区间左闭右开且首尾相接
+    """
+    file_size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        position = chunk_size
+        while position < file_size:
+            f.seek(position)
+            f.readline()                # 跳到下一行的开头
+            aligned = f.tell()
+            if aligned >= file_size:
+                break
+            if aligned > boundaries[-1]:
+                boundaries.append(aligned)
+            position = aligned + chunk_size
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+
+def _scan_range(task: Tuple[str, int, int]) -> ResultStats:
+    """(子进程) 扫描一个字节区间"""
+    path, start, end = task
+    stats = ResultStats()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for line in data.split(b'\n'):
+        if not line.strip():
+            continue
+        try:
+            stats.add(loads(line))
+        except _DECODE_ERRORS:
+            stats.total += 1
+            stats.corrupt += 1
+    return stats
+
+
+def scan_jsonl(path: str, workers: Optional[int] = None, chunk_size_mb: int = 64) -> ResultStats:
+    """并行扫描 JSONL 结果文件并返回合并后的统计量
+
+    Args:
+        path (str): JSONL 文件路径
+        workers (Optional[int]): 进程数, 默认为CPU核数
+        chunk_size_mb (int): 每个区间的大小(MB), 同时决定了每个进程单次读入内存的数据量
+
+    Returns:
+        ResultStats: 统计量
+    """
+    if compression_suffix(path):
+        stats = ResultStats()
+        with open_binary(path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    stats.add(loads(line))
+                except _DECODE_ERRORS:
+                    stats.total += 1
+                    stats.corrupt += 1
+        return stats
+
+    ranges = split_byte_ranges(path, chunk_size_mb * 1024 * 1024)
+    workers = workers or os.cpu_count() or 1
+    stats = ResultStats()
+    if workers == 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            stats.merge(_scan_range((path, start, end)))
+        return stats
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        for partial in executor.map(_scan_range, [(path, start, end) for start, end in ranges]):
+            stats.merge(partial)
+    return stats
@@ -0,0 +1,288 @@
+"""
+JSONL 文件的行偏移索引
+
+对内存映射的 JSONL 文件建立"第 i 行 -> 字节偏移量"的索引，按需解析单行，不必把整个文件读入内存。
+索引缓存在文件旁(a/b.jsonl -> a/b.jsonl.lineidx)，文件未变化时直接加载；文件只是追加了新行时只为新增部分建立索引。
+只索引以换行符结尾的完整行，正在被写入的最后一行会在写完后的下一次 refresh 中加入。
+
+    index = LineIndex('results.jsonl')
+    len(index), index[12345], index.find_id('img_001')
+
+缓存文件格式(小端序): 文件头 [8s 魔数][u64 文件大小][u64 修改时间][u64 已索引的字节数][u64 行数][16s 已索引部分首尾的摘要]，
+随后为每行的 u64 偏移量。
+"""
+import os
+import re
+import mmap
+import json
+import struct
+import hashlib
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, compress, repeat
+from operator import add
+from typing import Any, Dict, List, Optional
+from .jsonl_io import loads, dumps, compression_suffix
+
+INDEX_MAGIC = b'MLLMIDX2'
+# 行首的 "id" 字段(call_llm_api.py 写出的数据 id 总在第一个), 匹配时只解析 id 的值
+_LEADING_ID = re.compile(rb'\{[ \t]*"id"[ \t]*:[ \t]*("(?:[^"\\\n]|\\.)*"|-?\d+)[ \t]*[,}]')
+# 批量提取 id 时每次处理的行数
+ID_BATCH_ROWS = 100000
+_HEADER = struct.Struct('<8sQQQQ16s')
+# 建立索引时每次扫描的字节数
+SCAN_CHUNK_SIZE = 16 * 1024 * 1024
+# 判断文件是否被原地改写时, 校验已索引部分开头与末尾各多少字节
+EDGE_CHECK_BYTES = 4096
+
+
+def line_index_path(path: str) -> str:
+    """索引缓存文件路径, 例如 a/b.jsonl -> a/b.jsonl.lineidx"""
+    return f"{path}.lineidx"
+
+
+def is_indexable(path: str) -> bool:
+    """能否建立行偏移索引: 只支持未压缩的 JSONL 文件"""
+    return os.path.isfile(path) and not compression_suffix(path) and path.lower().endswith('.jsonl')
+
+
+class LineIndex:
+    """
+    内存映射的 JSONL 文件, 支持 len()、按行号取出解析后的数据与按 id 查找
+    """
+    def __init__(self, path: str, use_cache: bool = True):
+        """
+        Args:
+            path (str): JSONL 文件路径(不支持压缩文件)
+            use_cache (bool): 是否读写文件旁的索引缓存
+        """
+        self.path = path
+        self.use_cache = use_cache
+        self.offsets = array('Q')       # 每个非空行的起始偏移量
+        self.indexed_end = 0            # 已建立索引的字节数(最后一个完整行之后的位置)
+        self.generation = 0             # 文件被截断、替换或改写, 索引重建的次数(行号因此失效)
+        self._file = open(path, 'rb')
+        self._mmap: Optional[mmap.mmap] = None
+        self._size = 0
+        self._edge_digest = b''         # 已索引部分开头与末尾的摘要, 用于发现原地改写
+        if not (use_cache and self._load_cache()):
+            self.refresh()
+
+    def _map(self):
+        """按当前文件大小重新建立内存映射
+
+        旧的映射不主动关闭: 后台线程(例如建立检索索引)可能仍在读取, 由引用计数释放。
+        """
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size > 0 else None
+
+    def _load_cache(self) -> bool:
+        """加载索引缓存, 缓存与文件不一致时返回False"""
+        cache_path = line_index_path(self.path)
+        try:
+            with open(cache_path, 'rb') as f:
+                magic, size, mtime_ns, indexed_end, count, edge_digest = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != INDEX_MAGIC:
+                    return False
+                stat = os.stat(self.path)
+                if stat.st_size < size or (stat.st_size == size and stat.st_mtime_ns != mtime_ns):
+                    return False        # 文件被截断或原地修改, 需要重建
+                offsets = array('Q')
+                offsets.frombytes(f.read(count * offsets.itemsize))
+                if len(offsets) != count:
+                    return False
+        except (OSError, struct.error):
+            return False
+
+        self._map()
+        self.offsets = offsets
+        self.indexed_end = indexed_end
+        self._edge_digest = edge_digest if indexed_end else b''
+        # 文件只是追加了新行: 已索引的部分应当保持不变
+        if self._rewritten():
+            self.offsets = array('Q')
+            self.indexed_end = 0
+            self._edge_digest = b''
+            return False
+        if self._size > size:
+            self.refresh()
+        return True
+
+    def _indexed_edges_digest(self) -> bytes:
+        """已索引部分开头与末尾 EDGE_CHECK_BYTES 字节的摘要"""
+        if self._mmap is None or self.indexed_end == 0:
+            return b''
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self._mmap[:min(EDGE_CHECK_BYTES, self.indexed_end)])
+        digest.update(self._mmap[max(0, self.indexed_end - EDGE_CHECK_BYTES):self.indexed_end])
+        return digest.digest()
+
+    def _replaced(self) -> bool:
+        """路径是否已指向另一个文件(例如 retry_errors.py 用 os.replace 原子替换了结果文件)"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False                # 替换过程中文件暂时不存在, 下次再检查
+        opened = os.fstat(self._file.fileno())
+        return (stat.st_dev, stat.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def _rewritten(self) -> bool:
+        """已索引的部分是否被截断或原地改写(追加写入不会改变已索引的内容)"""
+        if self.indexed_end == 0:
+            return False
+        if self._size < self.indexed_end or self._mmap[self.indexed_end - 1:self.indexed_end] != b'\n':
+            return True
+        return self._indexed_edges_digest() != self._edge_digest
+
+    def _save_cache(self):
+        """保存索引缓存, 文件所在目录不可写时忽略"""
+        if not self.use_cache:
+            return
+        cache_path = line_index_path(self.path)
+        tmp_path = f"{cache_path}.tmp"
+        try:
+            stat = os.stat(self.path)
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(INDEX_MAGIC, self._size, stat.st_mtime_ns, self.indexed_end, len(self.offsets), self._edge_digest))
+                self.offsets.tofile(f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"警告: 无法保存行索引缓存 {cache_path}: {e}")
+
+    def refresh(self) -> int:
+        """为文件中新增的完整行建立索引; 文件被替换、截断或原地改写时重建(generation 加一)
+
+        Returns:
+            int: 新增的行数(重建时为重建后的行数)
+        """
+        reset = False
+        if self._replaced():
+            # 旧的内存映射仍指向原文件, 不关闭(见 _map); 重新打开路径上的新文件
+            self._file.close()
+            self._file = open(self.path, 'rb')
+            reset = True
+        self._map()
+        if reset or self._rewritten():
+            self.offsets = array('Q')
+            self.indexed_end = 0
+            self._edge_digest = b''
+            self.generation += 1
+            reset = True
+        if self._mmap is None or self._size == self.indexed_end:
+            if reset:
+                self._save_cache()
+            return 0
+
+        before = len(self.offsets)
+        previous_end = self.indexed_end
+        position = self.indexed_end
+        while position < self._size:
+            end = min(position + SCAN_CHUNK_SIZE, self._size)
+            chunk = self._mmap[position:end]
+            last_newline = chunk.rfind(b'\n')
+            if last_newline < 0:
+                if end == self._size:
+                    break               # 只剩下未写完的最后一行
+                # 单行超过一个扫描块, 找到这一行的结尾
+                last_newline = self._mmap.find(b'\n', end) - position
+                if last_newline < 0:
+                    break
+                chunk = self._mmap[position:position + last_newline + 1]
+            # 逐行的起始偏移量由行长度累加得到, 空行被过滤掉(循环均在 C 层完成)
+            lines = chunk[:last_newline].split(b'\n')
+            starts = accumulate(map(add, map(len, lines), repeat(1)), initial=position)
+            self.offsets.extend(compress(starts, map(bytes.strip, lines)))
+            position += last_newline + 1
+        self.indexed_end = position
+        self._edge_digest = self._indexed_edges_digest()
+
+        if reset or self.indexed_end != previous_end:
+            self._save_cache()
+        return len(self.offsets) - before
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, i: int) -> bytes:
+        """第 i 行的原始内容(不含换行符)"""
+        start = self.offsets[i]
+        end = self._mmap.find(b'\n', start, self.indexed_end)
+        return self._mmap[start:end]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        """第 i 行解析后的数据, 无法解析时抛出 ValueError"""
+        try:
+            return loads(self.line(i))
+        except ValueError as e:
+            raise ValueError(f"第 {i + 1} 条数据无法解析: {e}") from e
+
+    def record_id(self, i: int) -> Any:
+        """第 i 行数据的 id(没有时返回None), 无法解析时抛出 ValueError
+
+        id 是第一个字段时只解析 id 的值, 不必解析整行。
+        """
+        line = self.line(i)
+        match = _LEADING_ID.match(line)
+        if match:
+            return loads(match.group(1))
+        record = self[i]
+        return record.get('id') if isinstance(record, dict) else None
+
+    def record_ids(self, start: int = 0) -> List[Any]:
+        """第 start 行起所有数据的 id, 无法取得 id 的行为None
+
+        直接在内存映射上从每行的起始位置匹配行首的 id(不读取行的其余部分), 每块的 id 一次解析,
+        比逐行调用 record_id 快得多; id 不在第一个字段的行退回解析整行。
+        """
+        match = _LEADING_ID.match
+        ids: List[Any] = []
+        for block_start in range(start, len(self.offsets), ID_BATCH_ROWS):
+            block_end = min(block_start + ID_BATCH_ROWS, len(self.offsets))
+            matches = [match(self._mmap, offset) for offset in self.offsets[block_start:block_end]]
+            if all(matches):
+                ids.extend(loads(b'[' + b','.join([m.group(1) for m in matches]) + b']'))
+                continue
+            for i, m in enumerate(matches, block_start):
+                try:
+                    ids.append(loads(m.group(1)) if m else self.record_id(i))
+                except ValueError:
+                    ids.append(None)
+        return ids
+
+    def line_number_at(self, offset: int) -> int:
+        """字节偏移量所在行的行号(索引中的序号)"""
+        return bisect_right(self.offsets, offset) - 1
+
+    def find_id(self, sample_id: Any, key: str = 'id') -> Optional[int]:
+        """按 id 查找数据的行号, 不存在时返回None
+
+        直接在内存映射上用正则搜索 "id": <值>，兼容紧凑(orjson)与带空格(json 标准库)两种格式、
+        中文原样与 \\uXXXX 转义两种写法; 命中后解析该行确认是顶层的 id 字段(嵌套对象中也可能有同名字段)。
+        """
+        if self._mmap is None:
+            return None
+        encodings = {dumps(sample_id), json.dumps(sample_id).encode('utf-8')}
+        value_pattern = b'|'.join(re.escape(encoded) for encoded in encodings)
+        pattern = re.compile(b'"' + re.escape(key.encode('utf-8')) + rb'"\s*:\s*(?:' + value_pattern + rb')\s*[,}]')
+        for match in pattern.finditer(self._mmap, 0, self.indexed_end):
+            i = self.line_number_at(match.start())
+            if i < 0:
+                continue
+            try:
+                if self[i].get(key) == sample_id:
+                    return i
+            except (ValueError, AttributeError):
+                continue
+        return None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,251 @@
+"""
+成对的 LLM 评判(LLM-as-judge)
+
+对按 id 连接(result_join.ResultJoin)的多个结果文件，逐个 id、逐对文件构造评判任务:
+评判模型看到原始图像、原始问题与两个回答，判断哪个回答更好(或平局)。
+- 位置随机化: 两个回答的先后顺序由 (seed, id, 文件对) 决定的随机数打乱，抵消评判模型偏向第一个(或第二个)回答的倾向;
+  同一组参数下顺序固定，断点续跑时不会变化。
+- 只有两个回答都成功时才评判，缺失或调用失败的组合计入跳过数。
+- 汇总: 各文件组合的胜/负/平，各文件的总体胜率(平局计半场)，以及评判模型选择第一个位置的比例(位置偏好)。
+
+评判结果为 JSONL，每行对应一个 id 的一对回答，以 (id, 文件a, 文件b) 为键断点续跑:
+    {"id": ..., "models": [a, b], "swapped": false, "verdict": "A", "winner": a, "judgement": "...", "meta": {...}}
+其中 verdict 是评判模型给出的位置(A 为先展示的回答)，winner 是换算回文件名后的胜者("tie" 为平局, None 为评判失败)。
+"""
+import os
+import re
+import random
+from collections import Counter
+from itertools import combinations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .jsonl_io import iter_jsonl
+from .prompt_table import PromptTable
+from .result_join import ResultJoin, answer_of, join_key
+from .answer_diff import pair_status
+
+TIE = 'tie'
+
+# 评判提示词, 两个回答按展示顺序填入
+JUDGE_PROMPT = """你是一名严格、公正的多模态回答评审员。请根据上面的图像与下面的原始问题，比较两个AI助手的回答质量。
+
+【原始问题】
+{question}
+
+【回答A】
+{answer_a}
+
+【回答B】
+{answer_b}
+
+评判标准(按重要性排序)：
+1. 准确性：回答中描述的内容是否与图像实际可见的内容一致，有无臆造或错误；
+2. 完整性：是否覆盖了问题要求的各个方面；
+3. 遵循指令：是否满足问题中的格式、字数等要求；
+4. 表达：是否清晰、有条理。
+不要因为回答的先后顺序或长度产生偏好，更长的回答不一定更好。
+
+请先简要说明理由，最后单独一行输出结论，格式为"最终结论：A"、"最终结论：B"或"最终结论：平局"。"""
+
+_VERDICT = re.compile(r'最终结论\s*[:：]\s*\**\s*(A|B|平局|tie)\b', re.IGNORECASE)
+
+# 一个评判任务的键: (str(id), 文件a, 文件b), 文件按命令行中的顺序排列
+JudgeKey = Tuple[str, str, str]
+
+
+def judge_key(sample_id: Any, name_a: str, name_b: str) -> JudgeKey:
+    return (join_key(sample_id), name_a, name_b)
+
+
+def is_swapped(seed: int, sample_id: Any, name_a: str, name_b: str) -> bool:
+    """是否交换两个回答的展示顺序(由 seed、id 与文件对决定, 与运行次数和并发顺序无关)"""
+    return random.Random(f"{seed}|{sample_id}|{name_a}|{name_b}").random() < 0.5
+
+
+def question_of(record: Dict[str, Any], prompt_table: PromptTable) -> Optional[str]:
+    """一条结果中的原始问题(去掉 <image> 占位符), 紧凑格式的数据从引用表中还原"""
+    try:
+        human_turn = record['conversation'][0]
+        if 'value' not in human_turn:
+            human_turn = dict(human_turn, value=prompt_table.resolve(human_turn['prompt_ref']))
+        return human_turn['value'].replace('<image>', '').strip()
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def build_judge_text(question: str, answer_a: str, answer_b: str) -> str:
+    """评判请求的文本部分(图像在文本之前单独发送)"""
+    return JUDGE_PROMPT.format(question=question, answer_a=answer_a, answer_b=answer_b)
+
+
+def parse_verdict(text: str) -> Optional[str]:
+    """从评判回复中解析结论: 'A' / 'B' / 'tie', 无法解析时返回None(有多个结论时以最后一个为准)"""
+    matches = _VERDICT.findall(text or '')
+    if not matches:
+        return None
+    verdict = matches[-1]
+    if verdict == '平局' or verdict.lower() == TIE:
+        return TIE
+    return verdict.upper()
+
+
+def verdict_winner(verdict: Optional[str], swapped: bool, names: List[str]) -> Optional[str]:
+    """将展示位置上的结论换算为胜者的文件名, 平局返回 'tie', 评判失败返回None"""
+    if verdict is None or verdict == TIE:
+        return verdict
+    first, second = (names[1], names[0]) if swapped else (names[0], names[1])
+    return first if verdict == 'A' else second
+
+
+def iter_judge_tasks(
+    join: ResultJoin,
+    done: Optional[set] = None,
+    seed: int = 0,
+    skipped: Optional[Counter] = None
+) -> Iterator[Dict[str, Any]]:
+    """按 id 顺序生成评判任务(同一 id 的各个文件对相邻, 便于复用编码后的图像)
+
+    Args:
+        join (ResultJoin): 按 id 连接的结果文件
+        done (Optional[set]): 已完成的任务键, 跳过
+        seed (int): 位置随机化的种子
+        skipped (Optional[Counter]): 若提供, 按原因('done' / 'missing' / 'error' / 'no_question')累计跳过的任务数
+
+    Yields:
+        Dict[str, Any]: {'id', 'image', 'question', 'models': [a, b], 'swapped', 'answers': [先展示的, 后展示的]}
+    """
+    done = done or set()
+    skipped = skipped if skipped is not None else Counter()
+    names = [source.name for source in join.sources]
+    prompt_tables = [PromptTable.for_jsonl(source.path) for source in join.sources]
+    pairs = list(combinations(range(len(names)), 2))
+
+    for sample_id in join.ids:
+        pending = [(i, j) for i, j in pairs if judge_key(sample_id, names[i], names[j]) not in done]
+        skipped['done'] += len(pairs) - len(pending)
+        if not pending:
+            continue
+
+        records: List[Optional[Dict[str, Any]]] = []
+        for source in join.sources:
+            try:
+                records.append(source.get(sample_id))
+            except ValueError:
+                records.append({})     # 无法解析的行, answer_of 会将其归为失败
+        answers = [answer_of(record) if record is not None else None for record in records]
+        display_id, image, question = None, None, None
+        for record, prompt_table in zip(records, prompt_tables):
+            if record:
+                display_id = record.get('id') if display_id is None else display_id
+                image = image or record.get('image')
+                question = question or question_of(record, prompt_table)
+
+        for i, j in pending:
+            status = pair_status(answers[i], answers[j])
+            if status != 'ok':
+                skipped[status] += 1
+                continue
+            if question is None:
+                skipped['no_question'] += 1
+                continue
+            swapped = is_swapped(seed, sample_id, names[i], names[j])
+            shown = [answers[j], answers[i]] if swapped else [answers[i], answers[j]]
+            yield {
+                'id': sample_id if display_id is None else display_id,
+                'image': [image] if isinstance(image, str) else (image or []),
+                'question': question,
+                'models': [names[i], names[j]],
+                'swapped': swapped,
+                'answers': shown,
+            }
+
+
+def read_judgements(path: str) -> Dict[JudgeKey, Dict[str, Any]]:
+    """读取已有的评判结果(同一任务以最后一条为准), 文件不存在时返回空字典"""
+    judgements = {}
+    if not os.path.exists(path):
+        return judgements
+    for record in iter_jsonl(path, desc="评判结果"):
+        try:
+            name_a, name_b = record['models']
+            judgements[judge_key(record['id'], name_a, name_b)] = record
+        except (KeyError, TypeError, ValueError):
+            continue
+    return judgements
+
+
+def completed_keys(judgements: Dict[JudgeKey, Dict[str, Any]]) -> set:
+    """已得出结论的任务键; 评判失败(winner 为None)的任务在续跑时重新评判"""
+    return {key for key, record in judgements.items() if record.get('winner') is not None}
+
+
+class JudgeSummary:
+    """
+    评判结果的汇总: 各文件组合的胜/负/平, 各文件的总体胜率, 以及位置偏好
+    """
+    def __init__(self, names: List[str]):
+        """
+        Args:
+            names (List[str]): 文件名, 按命令行中的顺序
+        """
+        self.names = list(names)
+        self.pairs: Dict[Tuple[str, str], Counter] = {}
+        self.positions: Counter = Counter()        # 评判模型给出的位置结论: A / B / tie
+
+    def add(self, record: Dict[str, Any]):
+        """统计一条评判结果"""
+        try:
+            name_a, name_b = record['models']
+        except (KeyError, TypeError, ValueError):
+            return
+        counter = self.pairs.setdefault((name_a, name_b), Counter())
+        winner = record.get('winner')
+        if winner is None:
+            counter['failed'] += 1
+            return
+        counter['tie' if winner == TIE else ('wins_a' if winner == name_a else 'wins_b')] += 1
+        if record.get('verdict'):
+            self.positions[record['verdict']] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        order = {name: idx for idx, name in enumerate(self.names)}
+        rank = lambda name: order.get(name, len(order))
+        models = {name: Counter() for name in self.names}
+        report_pairs = {}
+        for (name_a, name_b), counter in sorted(self.pairs.items(), key=lambda item: (rank(item[0][0]), rank(item[0][1]))):
+            decided = counter['wins_a'] + counter['wins_b'] + counter['tie']
+            report_pairs[f"{name_a} vs {name_b}"] = {
+                'judged': decided,
+                'wins_a': counter['wins_a'],
+                'wins_b': counter['wins_b'],
+                'tie': counter['tie'],
+                'failed': counter['failed'],
+                'win_rate_a': round((counter['wins_a'] + 0.5 * counter['tie']) / decided, 4) if decided else None,
+            }
+            for name, wins, losses in ((name_a, counter['wins_a'], counter['wins_b']), (name_b, counter['wins_b'], counter['wins_a'])):
+                stats = models.setdefault(name, Counter())
+                stats['wins'] += wins
+                stats['losses'] += losses
+                stats['tie'] += counter['tie']
+
+        report_models = {}
+        for name, stats in models.items():
+            judged = stats['wins'] + stats['losses'] + stats['tie']
+            report_models[name] = {
+                'judged': judged,
+                'wins': stats['wins'],
+                'losses': stats['losses'],
+                'tie': stats['tie'],
+                'win_rate': round((stats['wins'] + 0.5 * stats['tie']) / judged, 4) if judged else None,
+            }
+
+        decisive = self.positions['A'] + self.positions['B']
+        return {
+            'pairs': report_pairs,
+            'models': report_models,
+            'position': {
+                'first': self.positions['A'],
+                'second': self.positions['B'],
+                'tie': self.positions[TIE],
+                'first_rate': round(self.positions['A'] / decisive, 4) if decisive else None,
+            },
+        }
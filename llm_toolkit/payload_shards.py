@@ -0,0 +1,244 @@
+"""
+预打包的二进制负载分片
+
+构建数据集后，将每条数据的 JSON 与其图像的原始字节一起顺序写入少量大文件(分片)，并生成偏移量索引。
+调用 API 时以内存映射方式顺序读取分片，取代请求时对成千上万个小文件的随机读取(网络文件系统上尤其慢)，
+图像字节以 memoryview 的形式直接交给 base64 编码，无需额外拷贝。
+
+分片文件格式(小端序):
+    文件头: b'MLLMSHD1'
+    每条数据: [u32 JSON 长度][u32 图像数][JSON][u32 图像1长度][图像1字节][u32 图像2长度][图像2字节]...
+
+索引(分片文件夹下的 index.jsonl)每行对应一条数据, 同一 id 以最后一行为准:
+    {"id": ..., "record_hash": JSON 的哈希, "shard": "shard-00000.bin", "offset": 数据起始位置, "length": 数据总长度,
+     "images": [{"path": 原图路径, "offset": 图像字节起始位置, "length": 图像字节数}, ...]}
+已写完的分片不会再被修改, 追加打包时总是写入新的分片。
+"""
+import os
+import mmap
+import hashlib
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .jsonl_io import dumps, loads, iter_jsonl, JsonlWriter
+from .prompt_table import PromptTable, prompt_table_path
+
+SHARD_MAGIC = b'MLLMSHD1'
+INDEX_FILE = 'index.jsonl'
+_RECORD_HEADER = struct.Struct('<II')
+_LENGTH = struct.Struct('<I')
+
+
+def record_hash(payload: bytes) -> str:
+    """数据 JSON 的哈希, 用于判断已打包的数据是否发生了变化"""
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+
+def is_shard_dir(path: str) -> bool:
+    """判断路径是否为负载分片文件夹"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+def _load_index(shard_dir: str) -> Dict[str, Dict[str, Any]]:
+    """读取索引, 同一 id 以最后一行为准"""
+    index = {}
+    index_path = os.path.join(shard_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        for entry in iter_jsonl(index_path, desc="分片索引"):
+            index[entry['id']] = entry
+    return index
+
+
+class ShardWriter:
+    """
+    顺序写入负载分片, 单个分片超过 shard_size_mb 后切换到新的分片
+    """
+    def __init__(self, shard_dir: str, shard_size_mb: int = 256):
+        """
+        Args:
+            shard_dir (str): 分片文件夹
+            shard_size_mb (int): 单个分片的目标大小(MB)
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size_mb * 1024 * 1024
+        existing = [name for name in os.listdir(shard_dir) if name.startswith('shard-') and name.endswith('.bin')]
+        self._next_shard = max((int(name[6:11]) for name in existing), default=-1) + 1
+        self._file = None
+        self._shard_name = None
+        # 索引只在分片落盘后写入(见 _close_shard), 缓冲区不按行数自动写出
+        self._index = JsonlWriter(os.path.join(shard_dir, INDEX_FILE), 'a', batch_size=2 ** 31)
+        self.count = 0
+
+    def _open_next_shard(self):
+        self._close_shard()
+        self._shard_name = f"shard-{self._next_shard:05d}.bin"
+        self._next_shard += 1
+        self._file = open(os.path.join(self.shard_dir, self._shard_name), 'wb')
+        self._file.write(SHARD_MAGIC)
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            # 分片落盘后再写入索引, 索引中的数据总是完整可读的
+            self._index.flush(fsync=True)
+
+    def write(self, record: Dict[str, Any], images: List[Tuple[str, bytes]]):
+        """写入一条数据及其图像
+
+        Args:
+            record (Dict[str, Any]): 数据集中的一条数据
+            images (List[Tuple[str, bytes]]): [(图像路径, 图像字节), ...]
+        """
+        if self._file is None or self._file.tell() >= self.shard_size:
+            self._open_next_shard()
+
+        payload = dumps(record)
+        start = self._file.tell()
+        self._file.write(_RECORD_HEADER.pack(len(payload), len(images)))
+        self._file.write(payload)
+        image_entries = []
+        for image_path, data in images:
+            self._file.write(_LENGTH.pack(len(data)))
+            image_entries.append({'path': image_path, 'offset': self._file.tell(), 'length': len(data)})
+            self._file.write(data)
+
+        self._index.write({
+            'id': record['id'],
+            'record_hash': record_hash(payload),
+            'shard': self._shard_name,
+            'offset': start,
+            'length': self._file.tell() - start,
+            'images': image_entries,
+        })
+        self.count += 1
+
+    def close(self):
+        self._close_shard()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ShardReader:
+    """
+    以内存映射方式读取负载分片, 图像字节以 memoryview 返回(零拷贝)
+    """
+    def __init__(self, shard_dir: str):
+        """
+        Args:
+            shard_dir (str): 分片文件夹
+        """
+        self.shard_dir = shard_dir
+        self.index = _load_index(shard_dir)
+        self._images = {}           # 图像路径 -> (分片, 偏移量, 长度)
+        for entry in self.index.values():
+            for image in entry['images']:
+                self._images[image['path']] = (entry['shard'], image['offset'], image['length'])
+        self._maps: Dict[str, Tuple[Any, mmap.mmap, memoryview]] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _view(self, shard_name: str) -> memoryview:
+        """返回整个分片的 memoryview, 首次访问时建立内存映射"""
+        if shard_name not in self._maps:
+            f = open(os.path.join(self.shard_dir, shard_name), 'rb')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)        # 提示操作系统按顺序预读
+            if mapped[:len(SHARD_MAGIC)] != SHARD_MAGIC:
+                raise ValueError(f"{shard_name} 不是有效的负载分片")
+            self._maps[shard_name] = (f, mapped, memoryview(mapped))
+        return self._maps[shard_name][2]
+
+    def read(self, entry: Dict[str, Any]) -> Tuple[Dict[str, Any], List[memoryview]]:
+        """读取索引条目对应的数据与图像字节"""
+        view = self._view(entry['shard'])
+        offset = entry['offset']
+        json_length, num_images = _RECORD_HEADER.unpack_from(view, offset)
+        offset += _RECORD_HEADER.size
+        record = loads(bytes(view[offset:offset + json_length]))
+        offset += json_length
+        images = []
+        for _ in range(num_images):
+            (length,) = _LENGTH.unpack_from(view, offset)
+            offset += _LENGTH.size
+            images.append(view[offset:offset + length])
+            offset += length
+        return record, images
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """按分片内的存储顺序(顺序读取)返回所有数据"""
+        for entry in sorted(self.index.values(), key=lambda entry: (entry['shard'], entry['offset'])):
+            yield self.read(entry)[0]
+
+    def image(self, image_path: str) -> Optional[memoryview]:
+        """按原图路径返回图像字节, 不在分片中时返回None"""
+        location = self._images.get(image_path)
+        if location is None:
+            return None
+        shard_name, offset, length = location
+        return self._view(shard_name)[offset:offset + length]
+
+    def close(self):
+        """关闭所有内存映射(仍被引用的 memoryview 释放后才能关闭)"""
+        for f, mapped, view in self._maps.values():
+            try:
+                view.release()
+                mapped.close()
+            except BufferError:
+                pass
+            f.close()
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def pack_dataset(dataset_path: str, shard_dir: str, shard_size_mb: int = 256) -> int:
+    """将数据集及其图像打包为负载分片, 已打包且没有变化的数据会被跳过
+
+    Args:
+        dataset_path (str): 数据集文件
+        shard_dir (str): 分片文件夹
+        shard_size_mb (int): 单个分片的目标大小(MB)
+
+    Returns:
+        int: 本次打包的数据条数
+    """
+    packed = {sample_id: entry.get('record_hash') for sample_id, entry in _load_index(shard_dir).items()}
+
+    # 紧凑格式的数据集需要提示词引用表, 复制一份到分片文件夹旁
+    prompt_table = PromptTable.for_jsonl(dataset_path)
+    if prompt_table.prompts:
+        table_path = prompt_table_path(shard_dir)
+        output_table = PromptTable.load(table_path)
+        output_table.merge(prompt_table)
+        output_table.save(table_path)
+
+    with ShardWriter(shard_dir, shard_size_mb) as writer:
+        for record in iter_jsonl(dataset_path):
+            current_hash = record_hash(dumps(record))
+            if packed.get(record['id']) == current_hash:
+                continue
+            images = []
+            try:
+                for image_path in record['image']:
+                    with open(image_path, 'rb') as f:
+                        images.append((image_path, f.read()))
+            except OSError as e:
+                print(f"无法读取 {record['id']} 的图像, 已跳过: {e}")
+                continue
+            writer.write(record, images)
+            packed[record['id']] = current_hash
+        return writer.count
@@ -0,0 +1,109 @@
+"""
+提示词引用表(紧凑数据格式)
+
+标准格式中每一行都重复保存完整的提示词；紧凑格式中 human 对话只保存提示词的引用:
+    {"from": "human", "prompt_ref": {"id": "prompt2", "hash": "<sha1前16位>"}}
+提示词本身只在 JSONL 文件旁的引用表(例如 xxx.prompts.json)中保存一次:
+    {"prompt2": {"hash": "...", "prompt_text": "..."}}
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+
+def prompt_hash(prompt_text: str) -> str:
+    """计算提示词内容的哈希(sha1前16位)"""
+    return hashlib.sha1(prompt_text.encode('utf-8')).hexdigest()[:16]
+
+
+def prompt_table_path(jsonl_path: str) -> str:
+    """根据 JSONL 文件路径得到其提示词引用表的路径, 例如 a/b.jsonl -> a/b.prompts.json"""
+    base = jsonl_path.rstrip('/\\')       # 分片文件夹: a/shards/ -> a/shards.prompts.json
+    for suffix in ('.gz', '.zst'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return f"{os.path.splitext(base)[0]}.prompts.json"
+
+
+def is_compact_record(record: Dict[str, Any]) -> bool:
+    """判断一条数据是否为紧凑格式(human 对话中保存的是提示词引用)"""
+    try:
+        return 'prompt_ref' in record['conversation'][0]
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+class PromptTable:
+    """
+    提示词引用表
+    """
+    def __init__(self, prompts: Optional[Dict[str, Dict[str, str]]] = None):
+        self.prompts = prompts or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'PromptTable':
+        """加载引用表, 文件不存在时返回空表"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def for_jsonl(cls, jsonl_path: str) -> 'PromptTable':
+        """加载 JSONL 文件旁的引用表"""
+        return cls.load(prompt_table_path(jsonl_path))
+
+    def save(self, path: str):
+        """保存引用表(先写临时文件再替换)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.prompts, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def add(self, prompt_id: str, prompt_text: str) -> Dict[str, str]:
+        """登记提示词并返回其引用; 同一 id 对应不同内容时报错, 避免引用混淆"""
+        text_hash = prompt_hash(prompt_text)
+        existing = self.prompts.get(prompt_id)
+        if existing and existing['hash'] != text_hash:
+            raise ValueError(f"提示词 {prompt_id} 的内容与引用表中已有的内容不一致, 请使用新的提示词编号")
+        self.prompts[prompt_id] = {'hash': text_hash, 'prompt_text': prompt_text}
+        return {'id': prompt_id, 'hash': text_hash}
+
+    def merge(self, other: 'PromptTable'):
+        """合并另一张引用表"""
+        for prompt_id, entry in other.prompts.items():
+            self.add(prompt_id, entry['prompt_text'])
+
+    def resolve(self, prompt_ref: Dict[str, str]) -> str:
+        """根据引用取出提示词, 并校验内容哈希"""
+        entry = self.prompts.get(prompt_ref['id'])
+        if entry is None:
+            raise KeyError(f"引用表中不存在提示词 {prompt_ref['id']}")
+        if entry['hash'] != prompt_ref['hash']:
+            raise ValueError(f"提示词 {prompt_ref['id']} 的哈希不匹配, 数据与引用表可能来自不同版本")
+        return entry['prompt_text']
+
+    def expand_record(self, record: Dict[str, Any], keep_ref: bool = False) -> Dict[str, Any]:
+        """将紧凑格式的数据就地还原为标准格式
+
+        Args:
+            record (Dict[str, Any]): 单条数据, 标准格式的数据原样返回
+            keep_ref (bool): 是否保留 prompt_ref, 便于写出时再压缩回紧凑格式
+
+        Returns:
+            Dict[str, Any]: 标准格式的数据
+        """
+        if is_compact_record(record):
+            human_turn = record['conversation'][0]
+            human_turn['value'] = self.resolve(human_turn['prompt_ref'])
+            if not keep_ref:
+                del human_turn['prompt_ref']
+        return record
+
+
+def compact_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉带有 prompt_ref 的数据中展开的提示词, 恢复为紧凑格式(就地修改)"""
+    if is_compact_record(record):
+        record['conversation'][0].pop('value', None)
+    return record
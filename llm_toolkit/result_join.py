@@ -0,0 +1,220 @@
+"""
+多个结果文件按 id 连接(对比多个模型的结果)
+
+每个结果文件只在内存中保存"id -> 位置"的索引，连接后的数据在访问时才从各个文件中读取:
+- 未压缩的 .jsonl: 基于 LineIndex 行偏移索引(id -> 行号)，只解析每行开头的 id;
+- SQLite 结果库: 库中已有 id 主键索引，直接按 id 查询;
+- 压缩文件无法随机读取，只能整体读入内存。
+连接结果为所有文件中 id 的并集(按 id 排序)，某个文件中没有的 id 显式标记为缺失(回答为None)，而不是丢弃。
+结果库中的 id 总是字符串，JSONL 中可能是数字，因此连接时以 str(id) 为键，原始的 id 只用于显示。
+
+    join = ResultJoin(['a.jsonl', 'b.jsonl', 'c.db'])
+    len(join), join[0]    # {'id': ..., 'image': [...], 'answers': ['...', None, '...']}
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .line_index import LineIndex, is_indexable
+from .result_store import ResultStore, is_result_store, iter_results
+
+
+def answer_of(record: Any) -> str:
+    """一条结果中的回答, 格式不正确时返回 'ERROR: ...'(可被 jsonl_scanner.classify_error 归类)"""
+    try:
+        return record['conversation'][1]['value']
+    except (KeyError, IndexError, TypeError) as e:
+        return f"ERROR: Unparseable record ({e!r})"
+
+
+def join_key(sample_id: Any) -> str:
+    """连接时使用的键: 同一个 id 在 JSONL(可能是数字)与结果库(字符串)中一致"""
+    return str(sample_id)
+
+
+def _id_order(key: str) -> Tuple[int, int, str]:
+    """整数形式的 id 按数值排序, 其余按字符串排序并排在整数之后"""
+    if key.isdecimal() or (key[:1] == '-' and key[1:].isdecimal()):
+        return (0, int(key), key)
+    return (1, 0, key)
+
+
+def _sorted_ids(keys: Iterable[str]) -> List[str]:
+    """按 id 排序(键为 join_key)"""
+    return sorted(keys, key=_id_order)
+
+
+class ResultSource:
+    """
+    一个结果文件: id -> 位置的索引, 按 id 读取数据
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 结果文件路径(.jsonl、压缩的 .jsonl 或 SQLite 结果库)
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.keys: Dict[str, Any] = {}         # join_key(id) -> 行号(JSONL) / id(结果库) / 数据本身(压缩文件)
+        self.line_index: Optional[LineIndex] = None
+        self.store: Optional[ResultStore] = None
+        self.loaded_rows = 0
+        self.skipped = 0                       # 无法解析或缺少 id 的行数
+
+        if is_result_store(path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            self.store = ResultStore(path, readonly=True)
+            self.keys = {join_key(sample_id): sample_id for sample_id in self.store.ids()}
+        elif is_indexable(path):
+            self.line_index = LineIndex(path)
+            self.read_new_rows()
+        else:
+            for record in iter_results(path):
+                if isinstance(record, dict) and 'id' in record:
+                    self.keys[join_key(record['id'])] = record
+                else:
+                    self.skipped += 1
+
+    @property
+    def followable(self) -> bool:
+        """能否跟随文件的追加写入(只支持未压缩的 .jsonl)"""
+        return self.line_index is not None
+
+    def read_new_rows(self) -> List[str]:
+        """为尚未读取的行建立 id 索引(同一 id 以最后出现的为准), 返回这些行的键(join_key)"""
+        start = self.loaded_rows
+        ids = self.line_index.record_ids(start)
+        self.loaded_rows = start + len(ids)
+        if None in ids:
+            rows = [(join_key(sample_id), row) for row, sample_id in enumerate(ids, start) if sample_id is not None]
+            self.skipped += len(ids) - len(rows)
+            self.keys.update(rows)
+            return [key for key, _ in rows]
+        keys = list(map(join_key, ids))
+        self.keys.update(zip(keys, range(start, self.loaded_rows)))
+        return keys
+
+    def refresh(self) -> List[str]:
+        """为文件中新追加的完整行建立 id 索引, 返回新增或被更新的键; 文件被截断或改写时重新建立"""
+        if self.line_index is None:
+            return []
+        generation = self.line_index.generation
+        self.line_index.refresh()
+        if self.line_index.generation != generation:
+            print(f"警告: {self.name} 被截断或改写, 重新建立 id 索引。")
+            removed = list(self.keys)
+            self.keys = {}
+            self.loaded_rows = 0
+            self.skipped = 0
+            return removed + self.read_new_rows()
+        return self.read_new_rows()
+
+    def get(self, sample_id: Any) -> Optional[Dict[str, Any]]:
+        """按 id(或其 join_key)读取数据, 不存在时返回None, 无法解析时抛出 ValueError"""
+        key = self.keys.get(join_key(sample_id))
+        if key is None:
+            return None
+        if self.line_index is not None:
+            return self.line_index[key]
+        if self.store is not None:
+            return self.store.get(key)
+        return key
+
+    def close(self):
+        if self.line_index is not None:
+            self.line_index.close()
+        if self.store is not None:
+            self.store.close()
+
+
+class ResultJoin:
+    """
+    多个结果文件按 id 的连接(所有 id 的并集), 支持 len() 与按序号访问(访问时才读取数据)
+    """
+    def __init__(self, paths: List[str]):
+        """
+        Args:
+            paths (List[str]): 结果文件路径, 每个文件对应一个模型
+        """
+        self.sources: List[ResultSource] = []
+        try:
+            for path in paths:
+                self.sources.append(ResultSource(path))
+        except Exception:
+            self.close()
+            raise
+        self.ids = _sorted_ids(set().union(*(source.keys for source in self.sources)))     # 各个 id 的 join_key
+        self.row_of_id = {sample_id: row for row, sample_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        """第 row 个 id 在各个文件中的结果: {'id', 'image', 'answers'}, 缺失的文件回答为None
+
+        'id' 为第一个有结果的文件中的原始 id(用于显示), 按 id 查找时使用 self.ids 中的键。
+        """
+        sample_id = self.ids[row]
+        display_id = None
+        image = None
+        answers: List[Optional[str]] = []
+        for source in self.sources:
+            try:
+                record = source.get(sample_id)
+            except ValueError as e:
+                answers.append(f"ERROR: Unparseable record ({e})")
+                continue
+            if record is None:
+                answers.append(None)
+                continue
+            answers.append(answer_of(record))
+            if isinstance(record, dict):
+                display_id = record.get('id') if display_id is None else display_id
+                image = image or record.get('image')
+        return {'id': sample_id if display_id is None else display_id, 'image': image or [], 'answers': answers}
+
+    def missing_counts(self) -> List[int]:
+        """每个文件中缺失的 id 数量"""
+        return [sum(1 for sample_id in self.ids if sample_id not in source.keys) for source in self.sources]
+
+    def complete_count(self) -> int:
+        """在所有文件中都有结果的 id 数量"""
+        return sum(1 for sample_id in self.ids if all(sample_id in source.keys for source in self.sources))
+
+    @property
+    def followable(self) -> bool:
+        return any(source.followable for source in self.sources)
+
+    def refresh(self) -> Tuple[int, List[int]]:
+        """读取各个文件中新追加的结果
+
+        新出现的 id 追加到末尾(不重新排序, 已有的序号保持不变)。
+
+        Returns:
+            Tuple[int, List[int]]: (新增的 id 数量, 结果有变化的已有 id 的序号)
+        """
+        changed = {}
+        for source in self.sources:
+            changed.update(dict.fromkeys(source.refresh()))
+        appended = 0
+        updated_rows = []
+        for sample_id in changed:
+            row = self.row_of_id.get(sample_id)
+            if row is not None:
+                updated_rows.append(row)
+                continue
+            if not any(sample_id in source.keys for source in self.sources):
+                continue
+            self.row_of_id[sample_id] = len(self.ids)
+            self.ids.append(sample_id)
+            appended += 1
+        return appended, sorted(updated_rows)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
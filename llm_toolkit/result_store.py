@@ -0,0 +1,235 @@
+"""
+基于 SQLite 的结果存储
+
+作为追加写入 JSONL 的替代方案: 以 id 为主键保存每条结果，同时单独保存状态、模型、耗时与 token 用量等列，
+按 id 查找、按状态筛选都可以走索引(O(log n))，无需全量扫描。数据库开启 WAL 模式，
+写入(call_llm_api.py)的同时可以被读取(浏览器)。
+
+同一个 id 重复写入时，新的结果覆盖旧的结果，因此断点续跑时只需跳过 status='ok' 的 id，失败的任务会被自动重跑。
+
+与 JSONL 互相转换:
+    python -m llm_toolkit.result_store import results.jsonl results.db
+    python -m llm_toolkit.result_store export results.db results.jsonl [--status ok]
+"""
+import os
+import time
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from .jsonl_io import dumps, loads, iter_jsonl, read_ids, JsonlWriter
+from .jsonl_scanner import classify_error
+
+RESULT_STORE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    error TEXT,
+    model TEXT,
+    latency REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    updated_at REAL NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_status ON results(status);
+"""
+
+_UPSERT = """
+INSERT INTO results (id, status, error, model, latency, prompt_tokens, completion_tokens, total_tokens, updated_at, record)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    status = excluded.status,
+    error = excluded.error,
+    model = excluded.model,
+    latency = excluded.latency,
+    prompt_tokens = excluded.prompt_tokens,
+    completion_tokens = excluded.completion_tokens,
+    total_tokens = excluded.total_tokens,
+    updated_at = excluded.updated_at,
+    record = excluded.record
+"""
+
+
+def is_result_store(path: str) -> bool:
+    """根据扩展名判断路径是否为 SQLite 结果库"""
+    return path.lower().endswith(RESULT_STORE_SUFFIXES)
+
+
+def read_result_ids(path: str) -> set:
+    """读取结果文件中已完成任务的 id, 用于断点续跑
+
+    JSONL 文件返回所有 id(失败的结果需要先用 retry_errors.py 处理);
+    SQLite 结果库只返回成功的 id, 失败的任务会被重新调用并覆盖原结果。
+    结果库中的 id 以字符串保存, 因此两种格式都统一返回 str(id), 调用方需以 str(task['id']) 比较。
+    """
+    if not is_result_store(path):
+        return {str(sample_id) for sample_id in read_ids(path)}
+    if not os.path.exists(path):
+        return set()
+    with ResultStore(path) as store:
+        return set(store.ids(status='ok'))
+
+
+def open_result_writer(path: str):
+    """根据扩展名打开结果写入器: SQLite 结果库或追加写入的 JsonlWriter"""
+    if is_result_store(path):
+        return ResultStore(path)
+    return JsonlWriter(path, 'a')
+
+
+def iter_results(path: str, desc: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """按写入顺序读取结果文件(JSONL 或 SQLite 结果库)中的所有结果"""
+    if not is_result_store(path):
+        yield from iter_jsonl(path, desc=desc)
+        return
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    with ResultStore(path, readonly=True) as store:
+        yield from store.iter_records()
+
+
+def _record_to_row(record: Dict[str, Any]) -> tuple:
+    """将一条结果转换为数据库中的一行"""
+    try:
+        answer = record['conversation'][1]['value']
+    except (KeyError, IndexError, TypeError):
+        answer = None
+    error = classify_error(answer)
+    meta = record.get('meta') or {}
+    usage = meta.get('usage') or {}
+    return (
+        str(record['id']),
+        'error' if error else 'ok',
+        error,
+        meta.get('model'),
+        meta.get('latency'),
+        usage.get('prompt_tokens'),
+        usage.get('completion_tokens'),
+        usage.get('total_tokens'),
+        time.time(),
+        dumps(record),
+    )
+
+
+class ResultStore:
+    """
+    SQLite 结果库
+    """
+    def __init__(self, db_path: str, readonly: bool = False):
+        """
+        Args:
+            db_path (str): 数据库文件路径, 不存在时自动创建(只读模式除外)
+            readonly (bool): 以只读方式打开(浏览器使用)
+        """
+        self.db_path = db_path
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+            self.conn.commit()
+
+    def put(self, record: Dict[str, Any], commit: bool = True):
+        """写入(或覆盖)一条结果"""
+        self.conn.execute(_UPSERT, _record_to_row(record))
+        if commit:
+            self.conn.commit()
+
+    def put_many(self, records: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """批量写入结果, 每 batch_size 条提交一次, 返回写入的条数"""
+        count = 0
+        batch = []
+        for record in records:
+            batch.append(_record_to_row(record))
+            if len(batch) >= batch_size:
+                self.conn.executemany(_UPSERT, batch)
+                self.conn.commit()
+                count += len(batch)
+                batch = []
+        if batch:
+            self.conn.executemany(_UPSERT, batch)
+            self.conn.commit()
+            count += len(batch)
+        return count
+
+    # 与 JsonlWriter 相同的写入接口, 供 call_llm_api.py 直接替换使用
+    def write(self, record: Dict[str, Any]):
+        """写入一条结果(调用 flush() 时提交)"""
+        self.put(record, commit=False)
+
+    def flush(self, fsync: bool = False):
+        """提交已写入的结果(WAL 模式下提交即可被其他连接读取)"""
+        self.conn.commit()
+
+    def get(self, sample_id: str) -> Optional[Dict[str, Any]]:
+        """按 id 查找结果, 不存在时返回None"""
+        row = self.conn.execute("SELECT record FROM results WHERE id = ?", (str(sample_id),)).fetchone()
+        return loads(row[0]) if row else None
+
+    def ids(self, status: Optional[str] = None) -> List[str]:
+        """返回所有(或指定状态的) id, 按写入顺序排列"""
+        if status is None:
+            rows = self.conn.execute("SELECT id FROM results ORDER BY rowid")
+        else:
+            rows = self.conn.execute("SELECT id FROM results WHERE status = ? ORDER BY rowid", (status,))
+        return [row[0] for row in rows]
+
+    def count(self, status: Optional[str] = None) -> int:
+        """返回所有(或指定状态的)结果数量"""
+        if status is None:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM results WHERE status = ?", (status,)).fetchone()[0]
+
+    def iter_records(self, status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """按写入顺序流式返回所有(或指定状态的)结果"""
+        if status is None:
+            cursor = self.conn.execute("SELECT record FROM results ORDER BY rowid")
+        else:
+            cursor = self.conn.execute("SELECT record FROM results WHERE status = ? ORDER BY rowid", (status,))
+        for row in cursor:
+            yield loads(row[0])
+
+    def import_jsonl(self, jsonl_path: str) -> int:
+        """从 JSONL 结果文件导入, 同一 id 以文件中靠后的结果为准"""
+        return self.put_many(record for record in iter_jsonl(jsonl_path) if isinstance(record, dict) and 'id' in record)
+
+    def export_jsonl(self, jsonl_path: str, status: Optional[str] = None) -> int:
+        """导出为 JSONL 结果文件(与 call_llm_api.py 的输出格式一致)"""
+        with JsonlWriter(jsonl_path) as writer:
+            writer.write_many(self.iter_records(status))
+            return writer.count
+
+    def close(self):
+        """提交剩余数据并关闭数据库"""
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='SQLite 结果库与 JSONL 结果文件互相转换')
+    parser.add_argument('action', choices=['import', 'export'], help='import: JSONL -> SQLite, export: SQLite -> JSONL')
+    parser.add_argument('source', help='源文件')
+    parser.add_argument('target', help='目标文件')
+    parser.add_argument('--status', choices=['ok', 'error'], default=None, help='导出时只导出指定状态的结果')
+    args = parser.parse_args()
+
+    if args.action == 'import':
+        with ResultStore(args.target) as store:
+            count = store.import_jsonl(args.source)
+    else:
+        with ResultStore(args.source, readonly=True) as store:
+            count = store.export_jsonl(args.target, args.status)
+    print(f"✅ 共{'导入' if args.action == 'import' else '导出'} {count} 条结果: {args.source} -> {args.target}")
@@ -0,0 +1,260 @@
+"""
+结果文件的检索索引
+
+基于 SQLite FTS5 的 trigram 分词器建立回答文本的倒排索引(按连续三个字符切分，中文无需分词即可做子串检索)，
+同时保存每条数据的 id、错误类别与回答长度，用于浏览器中的筛选/搜索:
+
+    error            只看调用失败的数据(status:error 同义), ok 只看成功的数据
+    error:429        错误类别包含 429 的数据
+    挖掘机           回答中包含"挖掘机"(不少于 3 个字符时走倒排索引，更短的词退化为扫描)
+    text:error       回答中包含 error(与上面的关键字区分)
+    -挖掘机          回答中不包含"挖掘机"
+    len>500          回答长度大于 500 个字符(支持 > >= < <= =)
+    id:abc           id 中包含 abc
+多个条件以空格分隔，同时满足；包含空格的词可以用引号括起来。
+
+索引缓存在结果文件旁(a/b.jsonl -> a/b.jsonl.search.db)，按行号增量建立: 文件追加了新的数据时只索引新增的行，
+文件被改写时(最后一条已索引的数据内容变化)自动重建。建立索引可以在后台线程中进行，期间查询已索引的部分。
+"""
+import re
+import shlex
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from .jsonl_scanner import classify_error
+
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS rows (
+    row INTEGER PRIMARY KEY,
+    id TEXT,
+    error TEXT,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS rows_error ON rows(error);
+CREATE INDEX IF NOT EXISTS rows_length ON rows(length);
+CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts5(text, tokenize='trigram');
+"""
+
+_LENGTH_FILTER = re.compile(r'len\s*(<=|>=|<|>|=)\s*(\d+)')
+
+# (id, 检索文本, 错误类别, 长度)
+SearchFields = Tuple[Optional[str], str, Optional[str], int]
+
+
+def search_index_path(path: str) -> str:
+    """检索索引的缓存路径, 例如 a/b.jsonl -> a/b.jsonl.search.db"""
+    return f"{path}.search.db"
+
+
+def search_fields(record: Any) -> SearchFields:
+    """从一条结果中取出检索用的字段: 回答文本、错误类别(成功为None)与回答长度"""
+    try:
+        answer = record['conversation'][1]['value']
+    except (KeyError, IndexError, TypeError):
+        answer = None
+    text = answer if isinstance(answer, str) else ''
+    sample_id = record.get('id') if isinstance(record, dict) else None
+    return (None if sample_id is None else str(sample_id)), text, classify_error(answer), len(text)
+
+
+def _line_hash(line: bytes) -> str:
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SearchIndex:
+    """
+    结果的检索索引(线程安全: 后台线程建立索引的同时可以在 GUI 线程中查询)
+    """
+    def __init__(self, db_path: str = ':memory:'):
+        """
+        Args:
+            db_path (str): 索引数据库路径, 默认建立在内存中(不缓存)
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ':memory:':
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self.conn:
+            self.conn.executescript(_SCHEMA)
+        if self._meta('version') != INDEX_VERSION:
+            self.reset()
+
+    @classmethod
+    def for_line_index(cls, line_index: Any) -> 'SearchIndex':
+        """打开 JSONL 文件(LineIndex)旁缓存的索引; 文件被改写过时清空索引"""
+        index = cls(search_index_path(line_index.path))
+        rows = index.indexed_rows
+        if rows and (rows > len(line_index) or index._meta('last_line_hash') != _line_hash(line_index.line(rows - 1))):
+            print("结果文件已被修改, 重建检索索引")
+            index.reset()
+        return index
+
+    def _meta(self, key: str) -> Any:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def reset(self):
+        """清空索引"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM rows")
+            self.conn.execute("DELETE FROM texts")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+
+    @property
+    def indexed_rows(self) -> int:
+        """已建立索引的行数"""
+        return self._meta('indexed_rows') or 0
+
+    def update(
+        self,
+        records: Sequence[Any],
+        fields: Callable[[Any], SearchFields] = search_fields,
+        batch_size: int = 5000,
+        progress: Optional[Callable[[int, int], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> int:
+        """为尚未索引的数据建立索引(从已索引的行数开始, 每批数据一个事务)
+
+        Args:
+            records (Sequence[Any]): 支持 len() 与下标访问的数据列表(list 或 LineIndex)
+            fields (Callable): 从一条数据中取出 (id, 检索文本, 错误类别, 长度)
+            batch_size (int): 每个事务索引的数据条数
+            progress (Optional[Callable[[int, int], None]]): 每批完成后以 (已索引行数, 总行数) 调用
+            should_stop (Optional[Callable[[], bool]]): 返回 True 时在当前批次完成后停止;
+                数据列表在索引过程中变短(被重建)时同样停止
+
+        Returns:
+            int: 本次新增索引的行数
+        """
+        start = self.indexed_rows
+        total = len(records)
+        row = start
+        while row < total:
+            end = min(row + batch_size, total)
+            row_values = []
+            text_values = []
+            try:
+                for i in range(row, end):
+                    try:
+                        sample_id, text, error, length = fields(records[i])
+                    except (ValueError, TypeError, AttributeError):
+                        sample_id, text, error, length = None, '', 'Unparseable', 0
+                    row_values.append((i, sample_id, error, length))
+                    text_values.append((i, text))
+                last_line_hash = _line_hash(records.line(end - 1)) if hasattr(records, 'line') else None
+            except IndexError:
+                # 数据列表在索引过程中被重建(文件被截断或改写): 丢弃这一批并停止, 由调用方清空索引后重新建立
+                break
+            with self._lock, self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)", row_values)
+                self.conn.executemany("INSERT INTO texts(rowid, text) VALUES (?, ?)", text_values)
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('indexed_rows', ?)", (end,))
+                if last_line_hash is not None:
+                    self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_line_hash', ?)", (last_line_hash,))
+            row = end
+            if progress:
+                progress(row, total)
+            if should_stop and should_stop():
+                break
+        return row - start
+
+    def reindex(self, rows: Sequence[int], records: Sequence[Any], fields: Callable[[Any], SearchFields] = search_fields) -> int:
+        """重新索引内容有变化的行(只处理已建立索引的行, 其余的行由 update 建立)
+
+        Returns:
+            int: 重新索引的行数
+        """
+        row_values = []
+        text_values = []
+        for i in rows:
+            try:
+                sample_id, text, error, length = fields(records[i])
+            except (ValueError, TypeError, AttributeError):
+                sample_id, text, error, length = None, '', 'Unparseable', 0
+            row_values.append((i, sample_id, error, length))
+            text_values.append((i, text))
+        with self._lock, self.conn:
+            indexed = (self.conn.execute("SELECT value FROM meta WHERE key = 'indexed_rows'").fetchone() or (0,))[0]
+            row_values = [values for values in row_values if values[0] < indexed]
+            text_values = [values for values in text_values if values[0] < indexed]
+            self.conn.executemany("DELETE FROM texts WHERE rowid = ?", [(values[0],) for values in text_values])
+            self.conn.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)", row_values)
+            self.conn.executemany("INSERT INTO texts(rowid, text) VALUES (?, ?)", text_values)
+        return len(row_values)
+
+    def _text_condition(self, term: str, negate: bool = False) -> Tuple[str, List[Any]]:
+        """回答中包含 term: 不少于 3 个字符时走 trigram 索引, 否则扫描"""
+        if len(term) >= 3:
+            sql = "row IN (SELECT rowid FROM texts WHERE texts MATCH ?)"
+            params = ['"' + term.replace('"', '""') + '"']
+        else:
+            sql = "row IN (SELECT rowid FROM texts WHERE text LIKE ? ESCAPE '\\')"
+            params = [f"%{_escape_like(term)}%"]
+        return (f"NOT {sql}" if negate else sql), params
+
+    def parse_query(self, query: str) -> Tuple[str, List[Any]]:
+        """将筛选语句解析为 SQL 条件"""
+        try:
+            terms = shlex.split(query)
+        except ValueError:
+            terms = query.split()
+
+        conditions = []
+        params: List[Any] = []
+        for term in terms:
+            lower = term.lower()
+            length = _LENGTH_FILTER.fullmatch(lower)
+            if lower in ('error', 'errors', 'status:error'):
+                conditions.append("error IS NOT NULL")
+            elif lower in ('ok', 'status:ok'):
+                conditions.append("error IS NULL")
+            elif length:
+                conditions.append(f"length {length.group(1)} ?")
+                params.append(int(length.group(2)))
+            elif lower.startswith('error:') and len(term) > 6:
+                conditions.append("error LIKE ? ESCAPE '\\'")
+                params.append(f"%{_escape_like(term[6:])}%")
+            elif lower.startswith('id:') and len(term) > 3:
+                conditions.append("id LIKE ? ESCAPE '\\'")
+                params.append(f"%{_escape_like(term[3:])}%")
+            elif lower.startswith('text:') and len(term) > 5:
+                condition, extra = self._text_condition(term[5:])
+                conditions.append(condition)
+                params.extend(extra)
+            elif term.startswith('-') and len(term) > 1:
+                condition, extra = self._text_condition(term[1:], negate=True)
+                conditions.append(condition)
+                params.extend(extra)
+            else:
+                condition, extra = self._text_condition(term)
+                conditions.append(condition)
+                params.extend(extra)
+        return (" AND ".join(conditions) or "1"), params
+
+    def query(self, query: str) -> List[int]:
+        """按筛选语句查询, 返回满足条件的行号(升序)"""
+        where, params = self.parse_query(query)
+        with self._lock:
+            return [row for (row,) in self.conn.execute(f"SELECT row FROM rows WHERE {where} ORDER BY row", params)]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,98 @@
+"""
+输出长度预算管理器
+
+按 (prompt, model) 统计历史回复的 completion tokens 分布，以高分位数加余量作为 max_tokens，
+避免模型(尤其是推理模型)无限制地输出，同时降低延迟与费用。统计结果以json文件持久化，跨批次复用。
+"""
+import os
+import json
+import math
+import hashlib
+from collections import deque
+from typing import Dict, Optional
+
+
+class TokenBudget:
+    """
+    max_tokens 预算管理器
+    """
+    def __init__(
+        self,
+        stats_path: Optional[str] = None,
+        percentile: float = 0.95,
+        margin: float = 0.2,
+        min_samples: int = 20,
+        window: int = 500,
+        floor: int = 256,
+        ceiling: int = 16384
+    ):
+        """
+        Args:
+            stats_path (Optional[str]): 统计结果的json文件路径, 为None时不持久化
+            percentile (float): 以该分位数作为预算基准
+            margin (float): 在分位数基础上额外增加的比例
+            min_samples (int): 样本数少于该值时不限制 max_tokens
+            window (int): 每个 (prompt, model) 最多保留的最近样本数
+            floor (int): 预算下限
+            ceiling (int): 预算上限, 截断后重新请求时预算也不会超过该值
+        """
+        self.stats_path = stats_path
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.window = window
+        self.floor = floor
+        self.ceiling = ceiling
+        self.samples: Dict[str, deque] = {}
+        self._load()
+
+    def _load(self):
+        """加载已有的统计结果"""
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"警告: 无法读取输出长度统计文件 {self.stats_path}: {e}, 将重新统计")
+            return
+        for key, values in data.items():
+            self.samples[key] = deque(values, maxlen=self.window)
+
+    def save(self):
+        """将统计结果写入json文件(先写临时文件再替换, 避免中断时损坏)"""
+        if not self.stats_path:
+            return
+        tmp_path = f"{self.stats_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({key: list(values) for key, values in self.samples.items()}, f)
+        os.replace(tmp_path, self.stats_path)
+
+    @staticmethod
+    def make_key(prompt: str, model: str) -> str:
+        """以提示词内容的哈希与模型名称作为统计的键"""
+        prompt_hash = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16]
+        return f"{model}|{prompt_hash}"
+
+    def suggest(self, prompt: str, model: str) -> Optional[int]:
+        """根据历史分布给出 max_tokens, 样本不足时返回None(不限制)"""
+        values = self.samples.get(self.make_key(prompt, model))
+        if not values or len(values) < self.min_samples:
+            return None
+        ordered = sorted(values)
+        rank = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        budget = int(ordered[rank] * (1 + self.margin))
+        return max(self.floor, min(self.ceiling, budget))
+
+    def expand(self, budget: int) -> Optional[int]:
+        """回复被截断后的新预算(翻倍), 已达上限时返回None"""
+        if budget >= self.ceiling:
+            return None
+        return min(self.ceiling, budget * 2)
+
+    def record(self, prompt: str, model: str, completion_tokens: int):
+        """记录一次未被截断的回复的 completion tokens"""
+        key = self.make_key(prompt, model)
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.window)
+        self.samples[key].append(int(completion_tokens))
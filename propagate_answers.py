@@ -0,0 +1,50 @@
+"""
+将代表帧的回答复制给构建数据集时被去重的近重复帧
+
+build_sft_dataset.py 开启去重(--dedup_threshold)后, 近重复帧不会写入数据集, 对应关系记录在数据集旁的 .dedup.jsonl 中。
+调用 API 得到代表帧的结果后, 用本脚本生成包含全部帧的结果文件, 复制出的结果带有 'dedup_of' 字段指明其代表帧。
+
+author:zhaoshe
+"""
+import os
+import argparse
+from tqdm import tqdm
+from llm_toolkit import ResultStore, JsonlWriter, is_result_store, iter_results
+from llm_toolkit.dedup import load_dedup_map, dedup_map_path, expand_duplicates
+
+
+def propagate_answers(dataset_file: str, result_file: str, output_file: str) -> None:
+    """将结果文件中代表帧的回答复制给被去重的帧
+
+    Args:
+        dataset_file (str): 开启去重构建的数据集文件(其去重映射位于同目录的 .dedup.jsonl)
+        result_file (str): call_llm_api.py 的结果文件(.jsonl 或 .db)
+        output_file (str): 输出的结果文件(.jsonl 或 .db)
+    """
+    mapping = load_dedup_map(dedup_map_path(dataset_file))
+    print(f"已加载 {len(mapping)} 条去重映射")
+
+    count = 0
+    copied = 0
+    with (ResultStore(output_file) if is_result_store(output_file) else JsonlWriter(output_file)) as writer:
+        for record in tqdm(expand_duplicates(iter_results(result_file), mapping), desc="Propagating"):
+            writer.write(record)
+            count += 1
+            copied += 'dedup_of' in record
+    print(f"✅ 共写入 {count} 条结果(其中 {copied} 条复制自代表帧)至 {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将代表帧的回答复制给被去重的近重复帧')
+    parser.add_argument('--dataset_file', type=str, required=True, help='开启去重构建的数据集文件')
+    parser.add_argument('--result_file', type=str, required=True, help='调用API得到的结果文件')
+    parser.add_argument('--output_file', type=str, required=True, help='输出的结果文件')
+
+    args = parser.parse_args()
+    if os.path.abspath(args.result_file) == os.path.abspath(args.output_file):
+        raise ValueError("结果文件与输出文件不能相同!")
+    propagate_answers(args.dataset_file, args.result_file, args.output_file)
+
+
+if __name__ == "__main__":
+    main()
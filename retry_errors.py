@@ -0,0 +1,230 @@
+"""
+压缩结果文件中的失败数据并仅重跑失败的任务
+
+call_llm_api.py 的断点续跑以 id 为准，调用失败(ERROR)的数据一旦写入输出文件就不会再被重跑。
+该模块对输出的JSONL文件做一次流式扫描：成功的数据直接保留(重复 id 只保留第一条)，
+失败的数据放入磁盘上的重跑队列；随后仅重跑这些失败任务，最后原子地替换原输出文件。
+
+内存占用只与 id 的数量有关，样本本身始终在磁盘上流转，可以处理数GB的结果文件。
+
+author:zhaoshe
+"""
+
+import os
+import stat
+import asyncio
+import tempfile
+import argparse
+from typing import Dict, Any, List, Tuple
+from tqdm import tqdm
+from llm_toolkit import APIConfigManager, PromptTable, compact_record, iter_jsonl, JsonlWriter
+from llm_toolkit.jsonl_io import compression_suffix
+from call_llm_api import initialize_client, process_single_task, is_error_result
+
+
+def split_result_file(output_file: str, kept_writer: JsonlWriter, queue_writer: JsonlWriter) -> Tuple[set, Dict[str, int]]:
+    """流式扫描结果文件，将成功的数据写入kept_writer，失败的数据写入重跑队列queue_writer
+
+    Args:
+        output_file (str): call_llm_api.py 输出的 .jsonl 结果文件
+        kept_writer (JsonlWriter): 保留数据的临时文件
+        queue_writer (JsonlWriter): 重跑队列的临时文件
+
+    Returns:
+        Tuple[set, Dict[str, int]]: 已成功的 id 集合, 以及各类数据的计数
+    """
+    kept_ids = set()
+    queued_ids = set()
+    stats = {'total': 0, 'kept': 0, 'queued': 0, 'duplicate': 0, 'corrupt': 0}
+    error_log = []
+
+    for sample in tqdm(iter_jsonl(output_file, error_log=error_log), desc="Scanning results"):
+        stats['total'] += 1
+        sample_id = sample.get('id') if isinstance(sample, dict) else None
+        if sample_id is None:
+            stats['corrupt'] += 1
+            continue
+
+        if sample_id in kept_ids:
+            stats['duplicate'] += 1
+            continue
+
+        if is_error_result(sample):
+            if sample_id in queued_ids:
+                stats['duplicate'] += 1
+                continue
+            queued_ids.add(sample_id)
+            queue_writer.write(sample)
+            stats['queued'] += 1
+        else:
+            kept_ids.add(sample_id)
+            kept_writer.write(sample)
+            stats['kept'] += 1
+
+    stats['total'] += len(error_log)
+    stats['corrupt'] += len(error_log)
+    return kept_ids, stats
+
+
+async def retry_queued_tasks(
+    client,
+    model: str,
+    queue_path: str,
+    kept_writer: JsonlWriter,
+    kept_ids: set,
+    concurrency: int,
+    batch_size: int,
+    prompt_table: PromptTable
+) -> Dict[str, int]:
+    """分批读取重跑队列并重新调用API, 结果(无论成功与否)都写入kept_writer
+
+    Args:
+        client (AsyncOpenAI): OpenAI客户端
+        model (str): 模型名称
+        queue_path (str): 重跑队列的临时文件
+        kept_writer (JsonlWriter): 保留数据的临时文件
+        kept_ids (set): 已成功的 id 集合, 队列中已成功的 id 会被跳过
+        concurrency (int): 最大并发数
+        batch_size (int): 每批从队列读取的任务数, 控制内存中同时存在的样本数量
+        prompt_table (PromptTable): 结果文件的提示词引用表, 用于还原紧凑格式数据的提示词
+
+    Returns:
+        Dict[str, int]: 重跑成功和失败的数量
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {'retried': 0, 'recovered': 0, 'still_failed': 0, 'skipped': 0}
+    progress = tqdm(desc="Retrying tasks")
+
+    async def run_batch(batch: List[Dict[str, Any]]):
+        coroutines = [process_single_task(client, sample, model, semaphore) for sample in batch]
+        for future in asyncio.as_completed(coroutines):
+            result = await future
+            stats['retried'] += 1
+            if is_error_result(result):
+                stats['still_failed'] += 1
+            else:
+                stats['recovered'] += 1
+            kept_writer.write(compact_record(result))
+            progress.update(1)
+
+    batch = []
+    for sample in iter_jsonl(queue_path):
+        if sample['id'] in kept_ids:
+            # 同一个 id 在失败之后又有成功的记录, 无需重跑
+            stats['skipped'] += 1
+            continue
+        sample['conversation'][1]['value'] = ''
+        batch.append(prompt_table.expand_record(sample, keep_ref=True))
+        if len(batch) >= batch_size:
+            await run_batch(batch)
+            batch = []
+    if batch:
+        await run_batch(batch)
+    progress.close()
+
+    return stats
+
+
+async def compact_and_retry(args):
+    """
+    压缩并重跑结果文件的主协调函数。
+
+    该函数负责：
+    1. 流式扫描结果文件，去除重复 id，将失败数据放入重跑队列。
+    2. 仅对重跑队列中的任务重新调用API(compact_only 时跳过)。
+    3. 将保留数据与重跑结果写入临时文件后，原子地替换原结果文件。
+
+    Args:
+        args (argparse.Namespace):
+            从命令行解析的参数, 必须包含:
+            - provider (str): API 提供商
+            - model (str): 模型名称
+            - output_file (str): 需要压缩的 .jsonl 结果文件
+            - concurrency (int): 最大并发数
+            - batch_size (int): 每批重跑的任务数
+            - compact_only (bool): 仅去重压缩，不重跑失败任务
+    """
+    if not os.path.exists(args.output_file):
+        print(f"❌ 结果文件不存在: {args.output_file}")
+        return
+
+    output_dir = os.path.dirname(os.path.abspath(args.output_file))
+    # 临时文件与结果文件放在同一目录下，保证 os.replace 是原子操作; 保留文件与结果文件使用相同的压缩格式
+    kept_fd, kept_path = tempfile.mkstemp(prefix='.compact_', suffix='.jsonl' + compression_suffix(args.output_file), dir=output_dir)
+    queue_fd, queue_path = tempfile.mkstemp(prefix='.retry_', suffix='.jsonl', dir=output_dir)
+    os.close(kept_fd)
+    os.close(queue_fd)
+
+    try:
+        with JsonlWriter(kept_path) as kept_writer:
+            print(f"🔍 正在扫描结果文件: {args.output_file}")
+            with JsonlWriter(queue_path) as queue_writer:
+                kept_ids, stats = split_result_file(args.output_file, kept_writer, queue_writer)
+            print(f"    共 {stats['total']} 行: 成功 {stats['kept']}, 失败 {stats['queued']}, "
+                  f"重复 {stats['duplicate']}, 无法解析 {stats['corrupt']}")
+
+            if args.compact_only or stats['queued'] == 0:
+                # 不重跑，失败数据原样保留(每个 id 仅一条)
+                for sample in iter_jsonl(queue_path):
+                    if sample['id'] not in kept_ids:
+                        kept_writer.write(sample)
+            else:
+                config_manager = APIConfigManager()
+                model_config = config_manager.get_model_config(args.provider, args.model)
+                client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
+                print(f"⚡ 开始重跑失败任务, 模型: {args.provider} - {args.model}, 并发数: {args.concurrency}")
+                retry_stats = await retry_queued_tasks(
+                    client, model_config['model'], queue_path, kept_writer, kept_ids,
+                    args.concurrency, args.batch_size, PromptTable.for_jsonl(args.output_file)
+                )
+                await client.close()
+                print(f"    重跑 {retry_stats['retried']} 个任务: 成功 {retry_stats['recovered']}, "
+                      f"仍失败 {retry_stats['still_failed']}")
+
+            kept_writer.flush(fsync=True)
+
+        # mkstemp 创建的临时文件权限为 0600, 替换前沿用原结果文件的权限
+        os.chmod(kept_path, stat.S_IMODE(os.stat(args.output_file).st_mode))
+        os.replace(kept_path, args.output_file)
+        print(f"✅ 已原子替换结果文件: {args.output_file}")
+    finally:
+        for path in (kept_path, queue_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    """
+    主入口函数：解析命令行参数。
+    """
+    parser = argparse.ArgumentParser(description="压缩结果文件中的ERROR数据, 并仅重跑失败的任务")
+    parser.add_argument('--provider', type=str, required=True, help='API提供商')
+    parser.add_argument('--model', type=str, required=True, help='模型名称')
+    parser.add_argument('--output_file', type=str, required=True, help='需要压缩的 .jsonl 结果文件')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发调用数量, 默认为10')
+    parser.add_argument('--batch_size', type=int, default=1000, help='每批从重跑队列读取的任务数, 默认为1000')
+    parser.add_argument('--compact_only', action='store_true', help='仅去重压缩, 不重跑失败任务')
+
+    args = parser.parse_args()
+    asyncio.run(compact_and_retry(args))
+
+if __name__ == "__main__":
+    # 通过命令行运行(不建议)
+    # main()
+
+    # 通过代码运行
+    test_args = argparse.Namespace()
+
+    # 修改下面这部分参数即可
+    test_args.provider = 'qwen'                                                 # 提供商
+    test_args.model = 'qwen3-vl-plus'                                           # 模型名称
+    test_args.output_file = './example/sft_dataset_single_result1.jsonl'        # 需要压缩的结果文件
+    test_args.concurrency = 10                                                  # 并发数
+    test_args.batch_size = 1000                                                 # 每批重跑的任务数
+    test_args.compact_only = False                                              # 仅去重压缩, 不重跑
+
+    try:
+        asyncio.run(compact_and_retry(test_args))
+        print(f"--- 脚本调用执行完毕 ---")
+    except Exception as e:
+        print(f"--- 脚本调用时发生错误: {e} ---")
@@ -0,0 +1,66 @@
+"""
+结果文件统计报告
+
+对 call_llm_api.py 的输出文件做一次并行扫描，输出失败率及失败类别、回答长度分布、
+各模型耗时与重复 id 等统计信息。大文件按字节区间切分后由多进程并行解析，吞吐量随核数增长。
+
+author:zhaoshe
+"""
+import os
+import json
+import time
+import argparse
+from typing import Any, Dict
+from llm_toolkit.jsonl_scanner import scan_jsonl
+
+
+def print_report(path: str, report: Dict[str, Any], elapsed: float) -> None:
+    """打印统计报告"""
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"\n📊 {path}  ({size_mb:.1f} MB, 用时 {elapsed:.2f}s, {size_mb / max(elapsed, 1e-6):.1f} MB/s)")
+    print(f"    总行数: {report['total']}, 无法解析: {report['corrupt']}, 缺少id: {report['missing_id']}")
+    print(f"    唯一id: {report['unique_ids']}, 重复: {report['duplicates']}")
+    if report['duplicate_examples']:
+        print(f"    重复id示例: {', '.join(report['duplicate_examples'][:5])}")
+
+    print(f"    成功: {report['answered']}, 失败: {report['failed']}, 失败率: {report['error_rate']:.2%}")
+    for error_class, count in report['errors'].items():
+        print(f"        {error_class}: {count}")
+
+    print(f"    回答平均长度: {report['mean_answer_chars']} 字")
+    max_count = max(report['answer_length_hist'].values()) or 1
+    for label, count in report['answer_length_hist'].items():
+        bar = '█' * int(30 * count / max_count)
+        print(f"        {label:>10}: {count:>8} {bar}")
+
+    if report['latency']:
+        print(f"    各模型耗时(秒):")
+        for model, latency in report['latency'].items():
+            print(f"        {model}: n={latency['count']}, mean={latency['mean']}, "
+                  f"p50={latency['p50']}, p95={latency['p95']}, max={latency['max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并行扫描结果文件并输出统计报告')
+    parser.add_argument('input_files', nargs='+', help='call_llm_api.py 输出的 .jsonl 结果文件(支持多个)')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数, 默认为CPU核数')
+    parser.add_argument('--chunk_size_mb', type=int, default=64, help='每个进程单次处理的字节区间大小(MB), 默认为64')
+    parser.add_argument('--json_report', type=str, default=None, help='将统计报告另存为json文件')
+
+    args = parser.parse_args()
+
+    reports = {}
+    for path in args.input_files:
+        start = time.perf_counter()
+        report = scan_jsonl(path, workers=args.workers, chunk_size_mb=args.chunk_size_mb).to_dict()
+        print_report(path, report, time.perf_counter() - start)
+        reports[path] = report
+
+    if args.json_report:
+        with open(args.json_report, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 统计报告已保存至 {args.json_report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,37 @@ SFT / LLM 结果浏览器
 
 功能:
 - 加载 .jsonl 文件。
-- 顶部显示图像 (来自 'image' 字段的路径)。
+- 顶部显示图像 (来自 'image' 字段的路径，多图数据排列成网格)。
 - 底部左右分栏显示 'human' 提示词和 'assistant' 回复。
 - 图像会自适应窗口大小，保持长宽比。
 - 按 'A' 键切换到上一个，按 'D' 键切换到下一个。
+- 按 'G' 键跳转到指定序号(#123)或 id。
+- 按 'T' 键切换缩略图网格，快速浏览大量数据；双击或回车打开对应的数据，Esc 返回。
+- 顶部筛选栏(Ctrl+F)按错误、关键词、回答长度、id 筛选数据，筛选后 A/D 只在匹配的数据之间切换。
+  检索索引在后台建立并缓存在结果文件旁(.search.db)。
+- 按 'F' 键开关跟随模式: 文件仍在被写入(call_llm_api.py 运行中)时，只解析新追加的完整行，
+  正在查看最后一条时自动跳到最新的数据；按 'End' 键跳到最后一条。
+- 图像在后台线程中解码，并预取前后几条数据的图像，按住 A/D 键也能流畅翻页。
+- 未压缩的 .jsonl 文件通过内存映射的行偏移索引按需读取，百万行的文件也能立即打开。
 
 作者: 这是gemini写的（出错了我也不知道哪有问题……）
 """
+import os
 import sys
-import json
+import sqlite3
+from bisect import bisect_left
 from PyQt5 import QtWidgets, QtGui, QtCore
 
+# 允许直接运行 viewer/ 下的脚本时导入项目根目录中的 llm_toolkit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_toolkit import PromptTable, iter_results
+from llm_toolkit.line_index import LineIndex, is_indexable
+from llm_toolkit.search_index import SearchIndex
+from image_pipeline import ImagePipeline, ImageStrip, neighbour_indices
+from thumbnail_grid import ThumbnailGrid
+from search_bar import SearchBar, step_row
+from file_follower import FileFollower
+
 # 💡 美化第一步：定义 QSS 样式表 (类似 CSS)
 # 这是一个简洁的暗色主题
 APP_STYLESHEET = """
@@ -110,51 +130,6 @@ QFileDialog QListView {
 }
 """
 
-class ImageLabel(QtWidgets.QLabel):
-    """
-    一个自定义的 QLabel, 它可以自动缩放 pixmap 以适应标签大小，
-    同时保持图像的长宽比。
-    """
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._pixmap = QtGui.QPixmap()
-        self.setAlignment(QtCore.Qt.AlignCenter)
-        self.setMinimumSize(400, 300) # 设置一个最小尺寸
-        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-
-    def setPixmap(self, pixmap: QtGui.QPixmap):
-        """
-        设置 pixmap 并触发更新。
-        """
-        self._pixmap = pixmap
-        self.update_pixmap()
-
-    def resizeEvent(self, event: QtGui.QResizeEvent):
-        """
-        当窗口/标签大小改变时，自动重新缩放图像。
-        """
-        self.update_pixmap()
-        super().resizeEvent(event)
-
-    def update_pixmap(self):
-        """
-        核心缩放逻辑：将 self._pixmap 缩放到当前标签大小并显示。
-        """
-        if self._pixmap.isNull():
-            # 如果 pixmap 为空，清除标签
-            super().setPixmap(QtGui.QPixmap())
-            return
-            
-        # 缩放图像以适应当前标签大小，保持长宽比
-        scaled_pixmap = self._pixmap.scaled(
-            self.size(), 
-            QtCore.Qt.KeepAspectRatio, 
-            QtCore.Qt.SmoothTransformation
-        )
-        # 调用父类的 setPixmap 来真正显示图像
-        super().setPixmap(scaled_pixmap)
-
-
 class ResultViewer(QtWidgets.QWidget):
     """
     主浏览器窗口
@@ -164,6 +139,12 @@ class ResultViewer(QtWidgets.QWidget):
         
         self.records = []
         self.current_index = 0
+        self.prompt_table = PromptTable()   # 紧凑格式数据的提示词引用表
+        self.direction = 1                  # 最近一次的翻页方向, 用于预取
+        self.filtered_rows = None           # 筛选结果(升序的行号), None 表示不筛选
+        self.follower = None                # 跟随模式下监视文件的 FileFollower
+        self.title_label = ""               # 窗口标题中当前数据的 id
+        self.image_pipeline = ImagePipeline(self)
         
         self.load_data(jsonl_path)
         if not self.records:
@@ -182,8 +163,7 @@ class ResultViewer(QtWidgets.QWidget):
         初始化 UI 布局
         """
         # --- 1. 顶部：图像 ---
-        self.image_label = ImageLabel() # 使用我们自定义的 ImageLabel
-        self.image_label.setText("正在加载图像...")
+        self.image_strip = ImageStrip(self.image_pipeline) # 单图铺满, 多图排列成网格
 
         # --- 2. 底部：文本 (左右分割) ---
         
@@ -216,33 +196,55 @@ class ResultViewer(QtWidgets.QWidget):
 
         # --- 3. 整体布局 (上下分割) ---
         self.main_splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
-        self.main_splitter.addWidget(self.image_label)
+        self.main_splitter.addWidget(self.image_strip)
         self.main_splitter.addWidget(self.text_splitter)
         self.main_splitter.setSizes([600, 400]) # 初始图像占 60%
 
-        # --- 4. 设置为主窗口布局 ---
+        # --- 4. 设置为主窗口布局 (单条浏览与缩略图网格两个页面, 网格在第一次切换时创建) ---
+        self.thumbnail_grid = None
+        self.pages = QtWidgets.QStackedWidget()
+        self.pages.addWidget(self.main_splitter)
+
+        # --- 5. 筛选栏 (检索索引缓存在结果文件旁, 无法缓存时建立在内存中) ---
+        try:
+            search_index = SearchIndex.for_line_index(self.records) if isinstance(self.records, LineIndex) else SearchIndex()
+        except sqlite3.Error as e:
+            print(f"警告: 无法打开检索索引缓存, 改为在内存中建立: {e}")
+            search_index = SearchIndex()
+        self.search_bar = SearchBar(search_index, self.records)
+        self.search_bar.filter_changed.connect(self.on_filter_changed)
+        QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+F"), self, activated=self.search_bar.focus)
+
         main_layout = QtWidgets.QVBoxLayout()
-        main_layout.addWidget(self.main_splitter)
+        main_layout.addWidget(self.search_bar)
+        main_layout.addWidget(self.pages)
         self.setLayout(main_layout)
         # 💡 美化：为布局添加边距
         main_layout.setContentsMargins(10, 10, 10, 10)
         
-        # --- 5. 窗口设置 ---
+        # --- 6. 窗口设置 ---
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
         self.setGeometry(100, 100, 1200, 900)
         self.setWindowTitle("SFT/LLM 结果浏览器")
 
     def load_data(self, jsonl_path: str):
         """
-        从 .jsonl 文件加载数据到 self.records
+        从 .jsonl 文件(或 SQLite 结果库)加载数据到 self.records
+
+        未压缩的 .jsonl 文件只建立行偏移索引(缓存在文件旁), 数据在显示时才解析;
+        压缩文件与 SQLite 结果库仍然一次性读入。
         """
         print(f"正在加载文件: {jsonl_path}")
         try:
-            with open(jsonl_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        self.records.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        print(f"警告: 跳过一行无法解析的 JSON: {line[:50]}...")
+            self.prompt_table = PromptTable.for_jsonl(jsonl_path)
+        except Exception as e:
+            print(f"警告: 无法加载提示词引用表: {e}")
+
+        try:
+            if is_indexable(jsonl_path):
+                self.records = LineIndex(jsonl_path)
+            else:
+                self.records = list(iter_results(jsonl_path))
         except FileNotFoundError:
             print(f"错误: 文件未找到 {jsonl_path}")
         except Exception as e:
@@ -257,27 +259,34 @@ class ResultViewer(QtWidgets.QWidget):
         if not (0 <= self.current_index < len(self.records)):
             return
             
-        record = self.records[self.current_index]
+        try:
+            record = self.records[self.current_index]
+        except ValueError as e:
+            # 按需解析时才会发现损坏的行
+            self.image_strip.show_message(str(e))
+            self.human_text.clear()
+            self.assistant_text.clear()
+            self.title_label = "无法解析"
+            self.update_title()
+            return
 
-        # --- 更新图像 ---
+        # --- 更新图像 (后台按显示尺寸解码, 命中缓存时立即显示; 多图记录显示全部图像) ---
         try:
-            # 假设 'image' 是一个列表，我们取第一个
-            image_path = record['image'][0]
-            pixmap = QtGui.QPixmap(image_path)
-            if pixmap.isNull():
-                self.image_label.setText(f"无法加载图像:\n{image_path}")
-                self.image_label.setPixmap(QtGui.QPixmap()) # 清空旧图像
-            else:
-                self.image_label.setPixmap(pixmap)
+            self.image_strip.show_images(record['image'])
         except Exception as e:
-            self.image_label.setText(f"加载图像时出错:\n{e}")
-            self.image_label.setPixmap(QtGui.QPixmap())
+            self.image_strip.show_message(f"加载图像时出错:\n{e}")
+        self.prefetch_neighbours()
 
         # --- 更新文本 ---
         try:
-            human_prompt = record['conversation'][0]['value']
+            human_turn = record['conversation'][0]
+            if 'prompt_ref' in human_turn:
+                # 紧凑格式: 从引用表中取出提示词
+                human_prompt = self.prompt_table.resolve(human_turn['prompt_ref'])
+            else:
+                human_prompt = human_turn['value']
             self.human_text.setText(human_prompt)
-        except (IndexError, KeyError) as e:
+        except (IndexError, KeyError, ValueError) as e:
             self.human_text.setText(f"** 无法解析 Human 提示词: {e} **")
 
         try:
@@ -287,7 +296,163 @@ class ResultViewer(QtWidgets.QWidget):
             self.assistant_text.setText(f"** 无法解析 Assistant 回复: {e} **")
             
         # --- 更新窗口标题 ---
-        self.setWindowTitle(f"结果浏览器 ({self.current_index + 1}/{len(self.records)}) - {record['id']}")
+        self.title_label = str(record.get('id'))
+        self.update_title()
+
+    def update_title(self):
+        """
+        更新窗口标题: 位置、当前数据的 id、筛选与跟随状态
+        """
+        follow = "  [跟随]" if self.follower is not None else ""
+        if self.pages.currentIndex() == 1:
+            self.setWindowTitle(f"结果浏览器 - 缩略图 ({len(self.records)} 条){follow}")
+            return
+        self.setWindowTitle(f"结果浏览器 ({self.current_index + 1}/{len(self.records)}) - {self.title_label}{self.filter_title()}{follow}")
+
+    def filter_title(self) -> str:
+        """
+        窗口标题中的筛选状态
+        """
+        if self.filtered_rows is None:
+            return ""
+        position = bisect_left(self.filtered_rows, self.current_index)
+        if position < len(self.filtered_rows) and self.filtered_rows[position] == self.current_index:
+            return f"  [筛选 {position + 1}/{len(self.filtered_rows)}]"
+        return f"  [筛选 共 {len(self.filtered_rows)} 条, 当前数据不在其中]"
+
+    def toggle_follow(self):
+        """
+        开关跟随模式: 监视结果文件, 只解析新追加的完整行
+        """
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower.deleteLater()
+            self.follower = None
+            print("已关闭跟随模式。")
+        elif not isinstance(self.records, LineIndex):
+            print("跟随模式只支持未压缩的 .jsonl 文件。")
+            return
+        else:
+            self.follower = FileFollower([self.records.path], self)
+            self.follower.changed.connect(self.on_file_changed)
+            self.follower.start()
+            print("已开启跟随模式: 正在查看最后一条时自动跳到最新的数据。")
+            self.on_file_changed()
+        self.update_title()
+
+    def on_file_changed(self):
+        """
+        结果文件有变化: 为新追加的完整行建立索引(正在写入的最后一行留到下一次)
+        """
+        count = len(self.records)
+        at_last = self.current_index == count - 1
+        generation = self.records.generation
+        self.records.refresh()
+        if self.records.generation != generation:
+            # 文件被截断或改写, 行号全部失效
+            print("结果文件被截断或改写, 已重新建立索引。")
+            self.current_index = min(self.current_index, max(len(self.records) - 1, 0))
+            self.filtered_rows = None
+            self.search_bar.records_reset()
+            at_last = True
+        elif len(self.records) > count:
+            self.search_bar.records_appended()
+        else:
+            return
+
+        if self.thumbnail_grid is not None:
+            self.thumbnail_grid.sync_rows()
+        if at_last and self.filtered_rows is None and self.pages.currentIndex() == 0 and self.records:
+            self.current_index = len(self.records) - 1
+            self.direction = 1
+            self.update_display()
+        else:
+            self.update_title()
+
+    def jump_to_last(self):
+        """
+        跳到最后一条数据
+        """
+        self.current_index = len(self.records) - 1
+        self.direction = -1
+        self.update_display()
+
+    def on_filter_changed(self, rows):
+        """
+        应用筛选结果: 跳到当前位置之后的第一条匹配数据
+        """
+        self.filtered_rows = rows
+        if rows:
+            position = bisect_left(rows, self.current_index)
+            self.current_index = rows[position] if position < len(rows) else rows[0]
+            self.direction = 1
+        self.setFocus()
+        self.update_display()
+
+    def prefetch_neighbours(self):
+        """
+        在后台预取翻页方向上后续几条数据的图像
+        """
+        if self.filtered_rows is None:
+            indices = neighbour_indices(self.current_index, len(self.records), direction=self.direction)
+        else:
+            # 筛选时预取筛选结果中相邻的数据
+            position = bisect_left(self.filtered_rows, self.current_index)
+            indices = [self.filtered_rows[i] for i in neighbour_indices(position, len(self.filtered_rows), direction=self.direction)]
+        path_groups = []
+        for i in indices:
+            try:
+                path_groups.append(self.records[i]['image'])
+            except (ValueError, IndexError, KeyError, TypeError):
+                continue
+        self.image_strip.prefetch(path_groups)
+
+    def toggle_grid(self):
+        """
+        在单条浏览与缩略图网格之间切换
+        """
+        if self.pages.currentIndex() == 1:
+            self.close_grid()
+            return
+        if self.thumbnail_grid is None:
+            self.thumbnail_grid = ThumbnailGrid(self.records)
+            self.thumbnail_grid.record_activated.connect(self.open_from_grid)
+            self.pages.addWidget(self.thumbnail_grid)
+        self.pages.setCurrentIndex(1)
+        self.thumbnail_grid.select_row(self.current_index)
+        self.thumbnail_grid.setFocus()
+        self.update_title()
+
+    def close_grid(self):
+        """
+        从缩略图网格返回单条浏览, 显示网格中选中的数据
+        """
+        if self.pages.currentIndex() != 1:
+            return
+        row = self.thumbnail_grid.currentIndex().row()
+        self.open_from_grid(row if row >= 0 else self.current_index)
+
+    def open_from_grid(self, row: int):
+        """
+        打开网格中的第 row 条数据
+        """
+        self.current_index = row
+        self.pages.setCurrentIndex(0)
+        self.setFocus()
+        self.update_display()
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        """
+        关闭窗口前停止后台解码与索引 (数据加载失败时 UI 尚未建立)
+        """
+        self.image_pipeline.shutdown()
+        if self.follower is not None:
+            self.follower.stop()
+        if hasattr(self, 'search_bar'):
+            self.search_bar.shutdown()
+        if getattr(self, 'thumbnail_grid', None) is not None:
+            self.thumbnail_grid.shutdown()
+        super().closeEvent(event)
 
     def keyPressEvent(self, event: QtGui.QKeyEvent):
         """
@@ -301,6 +466,21 @@ class ResultViewer(QtWidgets.QWidget):
         elif key == QtCore.Qt.Key_D:
             # 'D' 键 - 下一个
             self.next_item()
+        elif key == QtCore.Qt.Key_G:
+            # 'G' 键 - 跳转
+            self.jump_to()
+        elif key == QtCore.Qt.Key_T:
+            # 'T' 键 - 切换缩略图网格
+            self.toggle_grid()
+        elif key == QtCore.Qt.Key_Escape:
+            # 'Esc' 键 - 从缩略图网格返回
+            self.close_grid()
+        elif key == QtCore.Qt.Key_F:
+            # 'F' 键 - 开关跟随模式
+            self.toggle_follow()
+        elif key == QtCore.Qt.Key_End:
+            # 'End' 键 - 最后一条
+            self.jump_to_last()
         else:
             # 其他按键交由父类处理
             super().keyPressEvent(event)
@@ -309,8 +489,11 @@ class ResultViewer(QtWidgets.QWidget):
         """
         切换到上一个项目
         """
-        if self.current_index > 0:
+        if self.filtered_rows is not None:
+            self.step_filtered(-1)
+        elif self.current_index > 0:
             self.current_index -= 1
+            self.direction = -1
             self.update_display()
         else:
             print("已是第一条。")
@@ -319,12 +502,61 @@ class ResultViewer(QtWidgets.QWidget):
         """
         切换到下一个项目
         """
-        if self.current_index < len(self.records) - 1:
+        if self.filtered_rows is not None:
+            self.step_filtered(1)
+        elif self.current_index < len(self.records) - 1:
             self.current_index += 1
+            self.direction = 1
             self.update_display()
         else:
             print("已是最后一条。")
 
+    def step_filtered(self, direction: int):
+        """
+        在筛选结果中切换到上一条(-1)或下一条(1)
+        """
+        row = step_row(self.filtered_rows, self.current_index, direction)
+        if row is None:
+            print("已是筛选结果的第一条。" if direction < 0 else "已是筛选结果的最后一条。")
+            return
+        self.current_index = row
+        self.direction = direction
+        self.update_display()
+
+    def find_record(self, sample_id: str):
+        """
+        按 id 查找数据的序号, 不存在时返回 None
+        """
+        if isinstance(self.records, LineIndex):
+            return self.records.find_id(sample_id)
+        for i, record in enumerate(self.records):
+            if record.get('id') == sample_id:
+                return i
+        return None
+
+    def jump_to(self):
+        """
+        跳转到指定序号(以 # 开头, 从 1 开始)或 id; 纯数字的输入找不到对应 id 时按序号处理
+        """
+        text, ok = QtWidgets.QInputDialog.getText(self, "跳转", f"输入序号(#1 ~ #{len(self.records)})或 id:")
+        text = text.strip()
+        if not ok or not text:
+            return
+
+        index = None
+        if text.startswith('#') and text[1:].isdigit():
+            index = int(text[1:]) - 1
+        else:
+            index = self.find_record(text)
+            if index is None and text.isdigit():
+                index = int(text) - 1
+
+        if index is None or not (0 <= index < len(self.records)):
+            QtWidgets.QMessageBox.warning(self, "跳转", f"未找到: {text}")
+            return
+        self.current_index = index
+        self.update_display()
+
 
 def main():
     """
@@ -344,7 +576,7 @@ def main():
         None, 
         "请选择 JSONL 结果文件", 
         "", 
-        "JSONL Files (*.jsonl);;All Files (*)"
+        "Result Files (*.jsonl *.db *.sqlite);;JSONL Files (*.jsonl);;SQLite Files (*.db *.sqlite);;All Files (*)"
     )
 
     # 如果用户选择了文件
@@ -1,22 +1,55 @@
 """
 LLM 结果对比浏览器
 
-使用 PyQt5 可视化并排比较两个 JSONL 文件中的模型输出。
+使用 PyQt5 可视化并排比较多个结果文件(每个模型一个)中的模型输出。
 
 功能:
-- 加载两个 .jsonl 文件。
-- 自动匹配两个文件中 'id' 相同的条目。
-- 顶部显示共享的图像。
-- 底部左右分栏显示两个文件中的 'assistant' 回复。
+- 加载两个或更多的结果文件(.jsonl、压缩的 .jsonl 或 SQLite 结果库)。
+- 按 'id' 连接各个文件中的条目: 每个文件只建立 id 索引，数据在显示时才读取，不必把所有回答读入内存。
+- 某个文件中没有的 id 不会被丢弃，对应的分栏标记为"缺失"，窗口标题显示缺失的文件数。
+- 顶部显示共享的图像(多图数据排列成网格)。
+- 底部分栏并排显示各个文件中的 'assistant' 回复。
 - 组标题显示文件名，以便区分。
 - 按 'A' 键切换到上一个，按 'D' 键切换到下一个。
+- 图像在后台线程中解码，并预取前后几条数据的图像。
+- 顶部筛选栏(Ctrl+F)按错误、关键词、回答长度、id 筛选(任意一个文件满足即可; error:missing 筛选有缺失的 id)，
+  筛选后 A/D 只在匹配的数据之间切换。
+- 按 'S' 键切换"差异最大的优先"的浏览顺序(差异度由 llm_toolkit.answer_diff 计算: 字符/词相似度与关键词重叠，
+  可以用 --report 载入 diff_results.py 生成的报告，否则在后台计算)；按 'H' 键开关差异高亮(与文件 A 不同的部分)。
+- 按 'F' 键开关跟随模式: 结果文件仍在被写入时，只解析新追加的完整行，新出现的 id 追加到列表末尾，
+  缺失的结果到达后原地补上；正在查看最后一条时自动跳到最新的数据。按 'End' 键跳到最后一条。
+
+用法:
+    python viewer/compare_double_results.py a.jsonl b.jsonl c.jsonl [--report diff_report.csv]
+不带参数时依次弹出文件选择框。
 
 """
 import sys
-import json
 import os
+import html
+import argparse
+import multiprocessing
+from bisect import bisect_left
+from typing import Dict, List, Optional
 from PyQt5 import QtWidgets, QtGui, QtCore
 
+# 允许直接运行 viewer/ 下的脚本时导入项目根目录中的 llm_toolkit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_toolkit.jsonl_scanner import classify_error
+from llm_toolkit.result_join import ResultJoin
+from llm_toolkit.answer_diff import diff_segments, divergence_by_id, iter_diff_rows, read_report_divergence
+from llm_toolkit.search_index import SearchIndex
+from image_pipeline import ImagePipeline, ImageStrip, neighbour_indices
+from search_bar import SearchBar, step_row
+from file_follower import FileFollower
+
+# 差异高亮的背景色
+DIFF_HIGHLIGHT_COLOR = "#6B3A1E"
+# 浏览器中后台计算差异度时每个进程任务处理的 id 数(小一些, 关闭窗口时能尽快停止)
+DIVERGENCE_CHUNK_SIZE = 100
+
+FILE_FILTER = "Result Files (*.jsonl *.jsonl.gz *.jsonl.zst *.db *.sqlite);;JSONL Files (*.jsonl);;SQLite Files (*.db *.sqlite);;All Files (*)"
+
 # 💡 (复用) 沿用您满意的暗色主题 QSS
 APP_STYLESHEET = """
 QWidget {
@@ -110,60 +143,100 @@ QFileDialog QListView {
 }
 """
 
-class ImageLabel(QtWidgets.QLabel):
+def file_label(index: int) -> str:
     """
-    (复用) 自定义的图像标签，保持长宽比。
+    第 index 个文件的标签: A, B, C ...
     """
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._pixmap = QtGui.QPixmap()
-        self.setAlignment(QtCore.Qt.AlignCenter)
-        self.setMinimumSize(400, 300) 
-        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-
-    def setPixmap(self, pixmap: QtGui.QPixmap):
-        self._pixmap = pixmap
-        self.update_pixmap()
-
-    def resizeEvent(self, event: QtGui.QResizeEvent):
-        self.update_pixmap()
-        super().resizeEvent(event)
-
-    def update_pixmap(self):
-        if self._pixmap.isNull():
-            super().setPixmap(QtGui.QPixmap())
-            return
-            
-        scaled_pixmap = self._pixmap.scaled(
-            self.size(), 
-            QtCore.Qt.KeepAspectRatio, 
-            QtCore.Qt.SmoothTransformation
-        )
-        super().setPixmap(scaled_pixmap)
+    return chr(ord('A') + index) if index < 26 else str(index + 1)
+
+
+def compare_search_fields(record: dict):
+    """
+    对比数据的检索字段: 各个文件的回答合并检索, 错误类别合并(缺失的文件记为 Missing), 长度取最长的回答
+    """
+    answers = [answer for answer in record['answers'] if answer is not None]
+    classes = [classify_error(answer) if answer is not None else 'Missing' for answer in record['answers']]
+    error = '; '.join(dict.fromkeys(filter(None, classes))) or None
+    return str(record['id']), '\n'.join(answers), error, max(map(len, answers), default=0)
+
+
+def segments_html(segments) -> str:
+    """
+    将差异片段渲染为 HTML, 不同的部分加上背景色
+    """
+    parts = []
+    for text, changed in segments:
+        text = html.escape(text)
+        parts.append(f'<span style="background-color: {DIFF_HIGHLIGHT_COLOR};">{text}</span>' if changed else text)
+    return '<div style="white-space: pre-wrap;">' + ''.join(parts) + '</div>'
+
+
+class DivergenceWorker(QtCore.QThread):
+    """
+    在后台(进程池)计算每个 id 的差异度
+    """
+    progress = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, join: ResultJoin, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.join = join
+        self.divergence: Optional[Dict[str, float]] = None
+
+    def run(self):
+        # 界面、图像加载与检索索引的线程都在运行, fork 出的子进程可能继承被占用的锁, 因此以 spawn 方式启动进程池
+        rows = iter_diff_rows(self.join, chunk_size=DIVERGENCE_CHUNK_SIZE,
+                              progress=self.progress.emit, should_stop=self.isInterruptionRequested,
+                              mp_context=multiprocessing.get_context('spawn'))
+        divergence = divergence_by_id(rows)
+        if not self.isInterruptionRequested():
+            self.divergence = divergence
 
 
 class ResultViewer(QtWidgets.QWidget):
     """
     主对比窗口
     """
-    def __init__(self, jsonl_path1: str, jsonl_path2: str):
+    def __init__(self, *jsonl_paths: str, report: Optional[str] = None):
+        """
+        Args:
+            *jsonl_paths (str): 两个或更多的结果文件, 每个模型一个
+            report (Optional[str]): diff_results.py 生成的差异报告, 指定时按差异度从大到小浏览
+        """
         super().__init__()
         
-        self.records = [] # 这是一个合并后的记录列表
+        self.join = None # 按 id 连接的结果(ResultJoin)
+        self.records = [] # 连接后的记录列表, 访问时才读取数据
         self.current_index = 0
+        self.current_record = None # 正在显示的记录
+        self.direction = 1 # 最近一次的翻页方向, 用于预取
+        self.filtered_rows = None # 筛选结果(升序的序号), None 表示不筛选
+        self.divergence = None # id(字符串) -> 差异度
+        self.divergence_order = None # 按差异度从大到小排列的序号, None 表示按 id 顺序浏览
+        self.divergence_worker = None # 后台计算差异度的线程
+        self.nav_rows = None # 实际的浏览顺序(筛选与排序的组合), None 表示按 id 顺序浏览全部数据
+        self.nav_pos = {} # 序号 -> 在 nav_rows 中的位置
+        self.highlight = True # 是否高亮与文件 A 不同的部分
+        self.follower = None # 跟随模式下监视文件的 FileFollower
+        self.image_pipeline = ImagePipeline(self)
         
         # 💡 新增：保存文件名用于显示
-        self.filename1 = os.path.basename(jsonl_path1)
-        self.filename2 = os.path.basename(jsonl_path2)
+        self.filenames = [os.path.basename(path) for path in jsonl_paths]
         
-        self.load_data(jsonl_path1, jsonl_path2)
+        self.load_data(list(jsonl_paths))
         
         if not self.records:
-            QtWidgets.QMessageBox.critical(self, "错误", "无法加载数据，或两个文件没有共同的 ID。")
+            QtWidgets.QMessageBox.critical(self, "错误", "无法加载数据，或文件中没有任何 ID。")
             QtCore.QTimer.singleShot(0, self.close)
             return
 
         self.init_ui()
+        if report:
+            try:
+                self.divergence = read_report_divergence(report)
+                print(f"已载入差异报告: {report} ({len(self.divergence)} 个 ID)")
+                self.set_divergence_order(True)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"警告: 无法读取差异报告 {report}: {e}")
         self.update_display()
         self.show()
 
@@ -172,138 +245,329 @@ class ResultViewer(QtWidgets.QWidget):
         初始化 UI 布局 (修改为对比布局)
         """
         # --- 1. 顶部：图像 ---
-        self.image_label = ImageLabel()
-        self.image_label.setText("正在加载图像...")
+        self.image_strip = ImageStrip(self.image_pipeline)
 
-        # --- 2. 底部：文本 (左右分割) ---
-        
-        # 💡 修改：左侧显示文件1的回复
-        self.group_1 = QtWidgets.QGroupBox(f"文件 A: {self.filename1}")
-        layout_1 = QtWidgets.QVBoxLayout()
-        self.text_area_1 = QtWidgets.QTextEdit()
-        self.text_area_1.setReadOnly(True)
-        layout_1.addWidget(self.text_area_1)
-        self.group_1.setLayout(layout_1)
-        layout_1.setContentsMargins(10, 10, 10, 10)
-
-        # 💡 修改：右侧显示文件2的回复
-        self.group_2 = QtWidgets.QGroupBox(f"文件 B: {self.filename2}")
-        layout_2 = QtWidgets.QVBoxLayout()
-        self.text_area_2 = QtWidgets.QTextEdit()
-        self.text_area_2.setReadOnly(True)
-        layout_2.addWidget(self.text_area_2)
-        self.group_2.setLayout(layout_2)
-        layout_2.setContentsMargins(10, 10, 10, 10)
-
-        # 2c. 分割器
+        # --- 2. 底部：文本 (每个文件一栏) ---
+        self.groups = []
+        self.text_areas = []
         self.text_splitter = QtWidgets.QSplitter(QtCore.Qt.Horizontal)
-        self.text_splitter.addWidget(self.group_1)
-        self.text_splitter.addWidget(self.group_2)
-        self.text_splitter.setSizes([400, 400])
+        for index, filename in enumerate(self.filenames):
+            group = QtWidgets.QGroupBox(f"文件 {file_label(index)}: {filename}")
+            layout = QtWidgets.QVBoxLayout()
+            text_area = QtWidgets.QTextEdit()
+            text_area.setReadOnly(True)
+            layout.addWidget(text_area)
+            group.setLayout(layout)
+            layout.setContentsMargins(10, 10, 10, 10)
+            self.text_splitter.addWidget(group)
+            self.groups.append(group)
+            self.text_areas.append(text_area)
+        self.text_splitter.setSizes([400] * len(self.filenames))
 
         # --- 3. 整体布局 (上下分割) ---
         self.main_splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
-        self.main_splitter.addWidget(self.image_label)
+        self.main_splitter.addWidget(self.image_strip)
         self.main_splitter.addWidget(self.text_splitter)
         self.main_splitter.setSizes([600, 400])
 
-        # --- 4. 设置为主窗口布局 ---
+        # --- 4. 筛选栏 (连接结果没有对应的文件, 索引建立在内存中) ---
+        self.search_bar = SearchBar(SearchIndex(), self.records, compare_search_fields)
+        self.search_bar.filter_changed.connect(self.on_filter_changed)
+        QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+F"), self, activated=self.search_bar.focus)
+
+        # --- 5. 设置为主窗口布局 ---
         main_layout = QtWidgets.QVBoxLayout()
+        main_layout.addWidget(self.search_bar)
         main_layout.addWidget(self.main_splitter)
         self.setLayout(main_layout)
         main_layout.setContentsMargins(10, 10, 10, 10)
         
-        # --- 5. 窗口设置 ---
-        self.setGeometry(100, 100, 1200, 900)
+        # --- 6. 窗口设置 ---
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.setGeometry(100, 100, 400 * max(3, len(self.filenames)), 900)
         self.setWindowTitle("LLM 结果对比浏览器")
 
-    def load_data(self, jsonl_path1: str, jsonl_path2: str):
-        """
-        💡 新增：加载两个文件，并按 ID 匹配
+    def load_data(self, jsonl_paths: List[str]):
         """
-        data_map1 = {}
-        data_map2 = {}
+        加载各个结果文件并按 ID 连接
 
-        # --- 加载文件 1 ---
-        print(f"正在加载文件 1: {self.filename1}")
+        每个文件只建立 id -> 位置的索引(未压缩的 .jsonl 只解析每行开头的 id), 数据在显示时才读取;
+        压缩文件无法随机读取, 仍然整体读入内存。
+        """
         try:
-            with open(jsonl_path1, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        record = json.loads(line)
-                        data_map1[record['id']] = record
-                    except (json.JSONDecodeError, KeyError):
-                        print(f"警告: 跳过文件1中无法解析或缺少'id'的行: {line[:50]}...")
-        except FileNotFoundError:
-            print(f"错误: 文件未找到 {jsonl_path1}")
+            self.join = ResultJoin(jsonl_paths)
+        except FileNotFoundError as e:
+            print(f"错误: 文件未找到 {e}")
             return # 无法继续
-        
-        # --- 加载文件 2 ---
-        print(f"正在加载文件 2: {self.filename2}")
-        try:
-            with open(jsonl_path2, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        record = json.loads(line)
-                        data_map2[record['id']] = record
-                    except (json.JSONDecodeError, KeyError):
-                        print(f"警告: 跳过文件2中无法解析或缺少'id'的行: {line[:50]}...")
-        except FileNotFoundError:
-            print(f"错误: 文件未找到 {jsonl_path2}")
+        except Exception as e:
+            print(f"错误: 无法读取结果文件: {e}")
             return # 无法继续
 
-        # --- 匹配共同 ID ---
-        common_ids = set(data_map1.keys()) & set(data_map2.keys())
-        print(f"加载完成，共找到 {len(common_ids)} 个共同 ID。")
+        for index, source in enumerate(self.join.sources):
+            skipped = f", 跳过 {source.skipped} 行无法解析或缺少'id'的数据" if source.skipped else ""
+            print(f"文件 {file_label(index)}: {source.name}, {len(source.keys)} 个 ID{skipped}")
 
-        # --- 构建合并后的记录列表 ---
-        for common_id in sorted(list(common_ids)): # 排序以保证顺序
-            try:
-                record1 = data_map1[common_id]
-                record2 = data_map2[common_id]
-                
-                # 假设 image 路径相同，取文件1的
-                image_path = record1['image']
-                
-                merged_record = {
-                    'id': common_id,
-                    'image': image_path,
-                    'answer_1': record1['conversation'][1]['value'], # 文件1的回复
-                    'answer_2': record2['conversation'][1]['value']  # 文件2的回复
-                }
-                self.records.append(merged_record)
-                
-            except Exception as e:
-                print(f"警告: 合并 ID {common_id} 时出错 (数据可能不完整): {e}")
+        # --- 缺失情况 ---
+        print(f"加载完成，共 {len(self.join)} 个 ID，其中 {self.join.complete_count()} 个在所有文件中都有结果。")
+        for index, missing in enumerate(self.join.missing_counts()):
+            if missing:
+                print(f"  文件 {file_label(index)} 缺失 {missing} 个 ID")
+        self.records = self.join
 
     def update_display(self):
         """
-        💡 修改：根据 self.records 的新结构更新显示
+        💡 修改：根据连接后的记录更新显示
         """
         if not (0 <= self.current_index < len(self.records)):
             return
             
         record = self.records[self.current_index]
+        self.current_record = record
 
-        # --- 更新图像 ---
+        # --- 更新图像 (后台按显示尺寸解码, 命中缓存时立即显示; 多图记录显示全部图像) ---
         try:
-            image_path = record['image'][0] # 仍然取列表的第一个
-            pixmap = QtGui.QPixmap(image_path)
-            if pixmap.isNull():
-                self.image_label.setText(f"无法加载图像:\n{image_path}")
-                self.image_label.setPixmap(QtGui.QPixmap())
-            else:
-                self.image_label.setPixmap(pixmap)
+            self.image_strip.show_images(record['image'])
         except Exception as e:
-            self.image_label.setText(f"加载图像时出错:\n{e}")
-            self.image_label.setPixmap(QtGui.QPixmap())
-
-        # --- 更新文本 (不再显示 human) ---
-        self.text_area_1.setText(record.get('answer_1', "** 加载失败 **"))
-        self.text_area_2.setText(record.get('answer_2', "** 加载失败 **"))
+            self.image_strip.show_message(f"加载图像时出错:\n{e}")
+        self.prefetch_neighbours()
+
+        # --- 更新文本 (不再显示 human), 缺失的文件显式标出, 与文件 A 不同的部分高亮 ---
+        answers = record['answers']
+        for index, (group, text_area, answer) in enumerate(zip(self.groups, self.text_areas, answers)):
+            title = f"文件 {file_label(index)}: {self.filenames[index]}"
+            if answer is None:
+                group.setTitle(f"{title} (缺失)")
+                text_area.setText("** 此文件中没有该 ID 的结果 **")
+                continue
+            group.setTitle(title)
+            # 文件 A 与文件 B 比较, 其余文件与文件 A 比较
+            reference = answers[1] if index == 0 else answers[0]
+            if self.highlight and reference is not None and reference != answer:
+                segments = diff_segments(reference, answer)[1]
+                text_area.setHtml(segments_html(segments))
+            else:
+                text_area.setPlainText(answer)
             
         # --- 更新窗口标题 ---
-        self.setWindowTitle(f"对比浏览器 ({self.current_index + 1}/{len(self.records)}) - ID: {record['id']}")
+        self.update_title()
+
+    def update_title(self):
+        """
+        更新窗口标题: 位置、当前数据的 id、缺失、筛选/排序与跟随状态
+        """
+        follow = "  [跟随]" if self.follower is not None else ""
+        missing = self.current_record['answers'].count(None)
+        missing = f"  [缺失 {missing}/{len(self.filenames)}]" if missing else ""
+        self.setWindowTitle(f"对比浏览器 ({self.current_index + 1}/{len(self.records)}) - ID: {self.current_record['id']}{missing}{self.navigation_title()}{follow}")
+
+    def navigation_title(self) -> str:
+        """
+        窗口标题中的筛选/排序状态
+        """
+        if self.nav_rows is None:
+            return ""
+        detail = ""
+        if self.divergence_order is not None:
+            label = "差异排序" if self.filtered_rows is None else "筛选+差异排序"
+            divergence = self.divergence.get(str(self.current_record['id']))
+            detail = f", 差异度 {divergence:.2f}" if divergence is not None else ", 无差异度"
+        else:
+            label = "筛选"
+        position = self.nav_pos.get(self.current_index)
+        if position is not None:
+            return f"  [{label} {position + 1}/{len(self.nav_rows)}{detail}]"
+        return f"  [{label} 共 {len(self.nav_rows)} 条, 当前数据不在其中]"
+
+    def rebuild_navigation(self):
+        """
+        由筛选结果与差异度排序得到实际的浏览顺序
+        """
+        rows = self.filtered_rows
+        if self.divergence_order is not None:
+            if rows is not None:
+                keep = set(rows)
+                rows = [row for row in self.divergence_order if row in keep]
+            else:
+                rows = self.divergence_order
+        self.nav_rows = rows
+        self.nav_pos = {row: position for position, row in enumerate(rows)} if rows is not None else {}
+
+    def enter_navigation(self):
+        """
+        浏览顺序变化后, 当前数据不在其中时跳到第一条(按 id 顺序时为当前位置之后的第一条)
+        """
+        rows = self.nav_rows
+        if rows and self.current_index not in self.nav_pos:
+            if self.divergence_order is None:
+                position = bisect_left(rows, self.current_index)
+                self.current_index = rows[position] if position < len(rows) else rows[0]
+            else:
+                self.current_index = rows[0]
+            self.direction = 1
+
+    def on_filter_changed(self, rows):
+        """
+        应用筛选结果: 跳到当前位置之后的第一条匹配数据
+        """
+        self.filtered_rows = rows
+        self.rebuild_navigation()
+        self.enter_navigation()
+        self.setFocus()
+        self.update_display()
+
+    def toggle_divergence_order(self):
+        """
+        切换"差异最大的优先"的浏览顺序, 没有差异度时先在后台计算
+        """
+        if self.divergence_order is not None:
+            self.set_divergence_order(False)
+            self.update_display()
+            return
+        if self.divergence is not None:
+            self.set_divergence_order(True)
+            self.update_display()
+            return
+        if self.divergence_worker is not None:
+            print("正在计算差异度, 请稍候。")
+            return
+        print("正在后台计算差异度, 完成后自动按差异度从大到小浏览。")
+        self.divergence_worker = DivergenceWorker(self.join, self)
+        self.divergence_worker.progress.connect(
+            lambda done, total: self.setWindowTitle(f"对比浏览器 - 正在计算差异度 {done}/{total}"))
+        self.divergence_worker.finished.connect(self.on_divergence_ready)
+        self.divergence_worker.start()
+
+    def on_divergence_ready(self):
+        """
+        后台计算的差异度就绪
+        """
+        worker, self.divergence_worker = self.divergence_worker, None
+        if worker.divergence is None:
+            return
+        self.divergence = worker.divergence
+        print(f"差异度计算完成 ({len(self.divergence)} 个可比较的 ID)。")
+        self.set_divergence_order(True)
+        self.update_display()
+
+    def set_divergence_order(self, enabled: bool):
+        """
+        开启时按差异度从大到小浏览(没有差异度的 id, 即有缺失或失败的, 排在最后), 并跳到差异最大的一条
+        """
+        if not enabled:
+            self.divergence_order = None
+            self.rebuild_navigation()
+            return
+        scored = []
+        rest = []
+        for row in range(len(self.records)):
+            divergence = self.divergence.get(self.join.ids[row])
+            if divergence is None:
+                rest.append(row)
+            else:
+                scored.append((divergence, row))
+        scored.sort(key=lambda item: -item[0])
+        self.divergence_order = [row for _, row in scored] + rest
+        self.rebuild_navigation()
+        if self.nav_rows:
+            self.current_index = self.nav_rows[0]
+            self.direction = 1
+
+    def toggle_highlight(self):
+        """
+        开关差异高亮
+        """
+        self.highlight = not self.highlight
+        self.update_display()
+
+    def toggle_follow(self):
+        """
+        开关跟随模式: 监视结果文件, 只解析新追加的完整行
+        """
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower.deleteLater()
+            self.follower = None
+            print("已关闭跟随模式。")
+        elif not self.join.followable:
+            print("跟随模式只支持未压缩的 .jsonl 文件。")
+            return
+        else:
+            self.follower = FileFollower([source.path for source in self.join.sources if source.followable], self)
+            self.follower.changed.connect(self.on_files_changed)
+            self.follower.start()
+            print("已开启跟随模式: 正在查看最后一条时自动跳到最新的数据。")
+            self.on_files_changed()
+        self.update_title()
+
+    def on_files_changed(self):
+        """
+        结果文件有变化: 为新追加的完整行建立 id 索引, 新的 id 追加到末尾, 已有 id 的结果原地更新
+        """
+        at_last = self.current_index == len(self.records) - 1
+        appended, updated_rows = self.join.refresh()
+        if appended:
+            print(f"跟随: 新增 {appended} 个 ID。")
+            self.search_bar.records_appended()
+            if self.divergence_order is not None:
+                # 新的 id 还没有差异度, 排在最后
+                self.divergence_order.extend(range(len(self.records) - appended, len(self.records)))
+                self.rebuild_navigation()
+        if updated_rows:
+            self.search_bar.records_updated(updated_rows)
+
+        position = bisect_left(updated_rows, self.current_index)
+        if appended and at_last and self.nav_rows is None:
+            self.current_index = len(self.records) - 1
+            self.direction = 1
+            self.update_display()
+        elif position < len(updated_rows) and updated_rows[position] == self.current_index:
+            # 当前数据的结果有更新(例如缺失的结果到达)
+            self.update_display()
+        elif appended:
+            self.update_title()
+
+    def jump_to_last(self):
+        """
+        跳到最后一条数据
+        """
+        self.current_index = len(self.records) - 1
+        self.direction = -1
+        self.update_display()
+
+    def prefetch_neighbours(self):
+        """
+        在后台预取浏览方向上后续几条数据的图像
+        """
+        if self.nav_rows is None:
+            indices = neighbour_indices(self.current_index, len(self.records), direction=self.direction)
+        else:
+            # 筛选/排序时预取浏览顺序中相邻的数据
+            position = self.nav_pos.get(self.current_index, 0)
+            indices = [self.nav_rows[i] for i in neighbour_indices(position, len(self.nav_rows), direction=self.direction)]
+        path_groups = []
+        for i in indices:
+            try:
+                path_groups.append(self.records[i]['image'])
+            except (ValueError, IndexError, KeyError, TypeError):
+                continue
+        self.image_strip.prefetch(path_groups)
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        """
+        关闭窗口前停止后台解码与索引
+        """
+        self.image_pipeline.shutdown()
+        if self.follower is not None:
+            self.follower.stop()
+        if hasattr(self, 'search_bar'):
+            self.search_bar.shutdown()
+        if self.divergence_worker is not None:
+            self.divergence_worker.finished.disconnect(self.on_divergence_ready)
+            self.divergence_worker.requestInterruption()
+            self.divergence_worker.wait()
+        if self.join is not None:
+            self.join.close()
+        super().closeEvent(event)
 
     def keyPressEvent(self, event: QtGui.QKeyEvent):
         """
@@ -315,6 +579,14 @@ class ResultViewer(QtWidgets.QWidget):
             self.prev_item()
         elif key == QtCore.Qt.Key_D:
             self.next_item()
+        elif key == QtCore.Qt.Key_F:
+            self.toggle_follow()
+        elif key == QtCore.Qt.Key_End:
+            self.jump_to_last()
+        elif key == QtCore.Qt.Key_S:
+            self.toggle_divergence_order()
+        elif key == QtCore.Qt.Key_H:
+            self.toggle_highlight()
         else:
             super().keyPressEvent(event)
 
@@ -322,8 +594,11 @@ class ResultViewer(QtWidgets.QWidget):
         """
         (复用) 切换到上一个项目
         """
-        if self.current_index > 0:
+        if self.nav_rows is not None:
+            self.step_navigation(-1)
+        elif self.current_index > 0:
             self.current_index -= 1
+            self.direction = -1
             self.update_display()
         else:
             print("已是第一条。")
@@ -332,69 +607,91 @@ class ResultViewer(QtWidgets.QWidget):
         """
         (复用) 切换到下一个项目
         """
-        if self.current_index < len(self.records) - 1:
+        if self.nav_rows is not None:
+            self.step_navigation(1)
+        elif self.current_index < len(self.records) - 1:
             self.current_index += 1
+            self.direction = 1
             self.update_display()
         else:
             print("已是最后一条。")
 
+    def step_navigation(self, direction: int):
+        """
+        在筛选/排序后的浏览顺序中切换到上一条(-1)或下一条(1)
+        """
+        position = self.nav_pos.get(self.current_index)
+        if position is not None:
+            position += direction
+            row = self.nav_rows[position] if 0 <= position < len(self.nav_rows) else None
+        elif self.divergence_order is None:
+            # 当前数据不在筛选结果中: 按 id 顺序找相邻的匹配数据
+            row = step_row(self.nav_rows, self.current_index, direction)
+        else:
+            row = self.nav_rows[0] if self.nav_rows else None
+        if row is None:
+            print("已是第一条。" if direction < 0 else "已是最后一条。")
+            return
+        self.current_index = row
+        self.direction = direction
+        self.update_display()
+
 
 def main():
     """
-    主函数：启动应用并显示文件选择对话框
+    主函数：解析命令行中的结果文件, 未指定时依次显示文件选择对话框
     """
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="并排对比多个结果文件(每个模型一个)中的回答")
+    parser.add_argument('files', nargs='*', help="结果文件(.jsonl / .jsonl.gz / .db), 不指定时依次弹出文件选择框")
+    parser.add_argument('--report', type=str, default=None, help="diff_results.py 生成的差异报告, 指定时按差异度从大到小浏览")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv[:1])
     
     app.setStyleSheet(APP_STYLESHEET)
     font = QtGui.QFont("Microsoft YaHei", 10)
     app.setFont(font)
 
-    # 💡 --- 修改开始 ---
-    # 1. 弹出文件选择框，选择第一个文件
-    jsonl_path1, _ = QtWidgets.QFileDialog.getOpenFileName(
-        None, 
-        "请选择第一个 .jsonl 文件 (文件 A)", 
-        "", 
-        "JSONL Files (*.jsonl);;All Files (*)"
-    )
-    
-    # 检查用户是否取消了第一个选择
-    if not jsonl_path1:
-        print("未选择第一个文件，程序退出。")
-        sys.exit(0)
-
-    # 2. 弹出文件选择框，选择第二个文件
-    jsonl_path2, _ = QtWidgets.QFileDialog.getOpenFileName(
-        None, 
-        "请选择第二个 .jsonl 文件 (文件 B)", 
-        # 默认打开与第一个文件相同的目录，方便操作
-        os.path.dirname(jsonl_path1), 
-        "JSONL Files (*.jsonl);;All Files (*)"
-    )
-    
-    # 检查用户是否取消了第二个选择
-    if not jsonl_path2:
-        print("未选择第二个文件，程序退出。")
+    # 1. 依次选择结果文件, 选够两个之后取消即开始对比
+    jsonl_paths = list(args.files)
+    if not jsonl_paths:
+        directory = ""
+        while True:
+            count = len(jsonl_paths)
+            hint = "，取消则开始对比" if count >= 2 else ""
+            path, _ = QtWidgets.QFileDialog.getOpenFileName(
+                None,
+                f"请选择第 {count + 1} 个结果文件 (文件 {file_label(count)}){hint}",
+                # 默认打开与上一个文件相同的目录，方便操作
+                directory,
+                FILE_FILTER
+            )
+            if not path:
+                break
+            jsonl_paths.append(path)
+            directory = os.path.dirname(path)
+
+    if len(jsonl_paths) < 2:
+        print("至少需要两个结果文件，程序退出。")
         sys.exit(0)
 
-    # 3. 检查是否选择了同一个文件
-    if jsonl_path1 == jsonl_path2:
+    # 2. 检查是否选择了同一个文件
+    if len({os.path.abspath(path) for path in jsonl_paths}) < len(jsonl_paths):
         msg_box = QtWidgets.QMessageBox()
         msg_box.setStyleSheet(APP_STYLESHEET)
         msg_box.setIcon(QtWidgets.QMessageBox.Warning)
         msg_box.setWindowTitle("选择错误")
-        msg_box.setText("您选择了同一个文件两次。请选择两个不同的文件进行比较。")
+        msg_box.setText("您多次选择了同一个文件。请选择不同的文件进行比较。")
         msg_box.exec_()
         print("用户选择了同一个文件，程序退出。")
         sys.exit(0)
 
-    # 4. 启动对比窗口
-    print(f"文件 A: {jsonl_path1}")
-    print(f"文件 B: {jsonl_path2}")
-    viewer = ResultViewer(jsonl_path1, jsonl_path2)
+    # 3. 启动对比窗口
+    for index, path in enumerate(jsonl_paths):
+        print(f"文件 {file_label(index)}: {path}")
+    viewer = ResultViewer(*jsonl_paths, report=args.report)
     sys.exit(app.exec_())
-    # 💡 --- 修改结束 ---
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,85 @@
+"""
+跟随正在被写入的结果文件
+
+FileFollower 同时使用 QFileSystemWatcher 与定时轮询(比较文件大小与修改时间)监视文件:
+文件系统通知在网络盘、WSL 挂载目录等环境下可能收不到，文件被替换后也会失效，轮询作为兜底。
+写入方每写一条结果都会触发通知，changed 信号经过防抖合并后才发出，由浏览器只解析新追加的完整行。
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+from PyQt5 import QtCore
+
+# 轮询文件大小的间隔(毫秒)
+POLL_MS = 1000
+# 合并连续变化通知的等待时间(毫秒)
+DEBOUNCE_MS = 200
+
+
+def _file_state(path: str) -> Optional[Tuple[int, int, int]]:
+    """文件的 (大小, 修改时间, inode), 文件不存在时返回None; 文件被原子替换时 inode 改变"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class FileFollower(QtCore.QObject):
+    """
+    监视一个或多个文件, 文件变化时(防抖后)发出 changed 信号
+    """
+    changed = QtCore.pyqtSignal()
+
+    def __init__(self, paths: List[str], parent: Optional[QtCore.QObject] = None,
+                 poll_ms: int = POLL_MS, debounce_ms: int = DEBOUNCE_MS):
+        """
+        Args:
+            paths (List[str]): 要监视的文件
+            poll_ms (int): 轮询间隔(毫秒)
+            debounce_ms (int): 合并连续变化通知的等待时间(毫秒)
+        """
+        super().__init__(parent)
+        self.paths = list(paths)
+        self._states: Dict[str, Optional[Tuple[int, int, int]]] = {path: _file_state(path) for path in self.paths}
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.setInterval(poll_ms)
+        self.poll_timer.timeout.connect(self._poll)
+
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.timeout.connect(self.changed)
+
+    def start(self):
+        self._watch()
+        self.poll_timer.start()
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.debounce_timer.stop()
+        watched = self.watcher.files()
+        if watched:
+            self.watcher.removePaths(watched)
+
+    def _watch(self):
+        """(重新)监视所有存在的文件: 文件被替换或删除后重建时, 原来的监视会失效"""
+        watched = set(self.watcher.files())
+        missing = [path for path in self.paths if path not in watched and os.path.exists(path)]
+        if missing:
+            self.watcher.addPaths(missing)
+
+    def _on_file_changed(self, path: str):
+        self._states[path] = _file_state(path)
+        self.debounce_timer.start()
+
+    def _poll(self):
+        self._watch()
+        for path in self.paths:
+            state = _file_state(path)
+            if state != self._states.get(path):
+                self._states[path] = state
+                self.debounce_timer.start()
@@ -0,0 +1,406 @@
+"""
+浏览器共用的图像加载管线与显示控件
+
+- 图像在 QThreadPool 的后台线程中解码(QImage 可以在非 GUI 线程中使用)，GUI 线程只负责把解码结果转换为 QPixmap 并显示。
+- 按显示尺寸解码: 通过 QImageReader.setScaledSize 直接解码到接近显示区域的大小(JPEG 在解码阶段即可缩小)，
+  而不是先解码原图再缩放。显示尺寸按 256 像素取整，窗口大小的微小变化不会触发重新解码。
+- 切换到某条数据时，同时在后台预取前后若干条数据的图像，按方向优先预取前进方向上的图像。
+- 解码后的图像保存在按内存大小限制的 LRU 缓存中，来回翻看时无需重新解码。
+- 不再需要的排队任务(例如按住 D 键快速翻过的图像)会被撤回，解码队列不会越积越长。
+
+显示控件:
+- ImageLabel: 保持长宽比缩放显示图像。调整窗口大小的过程中使用快速缩放，停止调整后再平滑缩放一次，
+  平滑缩放的结果按控件尺寸缓存。
+- ImageStrip: 显示一条数据的全部图像，单图铺满，多图排列成网格，每张图按格子大小在后台解码。
+"""
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+# 预取当前数据前进方向上的数据条数
+PREFETCH_COUNT = 4
+# 解码缓存的内存上限(字节)
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 解码尺寸的取整粒度(像素)
+SIZE_BUCKET = 256
+# 调整窗口大小停止多久后进行平滑缩放与按新尺寸重新解码(毫秒)
+SETTLE_MS = 150
+
+# 任务优先级: 当前显示的图像最先解码, 预取的图像按距离递减
+_PRIORITY_CURRENT = 100
+
+# 缓存键: (图像路径, 解码区域宽, 解码区域高)
+ImageKey = Tuple[str, int, int]
+
+
+def image_paths(image: Any) -> List[str]:
+    """数据中的 'image' 字段统一为路径列表: 单张图像可能直接保存为字符串, 缺失时为空列表"""
+    if isinstance(image, str):
+        return [image]
+    return list(image or [])
+
+
+def image_key(path: str, size: QtCore.QSize) -> ImageKey:
+    """图像在某个显示尺寸下的缓存键, 尺寸向上取整到 SIZE_BUCKET 的倍数"""
+    width = max(1, math.ceil(size.width() / SIZE_BUCKET)) * SIZE_BUCKET
+    height = max(1, math.ceil(size.height() / SIZE_BUCKET)) * SIZE_BUCKET
+    return (path, width, height)
+
+
+def neighbour_indices(index: int, count: int, prefetch: int = PREFETCH_COUNT, direction: int = 1) -> List[int]:
+    """当前数据附近需要预取的数据序号, 按优先级排序
+
+    Args:
+        index (int): 当前数据的序号
+        count (int): 数据总数
+        prefetch (int): 前进方向上预取的数量(反方向只预取 1 条)
+        direction (int): 最近一次的翻页方向, 1 为向后, -1 为向前
+
+    Returns:
+        List[int]: 需要预取的序号
+    """
+    direction = 1 if direction >= 0 else -1
+    candidates = [index + direction * step for step in range(1, prefetch + 1)] + [index - direction]
+    return [i for i in candidates if 0 <= i < count]
+
+
+class PixmapCache:
+    """
+    按内存大小限制的 LRU 缓存: 缓存键 -> QPixmap
+    """
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items: 'OrderedDict[ImageKey, QtGui.QPixmap]' = OrderedDict()
+
+    @staticmethod
+    def cost(pixmap: QtGui.QPixmap) -> int:
+        """图像占用的内存(字节)"""
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key: ImageKey) -> Optional[QtGui.QPixmap]:
+        pixmap = self._items.get(key)
+        if pixmap is not None:
+            self._items.move_to_end(key)
+        return pixmap
+
+    def put(self, key: ImageKey, pixmap: QtGui.QPixmap):
+        if key in self._items:
+            self.total_bytes -= self.cost(self._items.pop(key))
+        self._items[key] = pixmap
+        self.total_bytes += self.cost(pixmap)
+        # 淘汰最久未使用的图像, 但至少保留刚放入的这一张
+        while self.total_bytes > self.max_bytes and len(self._items) > 1:
+            _, evicted = self._items.popitem(last=False)
+            self.total_bytes -= self.cost(evicted)
+
+    def __contains__(self, key: ImageKey) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def decode_image(path: str, box: Optional[QtCore.QSize] = None) -> QtGui.QImage:
+    """解码图像文件(按 EXIF 方向旋转), 失败时返回空 QImage
+
+    Args:
+        path (str): 图像路径
+        box (Optional[QtCore.QSize]): 显示区域大小, 原图更大时直接解码为保持长宽比、恰好放入该区域的尺寸
+    """
+    reader = QtGui.QImageReader(path)
+    reader.setAutoTransform(True)
+    original = reader.size()
+    if box is not None and original.isValid():
+        # EXIF 旋转 90 度的图像, 解码尺寸与显示尺寸的宽高互换
+        if reader.transformation() & QtGui.QImageIOHandler.TransformationRotate90:
+            box = box.transposed()
+        scaled = original.scaled(box, QtCore.Qt.KeepAspectRatio)
+        if scaled.width() < original.width() and not scaled.isEmpty():
+            reader.setScaledSize(scaled)
+    image = reader.read()
+    if image.isNull():
+        return image
+    # 预先转换为显示用的像素格式, GUI 线程中转换为 QPixmap 时无需再次转换
+    target = QtGui.QImage.Format_ARGB32_Premultiplied if image.hasAlphaChannel() else QtGui.QImage.Format_RGB32
+    return image.convertToFormat(target)
+
+
+class _DecodeTask(QtCore.QRunnable):
+    """
+    在线程池中解码一张图像, 完成后通过管线的信号把结果送回 GUI 线程
+    """
+    def __init__(self, pipeline: 'ImagePipeline', key: ImageKey):
+        super().__init__()
+        self.pipeline = pipeline
+        self.key = key
+        self.started = False
+
+    def run(self):
+        self.started = True
+        path, width, height = self.key
+        self.pipeline._decoded.emit(self.key, decode_image(path, QtCore.QSize(width, height)))
+
+
+class ImagePipeline(QtCore.QObject):
+    """
+    后台解码、预取并缓存图像
+
+    用法:
+        pipeline.image_ready.connect(on_image_ready)       # 后台解码完成的图像
+        pixmaps = pipeline.request([key, ...])              # 命中缓存的直接返回, 其余在后台解码后通过 image_ready 送达
+        pipeline.prefetch([key, ...])                       # 预取附近数据的图像
+    """
+    # (缓存键, 图像), 解码失败时图像为空 QPixmap
+    image_ready = QtCore.pyqtSignal(object, QtGui.QPixmap)
+    _decoded = QtCore.pyqtSignal(object, QtGui.QImage)
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None, max_bytes: int = CACHE_MAX_BYTES, max_threads: Optional[int] = None):
+        """
+        Args:
+            parent (Optional[QtCore.QObject]): 父对象
+            max_bytes (int): 解码缓存的内存上限(字节)
+            max_threads (Optional[int]): 解码线程数, 默认为 min(4, CPU核数)
+        """
+        super().__init__(parent)
+        self.cache = PixmapCache(max_bytes)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads or max(1, min(4, QtCore.QThread.idealThreadCount())))
+        self._pending: Dict[ImageKey, _DecodeTask] = {}     # 排队或正在解码的任务
+        self._wanted: Set[ImageKey] = set()                 # 当前需要显示的图像
+        self._decoded.connect(self._on_decoded)
+
+    def request(self, keys: Sequence[ImageKey]) -> List[Optional[QtGui.QPixmap]]:
+        """请求显示一组图像(替换之前请求的图像)
+
+        Returns:
+            List[Optional[QtGui.QPixmap]]: 与 keys 一一对应, 命中缓存时为图像;
+                否则为None, 解码完成后通过 image_ready 信号送达
+        """
+        self._wanted = set(keys)
+        pixmaps = []
+        for key in keys:
+            pixmap = self.cache.get(key)
+            if pixmap is None:
+                self._schedule(key, _PRIORITY_CURRENT)
+            pixmaps.append(pixmap)
+        return pixmaps
+
+    def prefetch(self, keys: Iterable[ImageKey]):
+        """在后台预取图像(按传入顺序的优先级), 并撤回不再需要的排队任务"""
+        keys = [key for key in dict.fromkeys(keys) if key not in self.cache]
+        self._cancel_except(set(keys) | self._wanted)
+        for rank, key in enumerate(keys):
+            self._schedule(key, _PRIORITY_CURRENT - 1 - rank)
+
+    def _schedule(self, key: ImageKey, priority: int):
+        if key in self._pending:
+            return
+        task = _DecodeTask(self, key)
+        self._pending[key] = task
+        self.pool.start(task, priority)
+
+    def _cancel_except(self, keep: Set[ImageKey]):
+        """撤回尚未开始解码且不在 keep 中的任务"""
+        for key, task in list(self._pending.items()):
+            if key not in keep and not task.started and self.pool.tryTake(task):
+                del self._pending[key]
+
+    def _on_decoded(self, key: ImageKey, image: QtGui.QImage):
+        """(GUI 线程) 将解码结果转换为 QPixmap 并放入缓存"""
+        self._pending.pop(key, None)
+        pixmap = QtGui.QPixmap.fromImage(image) if not image.isNull() else QtGui.QPixmap()
+        if not pixmap.isNull():
+            self.cache.put(key, pixmap)
+        if key in self._wanted:
+            self.image_ready.emit(key, pixmap)
+
+    def shutdown(self):
+        """撤回所有排队的任务并等待正在解码的任务结束"""
+        self.pool.clear()
+        self._pending.clear()
+        self.pool.waitForDone()
+
+
+class ImageLabel(QtWidgets.QLabel):
+    """
+    一个自定义的 QLabel, 它可以自动缩放 pixmap 以适应标签大小，
+    同时保持图像的长宽比。
+
+    调整大小的过程中使用快速缩放, 停止调整 SETTLE_MS 毫秒后再平滑缩放一次;
+    平滑缩放的结果按标签尺寸缓存(最近的几个尺寸), 来回调整窗口时无需重新缩放。
+    """
+    SCALED_CACHE_SIZE = 4
+
+    def __init__(self, *args, min_size: Tuple[int, int] = (400, 300), **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pixmap = QtGui.QPixmap()
+        self._scaled: 'OrderedDict[Tuple[int, int], QtGui.QPixmap]' = OrderedDict()
+        self._settle_timer = QtCore.QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.setInterval(SETTLE_MS)
+        self._settle_timer.timeout.connect(self.update_pixmap)
+        self.setAlignment(QtCore.Qt.AlignCenter)
+        self.setMinimumSize(*min_size) # 设置一个最小尺寸
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+
+    def setPixmap(self, pixmap: QtGui.QPixmap):
+        """
+        设置 pixmap 并触发更新; 传入空 pixmap 时清空标签(之后可以用 setText 显示提示)
+        """
+        if not pixmap.isNull() and pixmap.cacheKey() == self._pixmap.cacheKey():
+            return      # 同一张图像(例如重新请求时命中缓存), 保留已缩放的结果
+        self._pixmap = pixmap
+        self._scaled.clear()
+        if pixmap.isNull():
+            self.clear()
+        else:
+            self.update_pixmap()
+
+    def resizeEvent(self, event: QtGui.QResizeEvent):
+        """
+        当窗口/标签大小改变时，先快速缩放，停止调整后再平滑缩放。
+        """
+        self.update_pixmap(smooth=False)
+        self._settle_timer.start()
+        super().resizeEvent(event)
+
+    def update_pixmap(self, smooth: bool = True):
+        """
+        核心缩放逻辑：将 self._pixmap 缩放到当前标签大小并显示。
+        """
+        if self._pixmap.isNull():
+            # 没有图像时保留标签上的文字提示
+            return
+
+        size_key = (self.width(), self.height())
+        scaled_pixmap = self._scaled.get(size_key)
+        if scaled_pixmap is not None:
+            self._scaled.move_to_end(size_key)
+        elif smooth:
+            # 缩放图像以适应当前标签大小，保持长宽比
+            scaled_pixmap = self._pixmap.scaled(self.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            self._scaled[size_key] = scaled_pixmap
+            while len(self._scaled) > self.SCALED_CACHE_SIZE:
+                self._scaled.popitem(last=False)
+        else:
+            scaled_pixmap = self._pixmap.scaled(self.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation)
+        # 调用父类的 setPixmap 来真正显示图像
+        super().setPixmap(scaled_pixmap)
+
+
+class ImageStrip(QtWidgets.QWidget):
+    """
+    显示一条数据的全部图像: 单图铺满, 多图排列成网格(不超过 4 张时排成一行)。
+    每张图按所在格子的大小在后台解码, 调整窗口大小后按新尺寸重新解码。
+    """
+    SPACING = 4
+
+    def __init__(self, pipeline: ImagePipeline, parent: Optional[QtWidgets.QWidget] = None):
+        super().__init__(parent)
+        self.pipeline = pipeline
+        self.pipeline.image_ready.connect(self._on_image_ready)
+        self.paths: List[str] = []
+        self.labels: List[ImageLabel] = []
+        self._shown: List[Optional[str]] = []      # 每个格子当前显示的图像路径
+        self._keys: List[ImageKey] = []
+        self._grid = QtWidgets.QGridLayout(self)
+        self._grid.setContentsMargins(0, 0, 0, 0)
+        self._grid.setSpacing(self.SPACING)
+        self._settle_timer = QtCore.QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.setInterval(SETTLE_MS)
+        self._settle_timer.timeout.connect(self._request)
+        self.setMinimumSize(400, 300)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+
+    @staticmethod
+    def grid_shape(count: int) -> Tuple[int, int]:
+        """count 张图像的网格 (列数, 行数)"""
+        columns = count if count <= 4 else math.ceil(math.sqrt(count))
+        return columns, math.ceil(count / max(columns, 1))
+
+    def tile_size(self, count: int) -> QtCore.QSize:
+        """count 张图像时每个格子的大小"""
+        columns, rows = self.grid_shape(max(count, 1))
+        width = (self.width() - self.SPACING * (columns - 1)) // columns
+        height = (self.height() - self.SPACING * (rows - 1)) // rows
+        return QtCore.QSize(max(width, 1), max(height, 1))
+
+    def keys_for(self, paths: Sequence[str]) -> List[ImageKey]:
+        """一组图像在当前布局下的缓存键(预取时使用)"""
+        size = self.tile_size(len(paths))
+        return [image_key(path, size) for path in paths]
+
+    def _layout(self, count: int):
+        """准备 count 个格子"""
+        while len(self.labels) < count:
+            self.labels.append(ImageLabel(min_size=(80, 60)))
+            self._shown.append(None)
+        for label in self.labels:
+            self._grid.removeWidget(label)
+        columns, _ = self.grid_shape(max(count, 1))
+        for i, label in enumerate(self.labels):
+            if i < count:
+                self._grid.addWidget(label, i // columns, i % columns)
+                label.show()
+            else:
+                label.hide()
+                label.setPixmap(QtGui.QPixmap())
+                self._shown[i] = None
+
+    def show_images(self, paths: Any):
+        """显示一组图像(路径列表, 或单张图像的路径字符串)"""
+        self.paths = image_paths(paths)
+        if not self.paths:
+            self.show_message("没有图像")
+            return
+        self._layout(len(self.paths))
+        self._request()
+
+    def show_message(self, text: str):
+        """不显示图像, 只显示一段文字"""
+        self.paths = []
+        self._keys = []
+        self.pipeline.request([])
+        self._layout(1)
+        self.labels[0].setPixmap(QtGui.QPixmap())
+        self.labels[0].setText(text)
+
+    def prefetch(self, path_groups: Iterable[Any]):
+        """预取附近数据的图像(按传入顺序的优先级), 每组为路径列表或单张图像的路径字符串"""
+        self.pipeline.prefetch(key for paths in path_groups for key in self.keys_for(image_paths(paths)))
+
+    def _request(self):
+        """按当前格子大小请求显示图像"""
+        if not self.paths:
+            return
+        self._keys = self.keys_for(self.paths)
+        for i, pixmap in enumerate(self.pipeline.request(self._keys)):
+            label = self.labels[i]
+            if pixmap is not None:
+                label.setPixmap(pixmap)
+            elif self._shown[i] != self.paths[i]:
+                # 新的图像尚未解码完成; 同一张图只是换了解码尺寸时继续显示旧的结果
+                label.setPixmap(QtGui.QPixmap())
+                label.setText("正在加载图像...")
+            self._shown[i] = self.paths[i] if pixmap is not None or self._shown[i] == self.paths[i] else None
+
+    def _on_image_ready(self, key: ImageKey, pixmap: QtGui.QPixmap):
+        """后台解码完成"""
+        for i, wanted in enumerate(self._keys):
+            if wanted != key:
+                continue
+            label = self.labels[i]
+            label.setPixmap(pixmap)
+            if pixmap.isNull():
+                label.setText(f"无法加载图像:\n{key[0]}")
+                self._shown[i] = None
+            else:
+                self._shown[i] = key[0]
+
+    def resizeEvent(self, event: QtGui.QResizeEvent):
+        """停止调整大小后按新的格子大小重新请求(尺寸取整后没有变化时直接命中缓存)"""
+        super().resizeEvent(event)
+        self._settle_timer.start()
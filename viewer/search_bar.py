@@ -0,0 +1,163 @@
+"""
+浏览器共用的筛选/搜索栏
+
+- SearchBar: 输入框 + 状态提示。检索索引(llm_toolkit.search_index)在后台线程中增量建立，
+  建立过程中也可以查询(只包含已索引的部分，状态栏会提示结果可能不完整)。
+- step_row: 在筛选结果中查找上一条/下一条数据。
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, List, Optional
+from PyQt5 import QtCore, QtWidgets
+
+from llm_toolkit.search_index import SearchIndex, search_fields
+
+SEARCH_PLACEHOLDER = "筛选 (Ctrl+F): error | error:429 | 挖掘机 | -挖掘机 | len>500 | id:abc, 多个条件用空格分隔, 回车执行, Esc 清除"
+
+
+def step_row(rows: List[int], current: int, direction: int) -> Optional[int]:
+    """在升序的行号列表中找到 current 之后(direction=1)或之前(direction=-1)的第一行, 不存在时返回None"""
+    if direction > 0:
+        i = bisect_right(rows, current)
+        return rows[i] if i < len(rows) else None
+    i = bisect_left(rows, current)
+    return rows[i - 1] if i > 0 else None
+
+
+class IndexBuilder(QtCore.QThread):
+    """
+    在后台线程中为数据建立检索索引
+    """
+    progress = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, index: SearchIndex, records: Any, fields: Callable = search_fields, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.index = index
+        self.records = records
+        self.fields = fields
+
+    def run(self):
+        self.index.update(self.records, self.fields,
+                          progress=self.progress.emit, should_stop=self.isInterruptionRequested)
+
+
+class SearchBar(QtWidgets.QWidget):
+    """
+    筛选栏: 回车后发出 filter_changed(行号列表), 清除筛选时发出 filter_changed(None)
+    """
+    filter_changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, index: SearchIndex, records: Any, fields: Callable = search_fields, parent: Optional[QtWidgets.QWidget] = None):
+        """
+        Args:
+            index (SearchIndex): 检索索引
+            records (Any): 支持 len() 与下标访问的数据列表
+            fields (Callable): 从一条数据中取出检索字段的函数, 见 search_index.search_fields
+        """
+        super().__init__(parent)
+        self.index = index
+        self.records = records
+        self.total = len(records)
+        self.indexed = index.indexed_rows
+        self.active_query: Optional[str] = None    # 当前生效的筛选语句
+
+        self.edit = QtWidgets.QLineEdit()
+        self.edit.setPlaceholderText(SEARCH_PLACEHOLDER)
+        self.edit.setClearButtonEnabled(True)
+        self.edit.returnPressed.connect(self.apply)
+        self.status = QtWidgets.QLabel()
+        self.status.setMinimumWidth(220)
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.edit, 1)
+        layout.addWidget(self.status)
+        self.edit.installEventFilter(self)
+
+        self.builder = IndexBuilder(index, records, fields, self)
+        self.builder.progress.connect(self._on_progress)
+        self.builder.finished.connect(self._on_index_finished)
+        self._show_index_status()
+        if self.indexed < self.total:
+            self.builder.start()
+
+    def eventFilter(self, obj: QtCore.QObject, event: QtCore.QEvent) -> bool:
+        """输入框中按 Esc 清除筛选"""
+        if obj is self.edit and event.type() == QtCore.QEvent.KeyPress and event.key() == QtCore.Qt.Key_Escape:
+            self.clear()
+            return True
+        return super().eventFilter(obj, event)
+
+    def _on_progress(self, indexed: int, total: int):
+        self.indexed = indexed
+        self._show_index_status()
+
+    def _on_index_finished(self):
+        if self.index.indexed_rows < len(self.records):
+            # 建立索引期间又追加了新数据
+            self.builder.start()
+        # 建立索引期间执行的筛选只包含了部分数据, 索引完成后重新筛选
+        if self.active_query is not None:
+            self.run_query(self.active_query)
+        else:
+            self._show_index_status()
+
+    def _show_index_status(self):
+        if self.indexed < self.total:
+            self.status.setText(f"索引中 {self.indexed}/{self.total}")
+        elif not self.edit.text().strip():
+            self.status.setText(f"已索引 {self.total} 条")
+
+    def records_appended(self):
+        """数据列表追加了新数据(跟随模式): 为新数据建立索引, 完成后重新执行当前的筛选"""
+        self.total = len(self.records)
+        self._show_index_status()
+        if not self.builder.isRunning():
+            self.builder.start()
+
+    def records_updated(self, rows: List[int]):
+        """已有的数据内容有变化(例如对比时另一个文件的结果到达): 重新索引这些行并重新执行当前的筛选"""
+        if self.index.reindex(rows, self.records, self.builder.fields) and self.active_query is not None:
+            self.run_query(self.active_query)
+
+    def records_reset(self):
+        """数据列表被重建(文件被截断或改写): 清空索引后重新建立"""
+        self.builder.requestInterruption()
+        self.builder.wait()
+        self.index.reset()
+        self.indexed = 0
+        self.records_appended()
+
+    def focus(self):
+        self.edit.setFocus()
+        self.edit.selectAll()
+
+    def apply(self):
+        """执行筛选"""
+        query = self.edit.text().strip()
+        if not query:
+            self.clear()
+            return
+        self.run_query(query)
+
+    def run_query(self, query: str):
+        """执行筛选语句并发出结果"""
+        self.active_query = query
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        rows = self.index.query(query)
+        note = f" (仅已索引的 {self.indexed} 条)" if self.indexed < self.total else ""
+        self.status.setText(f"{len(rows)} 条匹配, {timer.elapsed()} ms{note}")
+        self.filter_changed.emit(rows)
+
+    def clear(self):
+        """清除筛选"""
+        self.edit.clear()
+        self.active_query = None
+        self._show_index_status()
+        self.filter_changed.emit(None)
+
+    def shutdown(self):
+        """停止建立索引(当前批次完成后)并关闭索引"""
+        self.builder.finished.disconnect(self._on_index_finished)
+        self.builder.requestInterruption()
+        self.builder.wait()
+        self.index.close()
@@ -0,0 +1,272 @@
+"""
+缩略图网格浏览
+
+- ThumbnailGrid: 基于 QListView(图标模式) + 自定义模型的缩略图网格，只有可见的格子才会被绘制、才会请求缩略图，
+  数十万条数据也能流畅滚动。
+- 缩略图在后台线程中按缩略图尺寸解码生成，并保存到磁盘缓存(默认 ~/.cache/myllm/thumbnails)。
+  缓存文件名由图像的绝对路径、文件大小、修改时间与缩略图尺寸哈希得到，图像被修改后自动失效；
+  再次打开同一数据集时直接读取缓存的缩略图，无需重新解码原图。
+- 快速滚动时，新请求的缩略图优先生成，已经滚出视野、尚未开始生成的请求会被撤回。
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from image_pipeline import PixmapCache, decode_image, image_paths
+
+# 缩略图边长(像素)
+THUMBNAIL_SIZE = 160
+# 缩略图磁盘缓存的默认位置
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'myllm', 'thumbnails')
+# 内存中缓存的缩略图总大小(字节)
+MEMORY_CACHE_BYTES = 128 * 1024 * 1024
+# 排队中的缩略图请求上限, 超出时撤回最早的请求(已经滚出视野)
+MAX_PENDING = 256
+
+
+class ThumbnailDiskCache:
+    """
+    缩略图的磁盘缓存
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, size: int = THUMBNAIL_SIZE):
+        """
+        Args:
+            cache_dir (str): 缓存文件夹
+            size (int): 缩略图边长(像素)
+        """
+        self.cache_dir = cache_dir
+        self.size = size
+
+    def cache_path(self, image_path: str) -> Optional[str]:
+        """缩略图缓存文件的路径, 原图不存在时返回None"""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.size}"
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg")
+
+    def load(self, image_path: str) -> QtGui.QImage:
+        """读取缩略图(可在后台线程中调用): 命中缓存时直接读取, 否则从原图生成并写入缓存; 失败时返回空 QImage"""
+        cache_path = self.cache_path(image_path)
+        if cache_path is None:
+            return QtGui.QImage()
+        if os.path.exists(cache_path):
+            thumbnail = QtGui.QImage(cache_path)
+            if not thumbnail.isNull():
+                return thumbnail
+
+        thumbnail = decode_image(image_path, QtCore.QSize(self.size, self.size))
+        if thumbnail.isNull():
+            return thumbnail
+        if thumbnail.width() > self.size or thumbnail.height() > self.size:
+            # 原图格式不支持按尺寸解码时(例如 PNG), 解码后再缩小
+            thumbnail = thumbnail.scaled(self.size, self.size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if thumbnail.save(tmp_path, 'JPG', 85):
+                os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"警告: 无法写入缩略图缓存 {cache_path}: {e}")
+        return thumbnail
+
+
+class _ThumbnailTask(QtCore.QRunnable):
+    """
+    在线程池中读取或生成一张缩略图
+    """
+    def __init__(self, loader: 'ThumbnailLoader', image_path: str):
+        super().__init__()
+        self.loader = loader
+        self.image_path = image_path
+        self.started = False
+
+    def run(self):
+        self.started = True
+        self.loader._loaded.emit(self.image_path, self.loader.disk_cache.load(self.image_path))
+
+
+class ThumbnailLoader(QtCore.QObject):
+    """
+    后台读取/生成缩略图, 并在内存中缓存最近使用的缩略图
+    """
+    thumbnail_ready = QtCore.pyqtSignal(str)
+    _loaded = QtCore.pyqtSignal(str, QtGui.QImage)
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None, disk_cache: Optional[ThumbnailDiskCache] = None):
+        super().__init__(parent)
+        self.disk_cache = disk_cache or ThumbnailDiskCache()
+        self.memory_cache = PixmapCache(MEMORY_CACHE_BYTES)
+        self.failed: Set[str] = set()
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, min(4, QtCore.QThread.idealThreadCount())))
+        self._pending: 'OrderedDict[str, _ThumbnailTask]' = OrderedDict()
+        self._sequence = 0
+        self._loaded.connect(self._on_loaded)
+
+    def get(self, image_path: str) -> Optional[QtGui.QPixmap]:
+        """内存中已有的缩略图"""
+        return self.memory_cache.get(image_path)
+
+    def request(self, image_path: str):
+        """请求生成缩略图, 越晚请求的越先生成(当前可见的格子优先)"""
+        if image_path in self._pending:
+            self._pending.move_to_end(image_path)
+            return
+        self._sequence += 1
+        task = _ThumbnailTask(self, image_path)
+        self._pending[image_path] = task
+        self.pool.start(task, self._sequence)
+
+        # 撤回最早的、尚未开始的请求
+        while len(self._pending) > MAX_PENDING:
+            oldest_path, oldest = next(iter(self._pending.items()))
+            if not oldest.started and self.pool.tryTake(oldest):
+                del self._pending[oldest_path]
+            else:
+                self._pending.move_to_end(oldest_path)
+                break
+
+    def _on_loaded(self, image_path: str, thumbnail: QtGui.QImage):
+        self._pending.pop(image_path, None)
+        if thumbnail.isNull():
+            self.failed.add(image_path)
+        else:
+            self.memory_cache.put(image_path, QtGui.QPixmap.fromImage(thumbnail))
+        self.thumbnail_ready.emit(image_path)
+
+    def shutdown(self):
+        self.pool.clear()
+        self._pending.clear()
+        self.pool.waitForDone()
+
+
+class RecordGridModel(QtCore.QAbstractListModel):
+    """
+    数据列表的模型: 每条数据显示其第一张图像的缩略图与序号/id。
+    只有视图实际绘制的行才会被访问, 数据按需解析(配合 LineIndex 使用)。
+    """
+    INFO_CACHE_SIZE = 4096
+
+    def __init__(self, records: Any, loader: ThumbnailLoader, parent: Optional[QtCore.QObject] = None):
+        """
+        Args:
+            records (Any): 支持 len() 与下标访问的数据列表(list 或 LineIndex)
+            loader (ThumbnailLoader): 缩略图加载器
+        """
+        super().__init__(parent)
+        self.records = records
+        self.row_count = len(records)       # 视图已知的行数, 数据追加后由 sync_rows 通知视图
+        self.loader = loader
+        self.loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+        self._info: 'OrderedDict[int, Tuple[str, Optional[str]]]' = OrderedDict()
+        self._rows_by_path: Dict[str, Set[int]] = {}
+        size = loader.disk_cache.size
+        self._placeholder = QtGui.QPixmap(size, size)
+        self._placeholder.fill(QtGui.QColor('#3A3A3A'))
+        self._error_icon = QtWidgets.QApplication.style().standardIcon(QtWidgets.QStyle.SP_MessageBoxWarning)
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.row_count
+
+    def sync_rows(self):
+        """数据列表增长(跟随模式下文件追加了新数据)或被重建后通知视图"""
+        count = len(self.records)
+        if count > self.row_count:
+            self.beginInsertRows(QtCore.QModelIndex(), self.row_count, count - 1)
+            self.row_count = count
+            self.endInsertRows()
+        elif count < self.row_count:
+            self.beginResetModel()
+            self.row_count = count
+            self._info.clear()
+            self._rows_by_path.clear()
+            self.endResetModel()
+
+    def record_info(self, row: int) -> Tuple[str, Optional[str]]:
+        """第 row 条数据的 (id, 第一张图像路径)"""
+        info = self._info.get(row)
+        if info is None:
+            try:
+                record = self.records[row]
+                images = image_paths(record.get('image')) or [None]
+                info = (str(record.get('id')), images[0])
+            except (ValueError, AttributeError, TypeError):
+                info = ("<无法解析>", None)
+            self._info[row] = info
+            if len(self._info) > self.INFO_CACHE_SIZE:
+                self._info.popitem(last=False)
+        return info
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        sample_id, image_path = self.record_info(row)
+        if role == QtCore.Qt.DisplayRole:
+            return f"{row + 1}. {sample_id}"
+        if role == QtCore.Qt.ToolTipRole:
+            return f"#{row + 1} {sample_id}\n{image_path}"
+        if role == QtCore.Qt.DecorationRole:
+            if image_path is None or image_path in self.loader.failed:
+                return self._error_icon
+            pixmap = self.loader.get(image_path)
+            if pixmap is not None:
+                return pixmap
+            self._rows_by_path.setdefault(image_path, set()).add(row)
+            self.loader.request(image_path)
+            return self._placeholder
+        return None
+
+    def _on_thumbnail_ready(self, image_path: str):
+        for row in self._rows_by_path.pop(image_path, ()):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+
+class ThumbnailGrid(QtWidgets.QListView):
+    """
+    缩略图网格视图, 双击或回车打开对应的数据
+    """
+    record_activated = QtCore.pyqtSignal(int)
+
+    def __init__(self, records: Any, parent: Optional[QtWidgets.QWidget] = None, cache_dir: str = DEFAULT_CACHE_DIR,
+                 thumbnail_size: int = THUMBNAIL_SIZE):
+        super().__init__(parent)
+        self.loader = ThumbnailLoader(self, ThumbnailDiskCache(cache_dir, thumbnail_size))
+        self.setModel(RecordGridModel(records, self.loader, self))
+        self.setViewMode(QtWidgets.QListView.IconMode)
+        self.setMovement(QtWidgets.QListView.Static)
+        self.setResizeMode(QtWidgets.QListView.Adjust)
+        self.setUniformItemSizes(True)      # 所有格子等大, 视图无需逐行计算尺寸
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setIconSize(QtCore.QSize(thumbnail_size, thumbnail_size))
+        self.setGridSize(QtCore.QSize(thumbnail_size + 24, thumbnail_size + 40))
+        self.setTextElideMode(QtCore.Qt.ElideMiddle)
+        self.setWordWrap(False)
+        self.activated.connect(lambda index: self.record_activated.emit(index.row()))
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        """T / Esc 交给浏览器窗口处理(返回单条浏览), 不作为列表的键盘搜索"""
+        if event.key() in (QtCore.Qt.Key_T, QtCore.Qt.Key_Escape):
+            event.ignore()
+            return
+        super().keyPressEvent(event)
+
+    def select_row(self, row: int):
+        """选中并滚动到第 row 条数据"""
+        index = self.model().index(row)
+        self.setCurrentIndex(index)
+        self.scrollTo(index, QtWidgets.QAbstractItemView.PositionAtCenter)
+
+    def sync_rows(self):
+        """数据列表变化后更新网格"""
+        self.model().sync_rows()
+
+    def shutdown(self):
+        self.loader.shutdown()